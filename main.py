@@ -1,108 +1,419 @@
+import os
+import sys
 import curses
-import threading
 import queue
+import selectors
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import keyboard  # For global key state monitoring
 
-# Global flag for Ctrl key state
-ctrl_key_pressed = False
+from src.llm.local_llm_driver import LocalLLMDriver
+from src.llm.logging_llm_driver import LoggingLLMDriver
+from src.llm.cached_llm_driver import CachedLLMDriver
+from src.llm.ollama_llm_driver import OllamaLLMDriver
+from src.llm.llm_driver_pool import LLMDriverPool
+from src.tool_chooser import ToolChooser
+from src.context_store import get_default_context_store
+from src.tool.tool_classifier import ToolClassifier
+from src.tool.embedding_router import EmbeddingRouter
+from src.tool.tool_registry import get_default_registry
+from src.tool.tool_watcher import ToolWatcher
+from src.tool.tool_result_cache import get_default_result_cache
+from src.tracing import get_tracer, JsonlSink, RingBufferSink, format_span
+from src.speech.tts_engine import get_tts_engine
+from src.speech.speaker import Speaker, COMMON_PHRASES, tool_phrases
+
+MODEL_FILE = "./src/llm/models/capybarahermes-2.5-mistral-7b.Q4_K_M.gguf"
+# Set to a file path to also write every tracing span to it as JSON lines
+TRACE_FILE = os.getenv("JONE_TRACE_FILE")
+# Set to log the LLM's decisions, to train the tool classifier on (python -m src.tool.tool_classifier)
+LOG_DECISIONS = os.getenv("JONE_LOG_DECISIONS")
+# Set to 0 to stop caching the LLM's decisions and rewrites (see CachedLLMDriver)
+RESPONSE_CACHE = os.getenv("JONE_RESPONSE_CACHE", "1") != "0"
+# Set to speak the responses: "auto", or a TTS engine (say, piper, stub)
+SPEAK = os.getenv("JONE_SPEAK")
+# Set to have the LLM rewrite templated responses in the background, replacing them when done
+REFINE_RESPONSES = os.getenv("JONE_REFINE_RESPONSES")
+# Comma separated Ollama URLs serving the same model, pooled with the local model (see LLMDriverPool)
+OLLAMA_URLS = os.getenv("JONE_OLLAMA_URLS")
+OLLAMA_MODEL = os.getenv("JONE_OLLAMA_MODEL", "openhermes")
+# Set to route queries by embedding similarity when the tool classifier isn't trained (see EmbeddingRouter)
+EMBEDDING_ROUTER = os.getenv("JONE_EMBEDDING_ROUTER")
+
+class Pane:
+    """
+    A boxed window with a title and scrolling lines of text.
+    It is only redrawn when its text changed (damage tracking).
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.lines = [""]
+        self.status = ""
+        self.status_attr = curses.A_NORMAL
+        self.win = None
+        self.dirty = True
+
+    def set_window(self, win):
+        self.win = win
+        self.dirty = True
+
+    def write(self, text):
+        """
+        Appends text, which may continue the current line (streamed tokens).
+        """
+        parts = text.split("\n")
+        self.lines[-1] += parts[0]
+        self.lines.extend(parts[1:])
+        del self.lines[:-500]
+        self.dirty = True
+
+    def replace(self, old, new):
+        """
+        Replaces the last occurrence of `old` in the text.
+        """
+        text = "\n".join(self.lines)
+        position = text.rfind(old)
+        if position < 0:
+            return
+        self.lines = (text[:position] + new + text[position + len(old):]).split("\n")
+        self.dirty = True
+
+    def set_status(self, status, attr=curses.A_NORMAL):
+        if (status, attr) != (self.status, self.status_attr):
+            self.status, self.status_attr = status, attr
+            self.dirty = True
+
+    def render(self):
+        if not self.dirty or self.win is None:
+            return
+        height, width = self.win.getmaxyx()
+        self.win.erase()
+        self.win.box()
+        self.win.addnstr(1, 1, self.title, width - 2)
+        if self.status:
+            self.win.addnstr(1, min(len(self.title) + 3, width - 2), self.status, max(0, width - len(self.title) - 5), self.status_attr)
+        # Wrap the lines to the window and show the last ones that fit
+        wrapped = []
+        for line in self.lines:
+            wrapped += [line[i:i + width - 2] for i in range(0, max(len(line), 1), width - 2)]
+        visible = wrapped[-(height - 3):] if height > 3 else []
+        for row, line in enumerate(visible):
+            self.win.addnstr(2 + row, 1, line, width - 2)
+        self.win.noutrefresh()
+        self.dirty = False
+
+class InputPane(Pane):
+    def __init__(self):
+        super().__init__("Input: ")
+        self.text = ""
+        self.prompt = ""
+
+    def render(self):
+        if not self.dirty or self.win is None:
+            return
+        height, width = self.win.getmaxyx()
+        self.win.erase()
+        self.win.box()
+        self.win.addnstr(1, 1, (self.prompt or self.title) + self.text, width - 2)
+        self.win.noutrefresh()
+        self.dirty = False
+
+class UI:
+    """
+    Event driven curses UI.
+
+    The main thread sleeps in a selector until the keyboard has input or
+    another thread posts an event (the model finished loading, a tool printed
+    a line, the LLM produced a sentence...). Posting writes a byte to a pipe
+    the selector watches, so nothing polls, and after handling events only the
+    panes whose content changed are redrawn.
+    """
+
+    def __init__(self, stdscr, llm_driver, router=None, context_store=None, speaker=None):
+        self.stdscr = stdscr
+        self.llm_driver = llm_driver
+        self.router = router
+        self.speaker = speaker
+        # Facts about what the user is working on and the conversation so far
+        self.context_store = context_store or get_default_context_store(llm_driver)
+        self.events = queue.Queue()
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sys.stdin, selectors.EVENT_READ, "keyboard")
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, "wakeup")
+
+        self.thoughts = Pane("Thoughts")
+        self.command_output = Pane("Command Output")
+        # The latest tracing spans: where the time of the last queries went
+        self.trace = Pane("Trace")
+        self.trace_spans = get_tracer().add_sink(RingBufferSink(size=100, on_span=lambda span: self.post("span")))
+        self.input = InputPane()
+        self.panes = [self.thoughts, self.command_output, self.trace, self.input]
+        self.setup_windows()
+
+        # Questions from tools waiting for an answer typed by the user
+        self.answers = queue.Queue()
+        self.pending_questions = 0
+        self.workers = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query")
+        # Background rewrites of templated responses, so they never hold up a query
+        self.refiner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+        self.running = True
+
+    def setup_windows(self):
+        curses.curs_set(0)  # Hide cursor
+        self.stdscr.nodelay(True)
+        self.stdscr.keypad(True)
+        height, width = self.stdscr.getmaxyx()
+
+        # Calculate window sizes and positions
+        thoughts_height = int(height * 0.3)
+        trace_height = 8 if height >= 30 else 0  # Only on screens with room for it
+        command_output_height = height - thoughts_height - trace_height - 3  # Leave space for input
+        input_height = 3
+
+        self.thoughts.set_window(curses.newwin(thoughts_height, width, 0, 0))
+        self.command_output.set_window(curses.newwin(command_output_height, width, thoughts_height, 0))
+        self.trace.set_window(curses.newwin(trace_height, width, thoughts_height + command_output_height, 0) if trace_height else None)
+        self.input.set_window(curses.newwin(input_height, width, thoughts_height + command_output_height + trace_height, 0))
+        self.stdscr.noutrefresh()
+
+    def post(self, kind, payload=None):
+        """
+        Queues an event for the UI thread. Safe to call from any thread.
+        """
+        self.events.put((kind, payload))
+        os.write(self.wakeup_write, b"x")
 
-def monitor_ctrl_key():
-    global ctrl_key_pressed
+    def run(self):
+        self.render()
+        while self.running:
+            for key, _ in self.selector.select():
+                if key.data == "keyboard":
+                    self.read_keys()
+                else:
+                    try:
+                        os.read(self.wakeup_read, 4096)
+                    except BlockingIOError:
+                        pass
+            self.handle_events()
+            self.render()
+        get_tracer().remove_sink(self.trace_spans)
+        self.workers.shutdown(wait=False, cancel_futures=True)
+        self.refiner.shutdown(wait=False, cancel_futures=True)
+        if self.speaker is not None:
+            self.speaker.close()
+
+    def render(self):
+        for pane in self.panes:
+            pane.render()
+        curses.doupdate()
+
+    def read_keys(self):
+        while True:
+            char = self.stdscr.getch()
+            if char == -1:
+                return
+            if char == curses.KEY_RESIZE:
+                curses.update_lines_cols()
+                self.stdscr.clear()
+                self.setup_windows()
+            elif char in (ord('\n'), curses.KEY_ENTER):  # Enter key
+                self.submit(self.input.text)
+                self.input.text = ""
+            elif char == curses.KEY_F2 and self.speaker is not None:  # F2 toggles speaking
+                self.command_output.set_status("" if self.speaker.toggle() else "(speech off)")
+            elif char == 27:  # ESC key to exit
+                self.running = False
+                return
+            elif char in (127, curses.KEY_BACKSPACE):  # Backspace handling
+                self.input.text = self.input.text[:-1]
+            elif 0 <= char < 256:
+                self.input.text += chr(char)
+            self.input.dirty = True
+
+    def handle_events(self):
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "ctrl":
+                if payload:
+                    self.thoughts.set_status("Ctrl key is pressed!", curses.A_REVERSE)
+                else:
+                    self.thoughts.set_status("")
+            elif kind == "model":
+                self.command_output.set_status(payload)
+            elif kind == "thought":
+                self.thoughts.write(payload)
+            elif kind == "replace_thought":
+                self.thoughts.replace(*payload)
+            elif kind == "output":
+                self.command_output.write(payload)
+            elif kind == "span":
+                self.trace.lines = [format_span(span) for span in self.trace_spans.spans()[-20:]] or [""]
+                self.trace.dirty = True
+            elif kind == "question":
+                self.pending_questions += 1
+                self.input.prompt = payload + " "
+                self.input.dirty = True
+
+    def submit(self, text):
+        if self.pending_questions:
+            # The answer to a tool's question
+            self.pending_questions -= 1
+            self.input.prompt = ""
+            self.answers.put(text)
+            return
+        if not text.strip():
+            return
+        self.command_output.write(f"\nYou said: {text}\n")
+        self.workers.submit(self.process_query, text)
+
+    def say(self, text):
+        if self.speaker is not None:
+            self.speaker.say(text)
+
+    def ask(self, prompt):
+        """
+        Asks the user a question from a worker thread and waits for the answer.
+        """
+        self.post("question", prompt)
+        return self.answers.get()
+
+    def process_query(self, query):
+        try:
+            if not self.llm_driver.ready:
+                self.post("thought", "\nStill loading the model, I'll get to it in a moment...")
+            tool_chooser = ToolChooser(query, self.context_store, self.llm_driver, is_called_by_voice=False, router=self.router, get_user_input=self.ask)
+            tool = tool_chooser.choose_tool()
+            if not tool:
+                self.post("thought", "\nI couldn't find a tool for that.")
+                self.say("I couldn't find a tool for that.")
+                return
+            tool_chooser.configure_tool(tool)
+            if tool.acknowledgement:
+                self.say(tool.acknowledgement)
+            runner = tool_chooser.execute_tool_in_background(tool, on_output=lambda line: self.post("output", line))
+            output = runner.output
+            self.post("thought", "\n")
+            context = self.context_store.render('personality')
+            response = tool.render_response(output)
+            if response is not None:
+                # Formulaic output gets its template straight away, without an LLM round
+                self.post("thought", response)
+                self.say(response)
+                self.context_store.add_turn(query, response)
+                if REFINE_RESPONSES:
+                    self.refiner.submit(self.refine_response, tool_chooser.driver_for(tool), response, output, query, context)
+                return
+            response = []
+            # Tools that opted out of caching don't get a cached rewrite either
+            chunks = tool_chooser.driver_for(tool).personality_stream(output, query, context)
+            if self.speaker is not None:
+                # Each sentence is rendered and spoken as soon as it is complete
+                chunks = self.speaker.speak_stream(chunks)
+            for chunk in chunks:
+                response.append(chunk)
+                self.post("thought", chunk)
+            self.context_store.add_turn(query, "".join(response))
+        except Exception as e:
+            self.post("thought", f"\nSomething went wrong: {e}")
+            self.say("Something went wrong.")
+
+    def refine_response(self, llm_driver, template_response, output, query, context):
+        """
+        Has the LLM rewrite a templated response and swaps it in when it is done.
+        """
+        try:
+            response = llm_driver.personality(output, query, context)
+            if response and response.strip():
+                self.post("replace_thought", (template_response, response.strip()))
+        except Exception as e:
+            self.post("thought", f"\nCould not rewrite the response: {e}")
+
+    def watch_model(self):
+        self.post("model", "(loading model...)")
+        try:
+            self.llm_driver.handle.get()
+            self.post("model", "")
+        except Exception as e:
+            self.post("model", f"(could not load the model: {e})")
+
+def monitor_ctrl_key(ui):
     def on_press(event):
-        global ctrl_key_pressed
         if event.name == 'ctrl':
-            ctrl_key_pressed = True
+            ui.post("ctrl", True)
 
     def on_release(event):
-        global ctrl_key_pressed
         if event.name == 'ctrl':
-            ctrl_key_pressed = False
+            ui.post("ctrl", False)
 
     # Listen for press and release events
     keyboard.on_press(on_press)
     keyboard.on_release(on_release)
 
-def setup_windows(stdscr):
-    curses.curs_set(0)  # Hide cursor
-    height, width = stdscr.getmaxyx()
-
-    # Calculate window sizes and positions
-    thoughts_height = int(height * 0.3)
-    command_output_height = height - thoughts_height - 3  # Leave space for input
-    input_height = 3
-
-    # Create windows
-    thoughts_win = curses.newwin(thoughts_height, width, 0, 0)
-    command_output_win = curses.newwin(command_output_height, width, thoughts_height, 0)
-    input_win = curses.newwin(input_height, width, thoughts_height + command_output_height, 0)
-
-    thoughts_win.box()
-    command_output_win.box()
-    input_win.box()
-
-    thoughts_win.addstr(1, 1, "Thoughts")
-    command_output_win.addstr(1, 1, "Command Output")
-    input_win.addstr(1, 1, "Input: ")
-
-    thoughts_win.refresh()
-    command_output_win.refresh()
-    input_win.refresh()
-
-    return thoughts_win, command_output_win, input_win
-
-def text_input_handler(input_win, q):
-    # Make getch non-blocking
-    input_win.nodelay(True)
-
-    input_str = ""
-    while True:
-        char = input_win.getch()
-        if char == ord('\n'):  # Enter key
-            q.put(input_str)  # Simulate processing input or commands
-            input_str = ""
-        elif char == 27:  # ESC key to exit
-            break
-        elif char != -1:  # Valid character input
-            if char == 127 or char == curses.KEY_BACKSPACE:  # Backspace handling
-                input_str = input_str[:-1]
-            else:
-                input_str += chr(char)
-            input_win.clear()
-            input_win.box()
-            input_win.addstr(1, 1, "Input: " + input_str)
-            input_win.refresh()
-
 def main(stdscr):
-    # Setup windows
-    thoughts_win, command_output_win, input_win = setup_windows(stdscr)
-
-    # Create a queue for inter-thread communication
-    q = queue.Queue()
-
-    # Start text input handler in a separate thread
-    input_thread = threading.Thread(target=text_input_handler, args=(input_win, q), daemon=True)
-    input_thread.start()
-
-    # Main loop: Display thoughts or command output
-    while True:
-        # Update thoughts window with Ctrl key state
-        if ctrl_key_pressed:
-            thoughts_win.addstr(2, 1, "Ctrl key is pressed!       ", curses.A_REVERSE)
-        else:
-            thoughts_win.addstr(2, 1, "Ctrl key is not pressed!   ")
-        thoughts_win.refresh()
-
-        # Check if there's something new in the queue
-        try:
-            input_text = q.get_nowait()
-            command_output_win.addstr(2, 1, "You said: " + input_text + " " * (width - len(input_text) - 12), curses.A_BOLD)
-            command_output_win.refresh()
-        except queue.Empty:
-            pass
-        curses.napms(50)  # Sleep briefly to reduce CPU usage
-
-ctrl_monitor_thread = threading.Thread(target=monitor_ctrl_key, daemon=True)
-ctrl_monitor_thread.start()
+    if TRACE_FILE:
+        get_tracer().add_sink(JsonlSink(TRACE_FILE))
+
+    # Start loading the model in the background so the UI is usable straight away
+    local_driver = LocalLLMDriver(MODEL_FILE, background=True)
+    drivers = [local_driver]
+    llm_driver = local_driver
+    if OLLAMA_URLS:
+        # Ollama answers while the local model loads, and takes over when it is busy or slow
+        drivers += [OllamaLLMDriver(url.strip(), model=OLLAMA_MODEL) for url in OLLAMA_URLS.split(',')]
+        llm_driver = LLMDriverPool(drivers)
+    if RESPONSE_CACHE:
+        # Repeated requests ("clear the caches") skip the LLM
+        llm_driver = CachedLLMDriver(llm_driver)
+    if LOG_DECISIONS:
+        llm_driver = LoggingLLMDriver(llm_driver)
+    # Once trained, the classifier picks the tool for most queries without the LLM
+    router = ToolClassifier(get_default_registry())
+    embedding_router = None
+    if not router.load():
+        router = None
+        if EMBEDDING_ROUTER:
+            # The local driver has the embedding model
+            router = embedding_router = EmbeddingRouter(get_default_registry(), local_driver)
+    speaker = None
+    if SPEAK:
+        speaker = Speaker(get_tts_engine(None if SPEAK == "auto" else SPEAK), on_error=lambda message: ui.post("output", f"\n{message}\n"))
+    ui = UI(stdscr, llm_driver, router=router, context_store=get_default_context_store(llm_driver), speaker=speaker)
+    if speaker is not None:
+        # Acknowledgements should play without waiting for the TTS
+        speaker.prerender(COMMON_PHRASES + tool_phrases(get_default_registry()))
+
+    # Pick up new and edited tools without a restart
+    def on_tools_changed(changed):
+        # Signatures and the KV state of prompts that listed the old tools are stale
+        for driver in drivers:
+            driver.signatures.clear()
+        if local_driver.ready and local_driver.prefix_cache is not None:
+            with local_driver.lock:
+                local_driver.prefix_cache.clear()
+        # So are the memoized outputs of the old versions
+        get_default_result_cache().clear()
+        if embedding_router is not None:
+            # Only the new and edited tools are embedded
+            try:
+                embedding_router.build()
+            except Exception as e:
+                ui.post("output", f"\nCould not embed the tools: {e}\n")
+        ui.post("output", f"\nReloaded tools: {', '.join(os.path.basename(path) for path in changed)}\n")
+
+    watcher = ToolWatcher(get_default_registry())
+    watcher.subscribe(on_tools_changed)
+    watcher.start()
+
+    threading.Thread(target=ui.watch_model, daemon=True).start()
+    threading.Thread(target=monitor_ctrl_key, args=(ui,), daemon=True).start()
+
+    ui.run()
 
 if __name__ == "__main__":
     curses.wrapper(main)
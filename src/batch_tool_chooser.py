@@ -0,0 +1,159 @@
+from .tool_chooser import ToolChooser
+from .tool.tool_registry import get_default_registry
+from .tool.tool_signature import ToolSignatures
+from .llm.cached_llm_driver import normalize_query
+from .tracing import get_tracer
+
+class BatchToolChooser:
+    """
+    Chooses and configures tools for many (query, context) pairs at once,
+    e.g. transcript segments or buffered voice commands.
+
+    Identical requests (same normalized query and context) are decided once.
+    Each stage is sent to the driver as one batch (see LLMDriver.batch): all
+    the toolset decisions, then all the tool decisions, then all the argument
+    decisions. Results come back in the order of the requests.
+
+    How much a batch saves depends on the driver: Ollama decodes the calls in
+    parallel (up to OLLAMA_NUM_PARALLEL), the local driver generates them one
+    after the other and only shares the static prompt prefixes.
+    """
+
+    def __init__(self, requests, llm_driver, is_called_by_voice=False, debug=False, registry=None, router=None, signatures=None, prompt_token_budget=1024, get_user_input=None):
+        # requests: list of (query, context)
+        self.requests = list(requests)
+        self.llm_driver = llm_driver
+        self.is_called_by_voice = is_called_by_voice
+        self.debug = debug
+        self.registry = registry or get_default_registry()
+        self.router = router
+        self.signatures = signatures or getattr(llm_driver, 'signatures', None) or ToolSignatures(count_tokens=llm_driver.count_tokens)
+        self.prompt_token_budget = prompt_token_budget
+        self.get_user_input = get_user_input
+
+        # One ToolChooser per distinct request, sharing the registry and signatures
+        self.choosers = []
+        self.chooser_index = []  # request index -> index in self.choosers
+        seen = {}
+        for query, context in self.requests:
+            key = (normalize_query(query), str(context or ''))
+            if key not in seen:
+                seen[key] = len(self.choosers)
+                self.choosers.append(ToolChooser(
+                    query,
+                    context,
+                    llm_driver,
+                    is_called_by_voice,
+                    debug=debug,
+                    registry=self.registry,
+                    router=router,
+                    signatures=self.signatures,
+                    prompt_token_budget=prompt_token_budget,
+                    get_user_input=get_user_input,
+                ))
+            self.chooser_index.append(seen[key])
+
+    def decide_tools(self):
+        """
+        Returns the chosen (toolset, tool class name) for each distinct request,
+        (None, None) where no tool fits.
+        """
+        tracer = get_tracer()
+        decisions = [(None, None)] * len(self.choosers)
+
+        # The pre-router can settle some requests without the LLM
+        pending = []
+        for index, chooser in enumerate(self.choosers):
+            tool = chooser.route_tool()
+            if tool is not None:
+                record = self.registry.get_tool(tool.__class__.__name__)
+                decisions[index] = (record['toolset'], record['class_name'])
+            else:
+                pending.append(index)
+        if not pending:
+            return decisions
+
+        toolsets = self.registry.find_toolsets()
+        if(self.debug):
+            print(f"deciding {len(pending)} toolsets...")
+        with tracer.span("batch_decide_toolset", requests=len(pending)):
+            chosen_toolsets = self.llm_driver.batch('decide_toolset', [
+                (toolsets, self.choosers[index].query, self.choosers[index].context_for('toolset')) for index in pending
+            ])
+
+        pending = [(index, toolset) for index, toolset in zip(pending, chosen_toolsets) if toolset]
+        for _, toolset in pending:
+            ToolChooser.toolset_counts[toolset] += 1
+        if(self.debug):
+            print(f"deciding {len(pending)} tools...")
+        with tracer.span("batch_decide_tool", requests=len(pending)):
+            tool_class_names = self.llm_driver.batch('decide_tool', [
+                (self.choosers[index].get_toolset_signatures(toolset), self.choosers[index].query, self.choosers[index].context_for('tool'))
+                for index, toolset in pending
+            ])
+
+        for (index, toolset), tool_class_name in zip(pending, tool_class_names):
+            if tool_class_name:
+                decisions[index] = (toolset, tool_class_name)
+        return decisions
+
+    def decide_arguments(self, tools):
+        """
+        Fills in the arguments of the distinct requests' tools, batched per driver
+        (tools that opted out of caching go to the uncached driver).
+        """
+        by_driver = {}
+        for index, tool in enumerate(tools):
+            if tool is not None:
+                driver = self.choosers[index].driver_for(tool)
+                by_driver.setdefault(id(driver), (driver, []))[1].append(index)
+
+        for driver, indexes in by_driver.values():
+            if(self.debug):
+                print(f"deciding {len(indexes)} sets of arguments...")
+            with get_tracer().span("batch_decide_arguments", requests=len(indexes)):
+                argument_values = driver.batch('decide_arguments', [
+                    (self.choosers[index].get_tool_signature(tools[index].__class__.__name__), self.choosers[index].query, self.choosers[index].context_for('arguments'))
+                    for index in indexes
+                ])
+            for index, values in zip(indexes, argument_values):
+                # Arguments the LLM couldn't fill in stay None, the ToolRunner asks for them
+                if values:
+                    tools[index].argument_values.update({name: value for name, value in values.items() if name in tools[index].arguments})
+
+    def choose_and_configure_tools(self):
+        """
+        Returns a configured tool (or None) per request, in order.
+        Duplicate requests get their own tool instances with the same arguments.
+        """
+        with get_tracer().span("batch_choose_tools", requests=len(self.requests), distinct=len(self.choosers)):
+            decisions = self.decide_tools()
+            tools = [self.registry.create_tool(tool_class_name, toolset) if tool_class_name else None for toolset, tool_class_name in decisions]
+            self.decide_arguments(tools)
+
+        results = []
+        used = set()
+        for index in self.chooser_index:
+            tool = tools[index]
+            if tool is not None and index in used:
+                toolset, tool_class_name = decisions[index]
+                copy = self.registry.create_tool(tool_class_name, toolset)
+                copy.argument_values.update(tool.argument_values)
+                tool = copy
+            used.add(index)
+            results.append(tool)
+        return results
+
+    def choose_and_run(self):
+        """
+        Chooses tools for every request, then runs them one after the other
+        in request order (tools have side effects, so they aren't deduplicated).
+        Returns the outputs, None where no tool was found.
+        """
+        outputs = []
+        for request_index, tool in enumerate(self.choose_and_configure_tools()):
+            if tool is None:
+                outputs.append(None)
+                continue
+            outputs.append(self.choosers[self.chooser_index[request_index]].execute_tool(tool))
+        return outputs
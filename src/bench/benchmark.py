@@ -0,0 +1,380 @@
+"""
+Latency benchmark for the choose -> configure -> execute pipeline.
+
+Replays a corpus of (query, context, expected toolset/tool/arguments) cases
+through ToolChooser and reports p50/p95/p99 latency and tokens in/out for
+every stage, plus how often the decisions matched the expected ones.
+
+    python -m src.bench.benchmark --driver fake --output bench.json
+    python -m src.bench.benchmark --driver local --model ./src/llm/models/model.gguf --baseline bench.json
+
+The fake driver is deterministic and needs no model, so it runs offline and
+in CI. Tools are not executed unless --execute is given, since they talk to
+real services; the execution stage is then left out of the report.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from ..llm.abstract_llm_driver import AbstractLLMDriver
+from ..tool_chooser import ToolChooser, ToolsetCounts
+from ..tool.tool_registry import get_default_registry
+from ..tracing import get_tracer, JsonlSink
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'corpus.jsonl')
+
+# Driver method -> (stage, method building its prompt)
+MEASURED_METHODS = {
+    'decide_toolset': ('toolset', 'toolset_prompt'),
+    'decide_tool': ('tool', 'tool_prompt'),
+    'decide_arguments': ('arguments', 'arguments_prompt'),
+    'decide_tool_and_arguments': ('tool_and_arguments', 'tool_and_arguments_prompt'),
+    'personality': ('personality', 'personality_prompt'),
+}
+
+STAGES = ['toolset', 'registry', 'tool', 'arguments', 'tool_and_arguments', 'execution', 'personality', 'total']
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def percentile(values, fraction):
+    """
+    Linear interpolation between the closest ranks.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class StageRecorder:
+    """
+    Collects the time and tokens spent in each stage of one case.
+    Stages that run more than once (speculative decisions) add up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, stage, seconds, tokens_in=0, tokens_out=0):
+        with self.lock:
+            totals = self.stages.setdefault(stage, {'seconds': 0.0, 'tokens_in': 0, 'tokens_out': 0, 'calls': 0})
+            totals['seconds'] += seconds
+            totals['tokens_in'] += tokens_in
+            totals['tokens_out'] += tokens_out
+            totals['calls'] += 1
+
+class MeasuredLLMDriver(AbstractLLMDriver):
+    """
+    Wraps a driver and records the time and tokens of each decision.
+    Prompt tokens are counted on the prompt the wrapped driver would build,
+    if it has *_prompt methods, otherwise on the inputs of the call.
+    """
+
+    def __init__(self, driver):
+        super().__init__(name=driver.name)
+        self.driver = driver
+        self.recorder = StageRecorder()
+
+    def measure(self, method_name, *args):
+        stage, prompt_method = MEASURED_METHODS[method_name]
+        start = time.perf_counter()
+        result = getattr(self.driver, method_name)(*args)
+        seconds = time.perf_counter() - start
+        self.recorder.record(stage, seconds, self.count_tokens(self.prompt_for(prompt_method, args)), self.count_tokens(str(result or '')))
+        return result
+
+    def prompt_for(self, prompt_method, args):
+        try:
+            prompt = getattr(self.driver, prompt_method)(*args)
+        except (AttributeError, NotImplementedError):
+            return " ".join(str(arg) for arg in args)
+        # Some prompt methods return (prompt, static prefix)
+        return prompt[0] if isinstance(prompt, tuple) else prompt
+
+    def generate_response(self, text, **kwargs):
+        return self.driver.generate_response(text, **kwargs)
+
+    def count_tokens(self, text):
+        return self.driver.count_tokens(text)
+
+    def decide_toolset(self, toolsets, query, context):
+        return self.measure('decide_toolset', toolsets, query, context)
+
+    def decide_tool(self, toolset, query, context):
+        return self.measure('decide_tool', toolset, query, context)
+
+    def decide_arguments(self, tool_code, query, context):
+        return self.measure('decide_arguments', tool_code, query, context)
+
+    def decide_tool_and_arguments(self, tools, query, context):
+        return self.measure('decide_tool_and_arguments', tools, query, context)
+
+    def personality(self, text, query, context):
+        return self.measure('personality', text, query, context)
+
+    def __getattr__(self, attribute):
+        # Anything else (uncached_driver, embed...) goes to the wrapped driver
+        return getattr(self.__dict__['driver'], attribute)
+
+class MeasuredRegistry:
+    """
+    Wraps a ToolRegistry and records the time spent in it (scanning,
+    importing tool modules, creating tools) as the registry stage.
+    """
+
+    def __init__(self, registry, driver):
+        self.registry = registry
+        self.driver = driver
+
+    def __getattr__(self, attribute):
+        value = getattr(self.registry, attribute)
+        if not callable(value):
+            return value
+
+        def measured(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self.driver.recorder.record('registry', time.perf_counter() - start)
+        return measured
+
+def same_value(value, expected):
+    try:
+        return float(value) == float(expected)
+    except (TypeError, ValueError):
+        return str(value).strip().lower() == str(expected).strip().lower()
+
+class Benchmark:
+    def __init__(self, llm_driver, corpus, registry=None, execute=False, single_pass=False, speculative=0, templates=True, debug=False):
+        self.llm_driver = MeasuredLLMDriver(llm_driver)
+        self.registry = registry or get_default_registry()
+        self.measured_registry = MeasuredRegistry(self.registry, self.llm_driver)
+        self.corpus = corpus
+        self.execute = execute
+        self.single_pass = single_pass
+        self.speculative = speculative
+        # Shared by the cases, like a session's queries
+        self.toolset_counts = ToolsetCounts()
+        # Use the tools' response templates where they apply instead of the LLM rewrite
+        self.templates = templates
+        self.debug = debug
+
+    def run_case(self, case):
+        """
+        Runs one case through the pipeline and returns its stages and decisions.
+        """
+        self.llm_driver.recorder = StageRecorder()
+        tool_chooser = ToolChooser(
+            case['query'],
+            case.get('context', ''),
+            self.llm_driver,
+            is_called_by_voice=False,
+            registry=self.measured_registry,
+            single_pass=self.single_pass,
+            speculative=self.speculative,
+            toolset_counts=self.toolset_counts,
+            # Never block on a question, a missing argument is a wrong decision
+            get_user_input=lambda prompt: "",
+        )
+        start = time.perf_counter()
+        tool = None
+        if self.single_pass:
+            try:
+                tool = tool_chooser.choose_and_configure_tool()
+            except NotImplementedError:
+                pass
+        if tool is None:
+            tool = tool_chooser.choose_tool()
+            if tool is not None:
+                tool_chooser.configure_tool(tool)
+
+        if tool is None:
+            output = "I couldn't find a tool for that."
+        elif self.execute:
+            execution_start = time.perf_counter()
+            output = tool_chooser.execute_tool(tool)
+            self.llm_driver.recorder.record('execution', time.perf_counter() - execution_start)
+        else:
+            output = f"{tool.name} would run with {tool.argument_values}"
+        response = tool.render_response(output) if tool is not None and self.templates else None
+        if response is None:
+            self.llm_driver.personality(output, case['query'], case.get('context', ''))
+        self.llm_driver.recorder.record('total', time.perf_counter() - start)
+
+        return self.score(case, tool, self.llm_driver.recorder.stages)
+
+    def score(self, case, tool, stages):
+        tool_class_name = tool.__class__.__name__ if tool is not None else None
+        record = self.registry.get_tool(tool_class_name) if tool is not None else None
+        arguments = dict(tool.argument_values) if tool is not None else {}
+        expected_arguments = case.get('arguments', {})
+        return {
+            'query': case['query'],
+            'toolset': record['toolset'] if record else None,
+            'tool': tool_class_name,
+            'arguments': arguments,
+            'toolset_correct': (record['toolset'] if record else None) == case.get('toolset'),
+            'tool_correct': tool_class_name == case.get('tool'),
+            'arguments_correct': all(same_value(arguments.get(name), value) for name, value in expected_arguments.items()),
+            'stages': stages,
+        }
+
+    def run(self, runs=1, warmup=1):
+        """
+        Replays the corpus `warmup` times without recording, then `runs` times.
+        """
+        for _ in range(warmup):
+            for case in self.corpus:
+                self.run_case(case)
+        results = []
+        for run in range(runs):
+            for case in self.corpus:
+                result = self.run_case(case)
+                result['run'] = run
+                results.append(result)
+                if(self.debug):
+                    print(f"{result['query']}: {result['tool']} {result['arguments']} in {result['stages']['total']['seconds']:.3f}s")
+        return results
+
+def summarize(results):
+    stages = {}
+    for stage in STAGES:
+        samples = [result['stages'][stage] for result in results if stage in result['stages']]
+        if not samples:
+            continue
+        milliseconds = [sample['seconds'] * 1000 for sample in samples]
+        stages[stage] = {
+            'count': len(samples),
+            'p50_ms': percentile(milliseconds, 0.50),
+            'p95_ms': percentile(milliseconds, 0.95),
+            'p99_ms': percentile(milliseconds, 0.99),
+            'mean_ms': sum(milliseconds) / len(milliseconds),
+            'tokens_in_mean': sum(sample['tokens_in'] for sample in samples) / len(samples),
+            'tokens_out_mean': sum(sample['tokens_out'] for sample in samples) / len(samples),
+        }
+    accuracy = {
+        key: sum(result[f'{key}_correct'] for result in results) / len(results)
+        for key in ('toolset', 'tool', 'arguments')
+    } if results else {}
+    return {'stages': stages, 'accuracy': accuracy}
+
+def compare(report, baseline, threshold=0.10):
+    """
+    Prints the change of every stage against a baseline report.
+    Returns the stages whose p50 or p95 got slower by more than `threshold`.
+    """
+    regressions = []
+    for stage, current in report['stages'].items():
+        previous = baseline['stages'].get(stage)
+        if previous is None:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (current[key] - previous[key]) / previous[key] if previous[key] else 0.0
+            changes.append(f"{key} {previous[key]:.1f} -> {current[key]:.1f} ({change:+.0%})")
+            if change > threshold and stage not in regressions:
+                regressions.append(stage)
+        print(f"{stage:20} {'  '.join(changes)}")
+    for key, value in report['accuracy'].items():
+        previous = baseline['accuracy'].get(key)
+        if previous is not None and value < previous:
+            print(f"{key} accuracy dropped from {previous:.0%} to {value:.0%}")
+            regressions.append(f"{key}_accuracy")
+    return regressions
+
+def print_report(report):
+    print(f"{'stage':20} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'tok in':>8} {'tok out':>8}")
+    for stage, summary in report['stages'].items():
+        print(f"{stage:20} {summary['count']:>4} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['tokens_in_mean']:>8.0f} {summary['tokens_out_mean']:>8.0f}")
+    print("accuracy: " + ", ".join(f"{key} {value:.0%}" for key, value in report['accuracy'].items()))
+
+def create_driver(args, corpus):
+    if args.driver == 'fake':
+        from ..llm.fake_llm_driver import FakeLLMDriver
+        answers = {case['query']: case for case in corpus}
+        driver = FakeLLMDriver(answers, prompt_latency=args.prompt_latency, token_latency=args.token_latency)
+    elif args.driver == 'local':
+        from ..llm.local_llm_driver import LocalLLMDriver
+        driver = LocalLLMDriver(args.model)
+    elif args.driver == 'ollama':
+        from ..llm.ollama_llm_driver import OllamaLLMDriver
+        drivers = [OllamaLLMDriver(url, model=args.model or 'openhermes') for url in args.ollama_url.split(',')]
+        if len(drivers) == 1:
+            driver = drivers[0]
+        else:
+            from ..llm.llm_driver_pool import LLMDriverPool
+            driver = LLMDriverPool(drivers, debug=args.debug)
+    else:
+        raise ValueError(f"Unknown driver {args.driver}")
+    if args.cached:
+        from ..llm.cached_llm_driver import CachedLLMDriver
+        driver = CachedLLMDriver(driver)
+    return driver
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the latency of the tool choosing pipeline.")
+    parser.add_argument("--driver", choices=['fake', 'local', 'ollama'], default='fake')
+    parser.add_argument("--model", help="Model file (local) or model name (ollama)")
+    parser.add_argument("--ollama-url", default='http://localhost:11434', help="Several comma separated URLs are pooled (see LLMDriverPool)")
+    parser.add_argument("--cached", action="store_true", help="Put the response cache in front of the driver")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--single-pass", action="store_true")
+    parser.add_argument("--speculative", type=int, default=0)
+    parser.add_argument("--execute", action="store_true", help="Really run the tools")
+    parser.add_argument("--no-templates", action="store_true", help="Always have the LLM rewrite the output, even where a response template applies")
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Fake driver seconds per prompt token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Fake driver seconds per generated token")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown that counts as a regression")
+    parser.add_argument("--trace", help="Write the tracing spans to this JSONL file")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        get_tracer().add_sink(JsonlSink(args.trace))
+
+    corpus = load_corpus(args.corpus)
+    benchmark = Benchmark(create_driver(args, corpus), corpus, execute=args.execute, single_pass=args.single_pass, speculative=args.speculative, templates=not args.no_templates, debug=args.debug)
+    results = benchmark.run(runs=args.runs, warmup=args.warmup)
+    report = summarize(results)
+    report['meta'] = {
+        'driver': args.driver,
+        'model': args.model,
+        'cached': args.cached,
+        'single_pass': args.single_pass,
+        'speculative': args.speculative,
+        'execute': args.execute,
+        'templates': not args.no_templates,
+        'corpus': os.path.abspath(args.corpus),
+        'runs': args.runs,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({**report, 'cases': results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
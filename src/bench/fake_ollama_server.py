@@ -0,0 +1,157 @@
+"""
+Stand-in for an Ollama server, for trying OllamaLLMDriver and LLMDriverPool
+without a model.
+
+It answers /api/generate (streamed, like Ollama) with the decisions of a
+FakeLLMDriver for the benchmark corpus, and /api/tags for health checks.
+Each server can be made slow, busy (one request at a time) or flaky:
+
+    python -m src.bench.fake_ollama_server --port 11435 --latency 0.2
+    python -m src.bench.fake_ollama_server --port 11436 --latency 2 --serial --fail-rate 0.2
+    python -m src.bench.benchmark --driver ollama --ollama-url http://localhost:11435,http://localhost:11436
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..llm.fake_llm_driver import FakeLLMDriver
+from .benchmark import CORPUS_PATH, load_corpus
+
+class FakeOllamaServer:
+    """
+    Serves a FakeLLMDriver over Ollama's HTTP API on a background thread.
+    `latency` seconds are added to every request; with `serial` the server
+    works on one request at a time, like a single busy GPU; `fail_rate` of the
+    requests get a 500. Answers are streamed with chunked transfer encoding,
+    one line per chunk: `chunk_size` characters of the answer per line
+    (otherwise all of it in one), `chunk_latency` seconds apart. Stop tokens
+    aren't applied here, the driver has to find them itself and hang up.
+    """
+
+    def __init__(self, driver, host='127.0.0.1', port=0, latency=0.0, serial=False, fail_rate=0.0, chunk_size=None, chunk_latency=0.0):
+        self.driver = driver
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.fail_rate = fail_rate
+        self.busy = threading.Lock() if serial else None
+        self.up = True
+        self.requests = 0
+        # Streams the client closed before the end, like the driver does on a stop token
+        self.hung_up = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send(self, status, body):
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_lines(self, lines):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, line in enumerate(lines):
+                        if i and server.chunk_latency:
+                            time.sleep(server.chunk_latency)
+                        data = (line + "\n").encode('utf-8')
+                        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    server.hung_up += 1
+                    self.close_connection = True
+
+            def do_GET(self):
+                if not server.up:
+                    self.send(503, json.dumps({"error": "down"}))
+                elif self.path == "/api/tags":
+                    self.send(200, json.dumps({"models": [{"name": "fake"}]}))
+                else:
+                    self.send(404, json.dumps({"error": "not found"}))
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                if not server.up or random.random() < server.fail_rate:
+                    self.send(500, json.dumps({"error": "fake failure"}))
+                    return
+                if self.path != "/api/generate":
+                    self.send(404, json.dumps({"error": "not found"}))
+                    return
+                if server.busy is not None:
+                    with server.busy:
+                        self.generate(payload)
+                else:
+                    self.generate(payload)
+
+            def generate(self, payload):
+                start = time.perf_counter()
+                time.sleep(server.latency)
+                prompt = payload.get("prompt", "")
+                if isinstance(payload.get("format"), dict):
+                    # A JSON schema: a single pass decision
+                    completion = server.driver.generate_json(prompt, json.dumps(payload["format"]))
+                else:
+                    completion = server.driver.completion_for(prompt)
+                    if payload.get("format") == "json" and not completion.startswith("{"):
+                        # The prompt didn't open the dict, the whole answer is JSON
+                        completion = "{" + completion + "}"
+                    server.driver.simulate_latency(prompt, completion)
+                size = server.chunk_size or max(len(completion), 1)
+
+                def lines():
+                    for i in range(0, len(completion), size):
+                        yield json.dumps({"response": completion[i:i + size], "done": False})
+                    # Made once the rest is sent, so it has the whole duration
+                    yield json.dumps({"response": "", "done": True,
+                        "prompt_eval_count": server.driver.count_tokens(prompt),
+                        "eval_count": server.driver.count_tokens(completion),
+                        "eval_duration": int((time.perf_counter() - start) * 1e9)})
+                self.send_lines(lines())
+
+        self.http = ThreadingHTTPServer((host, port), Handler)
+        self.http.daemon_threads = True
+        self.url = f"http://{host}:{self.http.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, name="fake-ollama", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fake model answers over the Ollama API.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--serial", action="store_true", help="Answer one request at a time")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    args = parser.parse_args(argv)
+
+    driver = FakeLLMDriver({case['query']: case for case in load_corpus(args.corpus)})
+    server = FakeOllamaServer(driver, port=args.port, latency=args.latency, serial=args.serial, fail_rate=args.fail_rate)
+    print(f"Fake Ollama on {server.url}")
+    try:
+        server.http.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .tool.tool_signature import estimate_tokens
+
+CONTEXT_PATH = './cache/context.json'
+
+# Facts are always rendered in this order (then any others alphabetically),
+# so the rendered context only changes when a fact does
+FACT_ORDER = ['project', 'platform', 'site', 'env', 'language']
+
+# What each kind of prompt gets from the context, and its token budget
+PROMPT_CONTEXT = {
+    'toolset': (['facts'], 96),
+    'tool': (['facts'], 96),
+    'arguments': (['facts', 'recent'], 256),
+    'tool_and_arguments': (['facts', 'recent'], 256),
+    'personality': (['facts', 'summary', 'recent'], 384),
+}
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and their programming assistant with the new turns.
+Keep names, sites, environments, numbers and decisions. At most {words} words.
+Summary so far: {summary}
+New turns:
+{turns}"""
+
+class ContextStore:
+    """
+    What the assistant knows about the user's situation, rendered into the
+    prompts instead of a free-form context string.
+
+    It holds typed facts (the current project, site, env...), persisted to
+    disk, and the conversation history. Recent turns are kept verbatim; once
+    they go over `history_budget` tokens the oldest are folded into a rolling
+    summary by the LLM, on a background thread, one batch of turns at a time.
+
+    render(kind) returns the context for one kind of prompt: only the parts
+    that stage needs, within its token budget, in a stable order so that it
+    stays the same from query to query (and KV prefixes stay reusable)
+    until something actually changes.
+    """
+
+    def __init__(self, llm_driver=None, path=CONTEXT_PATH, history_budget=512, keep_recent=4, summary_words=80, debug=False):
+        self.llm_driver = llm_driver
+        self.count_tokens = llm_driver.count_tokens if llm_driver is not None else estimate_tokens
+        self.path = path
+        self.history_budget = history_budget
+        self.keep_recent = keep_recent
+        self.summary_words = summary_words
+        self.debug = debug
+        self.lock = threading.RLock()
+        self.facts = {}
+        self.history = []  # (query, response) turns not summarized yet
+        self.summary = ""
+        self.version = 0
+        self.rendered = {}  # (kind, budget) -> (version, text)
+        self.summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+        self.summarizing = False
+        self.load()
+
+    # ------------------------------------------------------------------
+    # Facts
+    # ------------------------------------------------------------------
+
+    def load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                self.facts = json.load(file).get('facts', {})
+        except (OSError, ValueError):
+            self.facts = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'facts': self.facts}, file, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def set_fact(self, name, value):
+        """
+        Sets a fact such as site or env. An empty value removes it.
+        """
+        name = name.strip().lower().replace(' ', '_')
+        with self.lock:
+            if value in (None, ''):
+                if self.facts.pop(name, None) is None:
+                    return
+            elif self.facts.get(name) == value:
+                return
+            else:
+                self.facts[name] = value
+            self.version += 1
+            self.save()
+
+    def get_fact(self, name, default=None):
+        return self.facts.get(name, default)
+
+    # ------------------------------------------------------------------
+    # History
+    # ------------------------------------------------------------------
+
+    def add_turn(self, query, response):
+        """
+        Records a query and the assistant's response, and starts folding old
+        turns into the summary if the history is over budget.
+        """
+        with self.lock:
+            self.history.append((query, response or ""))
+            self.version += 1
+            over_budget = self.history_tokens() > self.history_budget and len(self.history) > self.keep_recent
+            if over_budget and not self.summarizing:
+                self.summarizing = True
+                self.summarizer.submit(self.compact)
+
+    def history_tokens(self):
+        return sum(self.count_tokens(self.format_turn(turn)) for turn in self.history)
+
+    @staticmethod
+    def format_turn(turn):
+        query, response = turn
+        return f"User: {query}\nAssistant: {response}\n"
+
+    def compact(self):
+        """
+        Folds the turns before the `keep_recent` most recent ones into the summary.
+        """
+        try:
+            with self.lock:
+                old_turns = self.history[:-self.keep_recent]
+                summary = self.summary
+            if not old_turns:
+                return
+            new_summary = self.summarize(summary, old_turns)
+            with self.lock:
+                # Turns added meanwhile are after the ones we summarized
+                self.history = self.history[len(old_turns):]
+                self.summary = new_summary
+                self.version += 1
+            if(self.debug):
+                print(f"context: summarized {len(old_turns)} turns")
+        except Exception as e:
+            print(f"Could not summarize the conversation: {e}")
+        finally:
+            self.summarizing = False
+
+    def summarize(self, summary, turns):
+        turns_text = "".join(self.format_turn(turn) for turn in turns)
+        if self.llm_driver is not None and hasattr(self.llm_driver, 'generate_response_in_format'):
+            prompt = SUMMARY_PROMPT.format(words=self.summary_words, summary=summary or "(none)", turns=turns_text)
+            return self.llm_driver.generate_response_in_format(prompt).strip()
+        # Without an LLM, keep what was asked, most recent last, within the word limit
+        words = (summary + " " + " ".join(f"Asked: {query}." for query, _ in turns)).split()
+        return " ".join(words[-self.summary_words:])
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+
+    def render_facts(self):
+        names = [name for name in FACT_ORDER if name in self.facts]
+        names += sorted(name for name in self.facts if name not in FACT_ORDER)
+        return " ".join(f"{name.replace('_', ' ').capitalize()}: {self.facts[name]}." for name in names)
+
+    def fit(self, text, budget):
+        """
+        Cuts text from the start until it fits the budget, keeping the end
+        (the most recent part).
+        """
+        if budget <= 0:
+            return ""
+        while text and self.count_tokens(text) > budget:
+            text = text[len(text) // 4 or 1:]
+            text = text[text.find(' ') + 1:] if ' ' in text else text
+        return text
+
+    def render(self, kind, budget=None):
+        """
+        Returns the context for a kind of prompt: toolset, tool, arguments,
+        tool_and_arguments or personality.
+        """
+        fields, default_budget = PROMPT_CONTEXT.get(kind, (['facts', 'summary', 'recent'], 256))
+        budget = default_budget if budget is None else budget
+        with self.lock:
+            cached = self.rendered.get((kind, budget))
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+
+            parts = []
+            remaining = budget
+            # Facts first, they matter most and change least
+            if 'facts' in fields and self.facts:
+                facts = self.fit(self.render_facts(), remaining)
+                parts.append(facts)
+                remaining -= self.count_tokens(facts)
+            if 'recent' in fields and self.history:
+                recent = "".join(self.format_turn(turn) for turn in self.history[-self.keep_recent:])
+                # The summary gets whatever the recent turns leave
+                recent = self.fit(recent, remaining if 'summary' not in fields else max(remaining * 2 // 3, remaining - 128))
+                recent_tokens = self.count_tokens(recent) if recent else 0
+            else:
+                recent, recent_tokens = "", 0
+            if 'summary' in fields and self.summary:
+                summary = self.fit(f"Earlier: {self.summary}", remaining - recent_tokens)
+                if summary:
+                    parts.append(summary)
+            if recent:
+                parts.append(recent.rstrip('\n'))
+            text = "\n".join(part for part in parts if part)
+            self.rendered[(kind, budget)] = (self.version, text)
+            return text
+
+    def __str__(self):
+        return self.render('personality')
+
+_default_context_store = None
+_default_context_store_lock = threading.Lock()
+
+def get_default_context_store(llm_driver=None):
+    """
+    Returns the process-wide context store, creating it on first use.
+    """
+    global _default_context_store
+    with _default_context_store_lock:
+        if _default_context_store is None:
+            _default_context_store = ContextStore(llm_driver)
+        return _default_context_store
+
+def update_context(name, value):
+    """
+    Entry point of UpdateContextTool.
+    """
+    get_default_context_store().set_fact(name, value)
+    if value:
+        return f"Noted, the {name} is now {value}."
+    return f"Forgot the {name}."
@@ -1,7 +1,79 @@
 import abc
+import threading
 import subprocess
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError, InvalidStateError
 from typing import Dict, Any
 
+# Shared by every driver for `submit`, so concurrent requests stay bounded
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-driver")
+
+# Set while a call started by `submit` runs, to the event its future's cancel() sets
+_cancel_event = contextvars.ContextVar('llm_cancel_event', default=None)
+
+def call_cancelled():
+    """
+    Whether the submitted call running in this context was cancelled.
+    Drivers check it to give up on a generation nobody is waiting for.
+    """
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+def was_cancelled(future):
+    """
+    Whether a finished future was cancelled, including a call that was asked
+    to stop and still returned, or gave up with CancelledError. Its result
+    isn't the answer, so it shouldn't be timed, cached or logged.
+    """
+    if future.cancelled():
+        return True
+    cancel_event = getattr(future, 'cancel_event', None)
+    if cancel_event is not None and cancel_event.is_set():
+        return True
+    return isinstance(future.exception(), CancelledError)
+
+class CancellableFuture(Future):
+    """
+    A Future whose cancel() also asks the call to stop once it has started
+    (see call_cancelled), and cancels the `source` future it was chained to.
+    """
+
+    def __init__(self, source=None):
+        super().__init__()
+        self.cancel_event = threading.Event()
+        self.source = source
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.source is not None:
+            self.source.cancel()
+        return super().cancel()
+
+def chain(future, callback):
+    """
+    Returns a CancellableFuture that finishes like `future`, once
+    `callback(future)` has run. Cancelling it cancels `future`.
+    """
+    chained = CancellableFuture(source=future)
+
+    def finish(future):
+        try:
+            callback(future)
+        finally:
+            try:
+                if future.cancelled():
+                    chained.cancel()
+                elif future.exception() is not None:
+                    chained.set_exception(future.exception())
+                else:
+                    chained.set_result(future.result())
+            except InvalidStateError:
+                # The chained future was cancelled first
+                pass
+
+    future.add_done_callback(finish)
+    return chained
+
 class AbstractLLMDriver(abc.ABC):
     """
     Abstract base class for an LLM Driver.
@@ -45,4 +117,78 @@ class AbstractLLMDriver(abc.ABC):
         user query and context.
         """
         pass
+
+    def stream_response(self, text, **kwargs):
+        """
+        Yields the response in pieces as it is generated.
+        Drivers that can't stream yield the whole response at once.
+        """
+        yield self.generate_response(text, **kwargs)
+
+    def decide_tool_and_arguments(self, tools, query, context) -> dict:
+        """
+        Given the tool registry records, query and context, choose the
+        toolset, tool and argument values in a single decision.
+        Returns {"toolset": ..., "tool": ..., "arguments": {...}} or None.
+        Drivers that can't do this in one pass don't implement it.
+        """
+        raise NotImplementedError(f"{self.name} driver does not support single pass tool decisions")
+
+    def submit(self, method_name, *args, executor=None, **kwargs):
+        """
+        Starts `self.<method_name>(*args, **kwargs)` in the background (on
+        `executor`, or the one shared by the drivers) and returns a Future for
+        the result. Cancelling the future skips a call that hasn't started; a
+        running one is asked to stop, which drivers that check call_cancelled()
+        do, and the others finish in the background.
+        """
+        future = CancellableFuture()
+        # Run in a copy of the caller's context, so tracing spans nest under the caller's
+        context = contextvars.copy_context()
+
+        def call():
+            _cancel_event.set(future.cancel_event)
+            return getattr(self, method_name)(*args, **kwargs)
+
+        def work():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(context.run(call))
+            except BaseException as e:
+                future.set_exception(e)
+
+        (executor or _executor).submit(work)
+        return future
+
+    def batch(self, method_name, calls) -> list:
+        """
+        Runs `self.<method_name>(*args)` for every args tuple in `calls` and
+        returns the results in the same order. By default the calls are
+        submitted together, so a backend that serves several requests at once
+        works on them in parallel.
+        """
+        futures = [self.submit(method_name, *args) for args in calls]
+        return [future.result() for future in futures]
+
+    def health_check(self) -> bool:
+        """
+        Returns whether the backend can take requests right now.
+        Drivers for remote or slow to load backends should override this.
+        """
+        return True
+
+    def count_tokens(self, text) -> int:
+        """
+        Returns the number of tokens in the text.
+        Drivers with a tokenizer should override this rough estimate.
+        """
+        return len(text) // 4 + 1
+
+    def embed(self, texts) -> list:
+        """
+        Returns one embedding vector per text.
+        Drivers without an embedding model don't implement this.
+        """
+        raise NotImplementedError(f"{self.name} driver does not support embeddings")
    
\ No newline at end of file
@@ -0,0 +1,159 @@
+import re
+import json
+import hashlib
+
+from .abstract_llm_driver import AbstractLLMDriver, chain, CancellableFuture, call_cancelled, was_cancelled
+from .response_cache import ResponseCache
+from ..tracing import get_tracer
+
+def normalize_query(query):
+    """
+    Lower cases the query and collapses whitespace so trivially different
+    phrasings of the same request share a cache entry.
+    """
+    return re.sub(r'\s+', ' ', (query or '').strip().lower()).rstrip('.!?')
+
+def hash_text(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def hash_tools(tools):
+    return hash_text(json.dumps(tools, sort_keys=True))
+
+# The decisions we cache, with their kind and what identifies the candidates
+CACHED = {
+    'decide_toolset': ('toolset', sorted),
+    'decide_tool': ('tool', hash_text),
+    'decide_arguments': ('arguments', hash_text),
+    'decide_tool_and_arguments': ('tool_and_arguments', hash_tools),
+    'personality': ('personality', hash_text),
+}
+
+class CachedLLMDriver(AbstractLLMDriver):
+    """
+    Wraps another LLM driver and caches its decisions.
+
+    Responses are keyed by the kind of decision, the wrapped driver and model,
+    the normalized query, the context and the candidates offered to the model
+    (the toolset list, or a hash of the tool code). The drivers generate at
+    temperature 0, so a cached answer is the answer the model would give again.
+    Everything else is the wrapped driver's.
+    """
+
+    def __init__(self, driver, cache=None, debug=False):
+        super().__init__(name=f"Cached{driver.name}")
+        self.driver = driver
+        self.cache = cache if cache is not None else ResponseCache()
+        self.debug = debug
+
+    @property
+    def uncached_driver(self):
+        """
+        The wrapped driver, for tools that opt out of caching.
+        """
+        return self.driver
+
+    def model_id(self):
+        return f"{self.driver.name}:{getattr(self.driver, 'model_id', '')}"
+
+    def key_for(self, method_name, candidates, query, context):
+        kind, identify = CACHED[method_name]
+        return ResponseCache.make_key(kind, self.model_id(), normalize_query(query), context or '', identify(candidates))
+
+    def cached(self, method_name, candidates, query, context):
+        with get_tracer().span("response_cache", kind=CACHED[method_name][0]) as span:
+            key = self.key_for(method_name, candidates, query, context)
+            hit, value = self.cache.get(key)
+            span.set(hit=hit)
+            if(self.debug):
+                print(f"response cache {'hit' if hit else 'miss'}: {method_name}")
+            if hit:
+                return value
+            value = getattr(self.driver, method_name)(candidates, query, context)
+            # Failed decisions are not cached, the next attempt may succeed,
+            # and neither is what a cancelled call returned when it stopped
+            if value is not None and not call_cancelled():
+                self.cache.set(key, value)
+            return value
+
+    def store(self, key, future):
+        if was_cancelled(future) or future.exception() is not None:
+            return
+        if future.result() is not None:
+            self.cache.set(key, future.result())
+
+    def generate_response(self, text, **kwargs):
+        return self.driver.generate_response(text, **kwargs)
+
+    def stream_response(self, text, **kwargs):
+        return self.driver.stream_response(text, **kwargs)
+
+    def count_tokens(self, text):
+        return self.driver.count_tokens(text)
+
+    def embed(self, texts):
+        return self.driver.embed(texts)
+
+    def health_check(self):
+        return self.driver.health_check()
+
+    def decide_toolset(self, toolsets, query, context):
+        return self.cached('decide_toolset', toolsets, query, context)
+
+    def decide_tool(self, toolset, query, context):
+        return self.cached('decide_tool', toolset, query, context)
+
+    def decide_arguments(self, tool_code, query, context):
+        return self.cached('decide_arguments', tool_code, query, context)
+
+    def decide_tool_and_arguments(self, tools, query, context):
+        return self.cached('decide_tool_and_arguments', tools, query, context)
+
+    def personality(self, text, query, context):
+        return self.cached('personality', text, query, context)
+
+    def submit(self, method_name, *args, executor=None, **kwargs):
+        """
+        Answers a cached decision right away. Anything else is submitted to
+        the wrapped driver, so cancelling the future reaches it, and the
+        decision is cached before the future has its result.
+        """
+        if method_name not in CACHED:
+            return self.driver.submit(method_name, *args, executor=executor, **kwargs)
+        key = self.key_for(method_name, *args)
+        hit, value = self.cache.get(key)
+        if(self.debug):
+            print(f"response cache {'hit' if hit else 'miss'}: {method_name}")
+        if hit:
+            future = CancellableFuture()
+            future.set_result(value)
+            return future
+        future = self.driver.submit(method_name, *args, executor=executor, **kwargs)
+        return chain(future, lambda future: self.store(key, future))
+
+    def batch(self, method_name, calls):
+        if method_name in CACHED:
+            # One submit per call, so the cached ones aren't asked again
+            return super().batch(method_name, calls)
+        return self.driver.batch(method_name, calls)
+
+    def personality_stream(self, text, query, context, by_sentence=True):
+        """
+        Streams from the wrapped driver, or yields the cached text in one piece.
+        """
+        key = self.key_for('personality', text, query, context)
+        hit, value = self.cache.get(key)
+        if hit:
+            yield value
+            return
+        pieces = []
+        for piece in self.driver.personality_stream(text, query, context, by_sentence=by_sentence):
+            pieces.append(piece)
+            yield piece
+        self.cache.set(key, "".join(pieces))
+
+    def __getattr__(self, attribute):
+        # Anything else (prompts, generate_json...) goes straight to the wrapped driver
+        driver = self.__dict__.get('driver')
+        if driver is None:
+            raise AttributeError(attribute)
+        return getattr(driver, attribute)
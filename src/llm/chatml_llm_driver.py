@@ -0,0 +1,247 @@
+import json
+import re
+
+from .abstract_llm_driver import AbstractLLMDriver
+from .text_stream import sentence_chunks
+from ..tool.tool_schema import tool_choice_schema_json
+from ..tool.tool_signature import ToolSignatures
+
+TOOLSET_PROMPT_PREFIX = """<|im_start|>system
+A helpful toolset-choosing assistant chooses the correct toolset given the context and user query.<|im_end|>
+<|im_start|>user
+Toolsets: pantheon, financial, commpro
+Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
+User query: clear the caches<|im_end|>
+<|im_start|>assistant
+(pantheon)<|im_end|>
+<|im_start|>user
+Toolsets: pantheon, financial, commpro
+Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
+User query: convert 100USD to CAD please<|im_end|>
+<|im_start|>assistant
+(financial)<|im_end|>
+<|im_start|>user
+"""
+
+TOOL_PROMPT_PREFIX = """<|im_start|>system
+A helpful tool-choosing assistant chooses the correct tool (if any), given the context and user query.
+Tool classes:
+{toolset_code}<|im_end|>
+<|im_start|>user
+Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
+User query: clear the caches<|im_end|>
+<|im_start|>assistant
+(ClearCachesTool)<|im_end|>
+<|im_start|>user
+Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
+User query: convert 100USD to CAD please<|im_end|>
+<|im_start|>assistant
+(CurrencyConverterTool)<|im_end|>
+<|im_start|>user
+"""
+
+class ChatMLLLMDriver(AbstractLLMDriver):
+  """
+  Base class for drivers of ChatML models (the <|im_start|> prompt format).
+
+  The prompts and the parsing of the model's answers live here. Each decision
+  is split into a `*_prompt` method that builds the prompt and a `parse_*`
+  method that reads the answer, so drivers with async entry points can reuse
+  them. Subclasses implement generate_response, and generate_json for
+  single pass decisions.
+  """
+
+  def __init__(self, name):
+    super().__init__(name=name)
+    self.signatures = ToolSignatures(count_tokens=self.count_tokens)
+    # Tokens the variable parts of a prompt (context, tool code and output) may take, None for no limit
+    self.prompt_token_budget = None
+
+  def fit(self, text, share=0.5):
+    """
+    Cuts `text` down to its share of the prompt token budget, so prompts
+    with a long tool output or context still fit in the model's context.
+    """
+    text = str(text)
+    if self.prompt_token_budget is None:
+      return text
+    budget = int(self.prompt_token_budget * share)
+    if budget <= 0:
+      return ""
+    tokens = self.count_tokens(text)
+    if tokens <= budget:
+      return text
+    # Some tokenizers count a token even for no text
+    while tokens > budget and text:
+      text = text[:int(len(text) * budget / tokens * 0.9)]
+      tokens = self.count_tokens(text)
+    return text + "..."
+
+  def generate_response_in_format(self,prompt,system="You are a helpful assistant.",assistant_preface=""):
+    text = f"""
+<|im_start|>system
+{system}<|im_end|>
+<|im_start|>user
+{prompt}<|im_end|>
+<|im_start|>assistant
+{assistant_preface}"""
+    return self.generate_response(text)
+
+  def generate_json(self, prompt, schema_json, max_tokens=400):
+    """
+    Generates output constrained to the given JSON schema.
+    """
+    raise NotImplementedError(f"{self.name} driver does not support constrained JSON output")
+
+  def toolset_prompt(self, toolsets, query, context):
+    """
+    Returns (prompt, static prefix of the prompt).
+    """
+    prompt = TOOLSET_PROMPT_PREFIX + f"""Toolsets: {toolsets}
+Context: {self.fit(context)}
+User query: {query}<|im_end|>
+<|im_start|>assistant
+("""
+    return prompt, TOOLSET_PROMPT_PREFIX
+
+  def parse_toolset(self, llm_response, toolsets):
+    # Assuming generate_response will return a string response containing the name of the best toolset
+    recommended_toolset = llm_response.strip()
+
+    # If the recommended toolset is one of the provided toolsets, return it
+    if recommended_toolset in toolsets:
+        return recommended_toolset
+    return None
+
+  def decide_toolset(self, toolsets, query, context):
+      prompt, prefix = self.toolset_prompt(toolsets, query, context)
+      # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
+      llm_response = self.generate_response(prompt, stop_token=")", prefix=prefix)
+      return self.parse_toolset(llm_response, toolsets)
+
+  def tool_prompt(self, toolset_code, query, context):
+    #the toolset_code is a string that describes all tool objects in the toolset (their signatures, or their code)
+    prefix = TOOL_PROMPT_PREFIX.format(toolset_code=toolset_code)
+    prompt = prefix + f"""Context: {self.fit(context)}
+User query: {query}<|im_end|>
+<|im_start|>assistant
+("""
+    return prompt, prefix
+
+  def parse_tool(self, llm_response):
+    return llm_response.strip().replace('(', '').replace(')', '')
+
+  def decide_tool(self, toolset_code, query, context):
+    prompt, prefix = self.tool_prompt(toolset_code, query, context)
+    # Ask the LLM to generate a response based on the prompt to get the tool recommendation
+    llm_response = self.generate_response(prompt, stop_token=")", prefix=prefix)
+    return self.parse_tool(llm_response)
+
+  def arguments_prompt(self, tool_code, query, context, open_brace=True):
+    """
+    With `open_brace` the assistant's answer is started with "{", and the
+    model's response is the inside of a dict (see parse_llm_response_to_dict).
+    """
+    prompt = f"""<|im_start|>system
+A helpful argument-filling assistant supplies the given tool with relevant arguments values, gleaned from the context and user query. arguments_gleaned_from_query_and_context only contains arguments that are known.
+Tool code: {self.fit(tool_code)}<|im_end|>
+<|im_start|>user
+Context: {self.fit(context)}
+User query: {query}
+<|im_end|>
+<|im_start|>assistant
+arguments_gleaned_from_query_and_context = """
+    if open_brace:
+      prompt += "{"
+    return prompt
+
+  def decide_arguments(self, tool_code, query, context):
+    prompt = self.arguments_prompt(tool_code, query, context)
+    llm_response = self.generate_response(prompt, stop_token="}")
+    argument_values = self.parse_llm_response_to_dict(llm_response)
+    return argument_values
+
+  def tool_and_arguments_prompt(self, tools, query, context):
+    tool_list = self.signatures.render(tools)
+    return f"""<|im_start|>system
+A helpful tool-choosing assistant chooses the correct tool (if any) given the context and user query, and fills in the argument values that are known from the context and query. Unknown argument values are null.
+Tools:
+{tool_list}<|im_end|>
+<|im_start|>user
+Context: {self.fit(context)}
+User query: {query}<|im_end|>
+<|im_start|>assistant
+"""
+
+  def parse_tool_and_arguments(self, llm_response):
+    try:
+      decision = json.loads(llm_response)
+    except json.JSONDecodeError as e:
+      # Only possible if generation ran out of tokens
+      print(f"Error parsing tool decision: {e}\n{llm_response}")
+      return None
+    if not decision.get('tool'):
+      return None
+    decision['arguments'] = {name: value for name, value in decision['arguments'].items() if value is not None}
+    return decision
+
+  def decide_tool_and_arguments(self, tools, query, context):
+    """
+    Chooses the toolset, tool and arguments in one generation.
+    The output is constrained by a schema built from the registered tools,
+    so it is always valid JSON naming a real tool with typed arguments.
+    """
+    prompt = self.tool_and_arguments_prompt(tools, query, context)
+    llm_response = self.generate_json(prompt, tool_choice_schema_json(tools))
+    return self.parse_tool_and_arguments(llm_response)
+
+  def parse_llm_response_to_dict(self, llm_response):
+    # Trim leading and trailing whitespace
+    llm_response = llm_response.strip()
+
+    # If initial parsing fails, attempt corrective measures
+    corrected_response = llm_response
+
+    # Replace single quotes with double quotes if necessary
+    if "'" in corrected_response:
+        corrected_response = corrected_response.replace("'", '"')
+
+    # Remove lines containing ": None", and remove Python comments if it's indeed necessary
+    corrected_response_lines = [re.sub(r'#.*$', '', line).strip() for line in corrected_response.split('\n') if ": None" not in line]
+    corrected_response = '\n'.join(corrected_response_lines)
+
+    # Attempt to parse again after corrections
+    try:
+        response_dict = json.loads(f"{{ {corrected_response} }}")
+        return response_dict
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON after corrections: {e}\{llm_response} -> {corrected_response}")
+        return None
+
+  def personality_prompt(self, text, query, context):
+      prompt = f"""<|im_start|>system
+A personality translating machine gives personality to the output of a tool.
+Personality: Rewrite the tool output as a helpful programmer's assistant.
+<|im_start|>user
+Contextual information: {self.fit(context)}
+Original user query: {query}
+Tool output: {self.fit(text)}<|im_end|>
+<|im_start|>assistant
+Rewritten tool output with personality: """
+      prompt += '\"' #start the quote
+      return prompt
+
+  def personality(self, text, query, context):
+      prompt = self.personality_prompt(text, query, context)
+      # Ask the LLM to rewrite the tool output, up to the closing quote
+      llm_response = self.generate_response(prompt, stop_token='"')
+      return llm_response
+
+  def personality_stream(self, text, query, context, by_sentence=True):
+      """
+      Like personality, but yields the rewritten text as it is generated:
+      sentence by sentence, or token by token if `by_sentence` is False.
+      """
+      prompt = self.personality_prompt(text, query, context)
+      pieces = self.stream_response(prompt, stop_token='"')
+      return sentence_chunks(pieces) if by_sentence else pieces
@@ -0,0 +1,101 @@
+import os
+import json
+import glob
+import gzip
+import time
+import atexit
+import threading
+
+DECISION_LOG_PATH = './cache/decisions'
+
+# Every logged decision has these columns
+COLUMNS = ['time', 'kind', 'model', 'query', 'context', 'candidates', 'response']
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+class DecisionLog:
+    """
+    Dataset of the LLM's decisions (inputs and outputs), for fine-tuning and
+    for training the tool classifier.
+
+    Rows are buffered and written in chunks, column by column: as Parquet
+    files if pyarrow is installed, otherwise as gzipped JSON holding one list
+    per column. Tool signatures and toolset lists repeat across rows, which
+    both formats compress well.
+    """
+
+    def __init__(self, path=DECISION_LOG_PATH, flush_every=256):
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.columns = {column: [] for column in COLUMNS}
+        self.chunk = 0
+        atexit.register(self.flush)
+
+    def append(self, kind, model, query, context, candidates, response):
+        row = {
+            'time': time.time(),
+            'kind': kind,
+            'model': model,
+            'query': query or '',
+            'context': context or '',
+            'candidates': candidates if isinstance(candidates, str) else json.dumps(candidates),
+            'response': json.dumps(response),
+        }
+        with self.lock:
+            for column in COLUMNS:
+                self.columns[column].append(row[column])
+            full = len(self.columns['time']) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.columns['time']:
+                return
+            columns, self.columns = self.columns, {column: [] for column in COLUMNS}
+            self.chunk += 1
+            name = os.path.join(self.path, f"decisions-{int(time.time() * 1000)}-{os.getpid()}-{self.chunk}")
+        os.makedirs(self.path, exist_ok=True)
+        if pyarrow is not None:
+            pyarrow.parquet.write_table(pyarrow.table(columns), f"{name}.parquet", compression='zstd')
+        else:
+            with gzip.open(f"{name}.json.gz", 'wt') as file:
+                json.dump(columns, file)
+
+    def read(self):
+        """
+        Returns every logged decision (written so far) as one dict of columns.
+        """
+        self.flush()
+        columns = {column: [] for column in COLUMNS}
+        for file_path in sorted(glob.glob(os.path.join(self.path, 'decisions-*'))):
+            if file_path.endswith('.parquet'):
+                if pyarrow is None:
+                    print(f"Skipping {file_path}, reading it needs pyarrow")
+                    continue
+                chunk = pyarrow.parquet.read_table(file_path).to_pydict()
+            elif file_path.endswith('.json.gz'):
+                with gzip.open(file_path, 'rt') as file:
+                    chunk = json.load(file)
+            else:
+                continue
+            for column in COLUMNS:
+                columns[column].extend(chunk[column])
+        return columns
+
+    def rows(self, kind=None):
+        """
+        Yields the logged decisions as dicts, with the response decoded.
+        """
+        columns = self.read()
+        for index in range(len(columns['time'])):
+            if kind is not None and columns['kind'][index] != kind:
+                continue
+            row = {column: columns[column][index] for column in COLUMNS}
+            row['response'] = json.loads(row['response'])
+            yield row
@@ -0,0 +1,74 @@
+import json
+import re
+import time
+
+from .chatml_llm_driver import ChatMLLLMDriver
+
+class FakeLLMDriver(ChatMLLLMDriver):
+  """
+  Deterministic stand-in for a model, for benchmarks and offline runs.
+
+  It builds and parses the same prompts as the real ChatML drivers, but the
+  answers come from a table of expected decisions keyed by the user query:
+  {query: {"toolset": ..., "tool": ..., "arguments": {...}}}.
+  Generation takes a simulated time of `prompt_latency` seconds per prompt
+  token plus `token_latency` seconds per generated token. Like llama.cpp, a
+  prefix that was seen before costs nothing to evaluate again.
+  """
+
+  def __init__(self, answers=None, prompt_latency=0.0005, token_latency=0.005):
+    super().__init__(name="fake")
+    self.answers = answers or {}
+    self.prompt_latency = prompt_latency
+    self.token_latency = token_latency
+    self.seen_prefixes = set()
+
+  def answer_for(self, prompt):
+    queries = re.findall(r'User query: (.*?)\s*(?:<\|im_end\|>|$)', prompt, re.M)
+    if not queries:
+      return {}
+    # The prompt's own query is the last one, the others are few-shot examples
+    return self.answers.get(queries[-1].strip(), {})
+
+  def completion_for(self, prompt):
+    answer = self.answer_for(prompt)
+    if "toolset-choosing" in prompt:
+      return answer.get("toolset", "")
+    if "argument-filling" in prompt:
+      # The prompt opened the dict, we answer its inside
+      return json.dumps(answer.get("arguments", {}))[1:-1]
+    if "tool-choosing" in prompt:
+      return answer.get("tool", "")
+    if "personality translating" in prompt:
+      output = re.search(r'Tool output: (.*?)<\|im_end\|>', prompt, re.S)
+      return f"Done! {output.group(1).strip()}" if output else "Done!"
+    return ""
+
+  def simulate_latency(self, prompt, completion, prefix=None):
+    prompt_tokens = self.count_tokens(prompt)
+    if prefix and prompt.startswith(prefix):
+      if prefix in self.seen_prefixes:
+        prompt_tokens -= self.count_tokens(prefix)
+      self.seen_prefixes.add(prefix)
+    time.sleep(max(prompt_tokens, 0) * self.prompt_latency + self.count_tokens(completion) * self.token_latency)
+
+  def generate_response(self, prompt, stop_token="<|im_end|>", prefix=None, max_tokens=200, **kwargs):
+    completion = self.completion_for(prompt)
+    self.simulate_latency(prompt, completion, prefix)
+    return completion
+
+  def stream_response(self, prompt, stop_token="<|im_end|>", prefix=None, max_tokens=200, **kwargs):
+    completion = self.completion_for(prompt)
+    self.simulate_latency(prompt, "", prefix)
+    for piece in re.findall(r'\S+\s*', completion):
+      time.sleep(self.count_tokens(piece) * self.token_latency)
+      yield piece
+
+  def generate_json(self, prompt, schema_json, max_tokens=400):
+    answer = self.answer_for(prompt)
+    if "tool" in answer:
+      completion = json.dumps({"tool": answer["tool"], "toolset": answer.get("toolset"), "arguments": answer.get("arguments", {})})
+    else:
+      completion = json.dumps({"tool": None, "toolset": None, "arguments": {}})
+    self.simulate_latency(prompt, completion)
+    return completion
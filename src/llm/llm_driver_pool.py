@@ -0,0 +1,309 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .abstract_llm_driver import AbstractLLMDriver, was_cancelled
+from ..tracing import get_tracer
+
+class Backend:
+    """
+    One driver of an LLMDriverPool, and what the pool has seen of it.
+    """
+
+    def __init__(self, driver, alpha=0.3):
+        self.driver = driver
+        self.name = f"{driver.name}:{getattr(driver, 'api_url', None) or getattr(driver, 'model_id', '')}"
+        self.alpha = alpha
+        self.in_flight = 0
+        # Moving average of the call latency in seconds, per method: a toolset
+        # decision and a personality rewrite take very different times
+        self.latencies = {}
+        self.failures = 0     # in a row
+        self.down_until = 0.0
+        self.healthy = True   # as of the last health check
+
+    def available(self, now):
+        return self.healthy and now >= self.down_until
+
+    def expected_latency(self, method_name, default_latency):
+        # Calls queue up behind the ones a backend is already working on
+        return (self.in_flight + 1) * self.latencies.get(method_name, default_latency)
+
+    def rank(self, now, method_name, default_latency):
+        # Available first, then fastest; on a tie, one we haven't timed yet gets a chance
+        return (not self.available(now), self.expected_latency(method_name, default_latency), method_name in self.latencies)
+
+    def succeeded(self, method_name, elapsed=None):
+        if elapsed is not None:
+            latency = self.latencies.get(method_name)
+            self.latencies[method_name] = elapsed if latency is None else self.alpha * elapsed + (1 - self.alpha) * latency
+        self.failures = 0
+        self.down_until = 0.0
+
+    def failed(self, backoff, max_backoff):
+        self.failures += 1
+        self.down_until = time.monotonic() + min(backoff * 2 ** (self.failures - 1), max_backoff)
+
+class LLMDriverPool(AbstractLLMDriver):
+    """
+    Fronts several drivers of the same model (e.g. a LocalLLMDriver and a
+    few OllamaLLMDriver endpoints) as one driver.
+
+    Each call goes to the backend expected to answer first: its moving
+    average latency for the method times the calls it already has in
+    flight. A call that hasn't finished by its hedging deadline is also sent
+    to the next best backend, the first answer wins and the other call is
+    cancelled (see AbstractLLMDriver.submit). A backend that raises is taken out
+    of rotation, for longer each time it fails in a row, and the call fails
+    over to the next one. A background thread health checks the backends
+    every `health_interval` seconds, so one that is loading or down gets no
+    calls until it is back.
+
+    Streams fail over only until their first piece. Embeddings always come
+    from the first driver, vectors from different backends don't compare.
+    """
+
+    def __init__(self, drivers, hedge_after=None, hedge_factor=2.0, min_hedge=0.25, max_hedges=1, default_latency=2.0, backoff=1.0, max_backoff=60.0, health_interval=10.0, debug=False):
+        super().__init__(name="Pool")
+        if not drivers:
+            raise ValueError("An LLMDriverPool needs at least one driver")
+        self.backends = [Backend(driver) for driver in drivers]
+        # A fixed hedging deadline in seconds, or None for hedge_factor times the backend's latency
+        self.hedge_after = hedge_after
+        self.hedge_factor = hedge_factor
+        self.min_hedge = min_hedge
+        self.max_hedges = max_hedges
+        self.default_latency = default_latency
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.health_interval = health_interval
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.calls = ThreadPoolExecutor(max_workers=8 * len(drivers), thread_name_prefix="llm-pool")
+        self.stopped = threading.Event()
+        if health_interval:
+            threading.Thread(target=self.check_health_loop, name="llm-pool-health", daemon=True).start()
+
+    @property
+    def primary(self):
+        return self.backends[0].driver
+
+    @property
+    def ready(self):
+        return any(getattr(backend.driver, 'ready', True) for backend in self.backends)
+
+    # ------------------------------------------------------------------
+    # Health and routing
+    # ------------------------------------------------------------------
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                healthy = bool(backend.driver.health_check())
+            except Exception:
+                healthy = False
+            if(self.debug and healthy != backend.healthy):
+                print(f"driver pool: {backend.name} is {'up' if healthy else 'down'}")
+            with self.lock:
+                backend.healthy = healthy
+                if healthy and backend.failures:
+                    # Back up: give it a call again straight away
+                    backend.down_until = 0.0
+
+    def check_health_loop(self):
+        while True:
+            self.check_health()
+            if self.stopped.wait(self.health_interval):
+                return
+
+    def ranked(self, method_name, exclude=()):
+        """
+        The backends not in `exclude`, best first for the method. Unavailable
+        ones come last, so a call still goes somewhere when they are all down.
+        """
+        now = time.monotonic()
+        with self.lock:
+            # Backends we haven't timed yet are assumed as fast as the fastest one
+            default_latency = self.best_latency(now, method_name)
+            backends = [backend for backend in self.backends if backend not in exclude]
+            return sorted(backends, key=lambda backend: backend.rank(now, method_name, default_latency))
+
+    def best_latency(self, now, method_name):
+        latencies = [backend.latencies[method_name] for backend in self.backends if method_name in backend.latencies and backend.available(now)]
+        return min(latencies) if latencies else self.default_latency
+
+    def deadline(self, method_name):
+        """
+        How long a call may take before it is hedged: a multiple of the
+        latency of the fastest backend, so a backend that is slow or busy
+        doesn't set its own deadline.
+        """
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self.lock:
+            latency = self.best_latency(time.monotonic(), method_name)
+        return max(self.min_hedge, self.hedge_factor * latency)
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    def start(self, backend, method_name, args, kwargs):
+        with self.lock:
+            backend.in_flight += 1
+        start = time.perf_counter()
+        # Through the driver's submit, so cancelling the future aborts the call if the driver can
+        future = backend.driver.submit(method_name, *args, executor=self.calls, **kwargs)
+        future.add_done_callback(lambda future: self.finished(backend, method_name, time.perf_counter() - start, future))
+        return future
+
+    def finished(self, backend, method_name, elapsed, future):
+        with self.lock:
+            backend.in_flight -= 1
+        # A cancelled call says nothing about the backend, even if it still finished
+        if was_cancelled(future):
+            return
+        error = future.exception()
+        if error is not None:
+            if(self.debug):
+                print(f"driver pool: {backend.name} failed {method_name}: {error}")
+            with self.lock:
+                backend.failed(self.backoff, self.max_backoff)
+            return
+        with self.lock:
+            backend.succeeded(method_name, elapsed)
+
+    def call(self, method_name, *args, **kwargs):
+        """
+        Runs `<driver>.<method_name>(*args, **kwargs)` on the best backend,
+        hedging and failing over as needed, and returns the first answer.
+        """
+        with get_tracer().span("driver_pool", method=method_name) as span:
+            tried = []
+            running = {}  # future -> backend
+            hedges = 0
+            error = None
+            started_at = 0.0
+            while True:
+                if not running:
+                    candidates = self.ranked(method_name, exclude=tried)
+                    if not candidates:
+                        span.set(attempts=len(tried))
+                        raise error
+                    backend = candidates[0]
+                    tried.append(backend)
+                    running[self.start(backend, method_name, args, kwargs)] = backend
+                    started_at = time.monotonic()
+
+                timeout = None
+                hedge_to = None
+                if hedges < self.max_hedges:
+                    candidates = self.ranked(method_name, exclude=tried)
+                    if candidates and candidates[0].available(time.monotonic()):
+                        hedge_to = candidates[0]
+                        timeout = max(0.0, started_at + self.deadline(method_name) - time.monotonic())
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Slow: send the same call to the next best backend as well
+                    hedges += 1
+                    if(self.debug):
+                        print(f"driver pool: hedging {method_name} on {hedge_to.name}")
+                    tried.append(hedge_to)
+                    running[self.start(hedge_to, method_name, args, kwargs)] = hedge_to
+                    started_at = time.monotonic()
+                    continue
+
+                for future in done:
+                    backend = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    # The losers would only hold up their backends (a local one keeps the model locked)
+                    for loser in running:
+                        loser.cancel()
+                    span.set(backend=backend.name, attempts=len(tried), hedged=hedges > 0)
+                    return result
+
+    def stream(self, method_name, *args, **kwargs):
+        """
+        Streams `<driver>.<method_name>(*args, **kwargs)` from the best backend.
+        A backend that fails before its first piece is replaced by the next one.
+        """
+        error = None
+        for backend in self.ranked(method_name):
+            with self.lock:
+                backend.in_flight += 1
+            started = False
+            try:
+                for piece in getattr(backend.driver, method_name)(*args, **kwargs):
+                    started = True
+                    yield piece
+                with self.lock:
+                    backend.succeeded(method_name)
+                return
+            except Exception as e:
+                with self.lock:
+                    backend.failed(self.backoff, self.max_backoff)
+                if started:
+                    raise
+                error = e
+            finally:
+                with self.lock:
+                    backend.in_flight -= 1
+        raise error
+
+    def generate_response(self, text, **kwargs):
+        return self.call('generate_response', text, **kwargs)
+
+    def stream_response(self, text, **kwargs):
+        return self.stream('stream_response', text, **kwargs)
+
+    def generate_response_in_format(self, prompt, **kwargs):
+        return self.call('generate_response_in_format', prompt, **kwargs)
+
+    def generate_json(self, prompt, schema_json, **kwargs):
+        return self.call('generate_json', prompt, schema_json, **kwargs)
+
+    def decide_toolset(self, toolsets, query, context):
+        return self.call('decide_toolset', toolsets, query, context)
+
+    def decide_tool(self, toolset, query, context):
+        return self.call('decide_tool', toolset, query, context)
+
+    def decide_arguments(self, tool_code, query, context):
+        return self.call('decide_arguments', tool_code, query, context)
+
+    def decide_tool_and_arguments(self, tools, query, context):
+        return self.call('decide_tool_and_arguments', tools, query, context)
+
+    def personality(self, text, query, context):
+        return self.call('personality', text, query, context)
+
+    def personality_stream(self, text, query, context, by_sentence=True):
+        return self.stream('personality_stream', text, query, context, by_sentence=by_sentence)
+
+    def health_check(self):
+        return any(backend.healthy for backend in self.backends)
+
+    def count_tokens(self, text):
+        return self.primary.count_tokens(text)
+
+    def embed(self, texts):
+        return self.primary.embed(texts)
+
+    def close(self):
+        self.stopped.set()
+        self.calls.shutdown(wait=False, cancel_futures=True)
+        for backend in self.backends:
+            if hasattr(backend.driver, 'close'):
+                backend.driver.close()
+
+    def __getattr__(self, attribute):
+        # Anything else (the model handle, signatures, prompts...) comes from the first driver
+        backends = self.__dict__.get('backends')
+        if not backends:
+            raise AttributeError(attribute)
+        return getattr(backends[0].driver, attribute)
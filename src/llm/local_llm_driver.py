@@ -1,11 +1,17 @@
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaGrammar
+import llama_cpp
 import os
 import sys
+import time
 from contextlib import contextmanager
-import json
-import re
+from concurrent.futures import CancelledError
+import threading
 
-from .abstract_llm_driver import AbstractLLMDriver
+from .abstract_llm_driver import call_cancelled
+from .chatml_llm_driver import ChatMLLLMDriver, TOOLSET_PROMPT_PREFIX
+from .prefix_cache import PrefixCache
+from .model_manager import get_model_manager, default_threads, context_size_for
+from ..tracing import get_tracer
 
 @contextmanager
 def suppress_output():
@@ -17,154 +23,223 @@ def suppress_output():
     finally:
       sys.stderr = original_stderr
 
-class LocalLLMDriver(AbstractLLMDriver):
-  def __init__(self, model_file="models/capybarahermes-2.5-mistral-7b.Q4_K_M.gguf"):
+def load_llama(model_file, **params):
+  with suppress_output():
+    return Llama(
+      model_path=model_file,  # Download the model file first
+      verbose=False,
+      **params
+    )
+
+def llama_timings(llm):
+  """
+  llama.cpp's cumulative (prompt eval ms, decode ms) for the model's context,
+  or None if this llama-cpp-python version doesn't expose them.
+  """
+  try:
+    if hasattr(llama_cpp, 'llama_perf_context'):
+      timings = llama_cpp.llama_perf_context(llm.ctx)
+    else:
+      timings = llama_cpp.llama_get_timings(llm.ctx)
+    return timings.t_p_eval_ms, timings.t_eval_ms
+  except Exception:
+    return None
+
+def stop_if_cancelled():
+  """
+  Stopping criteria ending a generation whose submitted call was cancelled
+  (e.g. the loser of a hedged call), so it doesn't hold the model lock.
+  """
+  return llama_cpp.StoppingCriteriaList([lambda input_ids, logits: call_cancelled()])
+
+def check_cancelled():
+  if call_cancelled():
+    raise CancelledError()
+
+def trace_timings(span, before, after):
+  if before is not None and after is not None:
+    span.set(prompt_eval_ms=round(after[0] - before[0], 1), decode_ms=round(after[1] - before[1], 1))
+
+class LocalLLMDriver(ChatMLLLMDriver):
+  def __init__(self, model_file="models/capybarahermes-2.5-mistral-7b.Q4_K_M.gguf", prefix_cache_bytes=1024 * 1024 * 1024, embedding_model_file=None, n_ctx=None, n_threads=None, n_gpu_layers=35, prompt_token_budget=2048, background=False):
+    """
+    The model is loaded through the process-wide model manager, so drivers for
+    the same model share one instance. With `background` the constructor
+    returns straight away and the model loads (and warms up) on a thread;
+    the first call that needs it waits for it.
+    n_ctx defaults to what our largest prompt needs given `prompt_token_budget`,
+    and n_threads to the number of physical cores.
+    """
     super().__init__(
       name="Local"
     )
-    with suppress_output():
-      self.llm = Llama(
-        model_path=model_file,  # Download the model file first
-        n_ctx=32768,  # The max sequence length to use - note that longer sequence lengths require much more resources
-        n_threads=8,            # The number of CPU threads to use, tailor to your system and the resulting performance
-        n_gpu_layers=35,         # The number of layers to offload to GPU, if you have GPU acceleration available
-        verbose=False
-      )
+    self.model_id = os.path.basename(model_file)
+    # Embeddings need a model loaded in embedding mode, it is only loaded when first used
+    self.embedding_model_file = embedding_model_file or model_file
+    self.embedding_handle = None
+    # Compiled GBNF grammars, by JSON schema
+    self.grammars = {}
+    self.n_threads = n_threads or default_threads()
+    self.n_gpu_layers = n_gpu_layers
+    self.prefix_cache_bytes = prefix_cache_bytes
+    # Tool output and context are cut down to it, so every prompt fits in n_ctx
+    self.prompt_token_budget = prompt_token_budget
+    self.handle = get_model_manager().load(
+      load_llama,
+      model_file,
+      background=background,
+      n_ctx=n_ctx or context_size_for(prompt_token_budget),  # The max sequence length to use - longer sequence lengths require much more resources
+      n_threads=self.n_threads,            # The number of CPU threads to use
+      n_gpu_layers=n_gpu_layers,         # The number of layers to offload to GPU, if you have GPU acceleration available
+    )
+    # llama.cpp state is not thread safe, one generation at a time (per shared model)
+    self.lock = self.handle.lock
+    if background:
+      threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+    else:
+      self.handle.get()
 
-  def generate_response_in_format(self,prompt,system="You are a helpful assistant.",assistant_preface=""):
-    text = f"""
-<|im_start|>system
-{system}<|im_end|>
-<|im_start|>user
-{prompt}<|im_end|>
-<|im_start|>assistant
-{assistant_preface}"""
-    return self.generate_response(text)
-  
-  def generate_response(self, prompt, stop_token="<|im_end|>"):
-    with suppress_output():
-      output = self.llm(
-        prompt,
-        max_tokens=200,
-        temperature=0,
-        stop=[stop_token],
-        echo=False,        # Whether to echo the prompt
-      )
-    return output['choices'][0]['text']
-  
-  def decide_toolset(self, toolsets, query, context):
-      prompt = f"""<|im_start|>system
-A helpful toolset-choosing assistant chooses the correct toolset given the context and user query.<|im_end|>
-<|im_start|>user
-Toolsets: pantheon, financial, commpro
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: clear the caches<|im_end|>
-<|im_start|>assistant
-(pantheon)<|im_end|>
-<|im_start|>user
-Toolsets: pantheon, financial, commpro
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: convert 100USD to CAD please<|im_end|>
-<|im_start|>assistant
-(financial)<|im_end|>
-<|im_start|>user
-Toolsets: {toolsets}
-Context: {context}
-User query: {query}<|im_end|>
-<|im_start|>assistant
-("""
-  
-      # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-      llm_response = self.generate_response(prompt, stop_token=")")
-      # Assuming generate_response will return a string response containing the name of the best toolset
-      recommended_toolset = llm_response.strip()
-  
-      # If the recommended toolset is one of the provided toolsets, return it
-      if recommended_toolset in toolsets:
-          return recommended_toolset
+  @property
+  def llm(self):
+    return self.handle.get()
+
+  @property
+  def ready(self):
+    """
+    Whether the model has finished loading.
+    """
+    return self.handle.ready
+
+  def health_check(self):
+    # Calls made while the model loads would wait for it
+    return self.ready
+
+  @property
+  def prefix_cache(self):
+    # Snapshots of the static prompt prefixes, so only the dynamic part is evaluated per call
+    if not self.prefix_cache_bytes:
       return None
-  
-  def decide_tool(self, toolset_code, query, context):
-    #the toolset_code is a string that contains the code of all tool objects in the toolset
-    class_name = False
-    #todo: use self.generate_response(text_prompt) to ask the llm which tool in the given code is most appropriate given the user's query and the context content
-    prompt = f"""<|im_start|>system
-A helpful tool-choosing assistant chooses the correct tool (if any), given the context and user query.
-Tool classes:
-{toolset_code}<|im_end|>
-<|im_start|>user
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: clear the caches<|im_end|>
-<|im_start|>assistant
-(ClearCachesTool)<|im_end|>
-<|im_start|>user
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: convert 100USD to CAD please<|im_end|>
-<|im_start|>assistant
-(CurrencyConverterTool)<|im_end|>
-<|im_start|>user
-Context: {context}
-User query: {query}<|im_end|>
-<|im_start|>assistant
-("""
-  
-    # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-    llm_response = self.generate_response(prompt, stop_token=")")
-    # Assuming generate_response will return a string response containing the name of the best toolset
-    class_name = llm_response.strip().replace('(', '').replace(')', '')
-  
-    return class_name
-  
-  def decide_arguments(self, tool_code, query, context):
-    prompt = f"""<|im_start|>system
-A helpful argument-filling assistant supplies the given tool with relevant arguments values, gleaned from the context and user query. arguments_gleaned_from_query_and_context only contains arguments that are known.
-Tool code: {tool_code}<|im_end|>
-<|im_start|>user
-Context: {context}
-User query: {query}
-<|im_end|>
-<|im_start|>assistant
-arguments_gleaned_from_query_and_context = {{"""
-    llm_response = self.generate_response(prompt, stop_token="}")
-    argument_values = self.parse_llm_response_to_dict(llm_response)
-    return argument_values
-
-  def parse_llm_response_to_dict(self, llm_response):
-    # Trim leading and trailing whitespace
-    llm_response = llm_response.strip()
-
-    # If initial parsing fails, attempt corrective measures
-    corrected_response = llm_response
-
-    # Replace single quotes with double quotes if necessary
-    if "'" in corrected_response:
-        corrected_response = corrected_response.replace("'", '"')
-
-    # Remove lines containing ": None", and remove Python comments if it's indeed necessary
-    corrected_response_lines = [re.sub(r'#.*$', '', line).strip() for line in corrected_response.split('\n') if ": None" not in line]
-    corrected_response = '\n'.join(corrected_response_lines)
-
-    # Attempt to parse again after corrections
+    with self.handle.lock:
+      if self.handle.prefix_cache is None:
+        self.handle.prefix_cache = PrefixCache(self.llm, max_bytes=self.prefix_cache_bytes)
+      return self.handle.prefix_cache
+
+  def warm_up(self, prefixes=(TOOLSET_PROMPT_PREFIX,)):
+    """
+    Waits for the model and evaluates the static prompt prefixes into the
+    prefix cache, so the first real query doesn't pay for them.
+    """
     try:
-        response_dict = json.loads(f"{{ {corrected_response} }}")
-        return response_dict
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON after corrections: {e}\{llm_response} -> {corrected_response}")
-        return None
-        
-  def personality(self, text, query, context):
-      prompt = f"""<|im_start|>system
-A personality translating machine gives personality to the output of a tool.
-Personality: Rewrite the tool output as a helpful programmer's assistant.
-<|im_start|>user
-Contextual information: {context}
-Original user query: {query}
-Tool output: {text}<|im_end|>
-<|im_start|>assistant
-Rewritten tool output with personality: """
-      prompt += '\"' #start the quote
+      self.handle.get()
+    except Exception as e:
+      print(f"Could not load the model: {e}")
+      return
+    if self.prefix_cache is None:
+      return
+    for prefix in prefixes:
+      with self.lock, suppress_output():
+        self.prefix_cache.warm(prefix)
+
+  def generate_response(self, prompt, stop_token="<|im_end|>", prefix=None, grammar=None, max_tokens=200):
+    """
+    Generates a completion for the prompt.
+    If `prefix` is given the prompt must start with it, and the model state
+    for the prefix is restored from the prefix cache instead of re-evaluated.
+    If `grammar` is given the output is constrained to it.
+    """
+    with get_tracer().span("generate_response", driver=self.name, grammar=grammar is not None) as span:
+      with self.lock, suppress_output():
+        # Cancelled while waiting for the model
+        check_cancelled()
+        if prefix and self.prefix_cache is not None and prompt.startswith(prefix):
+          span.set(prefix_cache_hit=self.prefix_cache.restore(prefix))
+        before = llama_timings(self.llm)
+        output = self.llm(
+          prompt,
+          max_tokens=max_tokens,
+          temperature=0,
+          stop=[stop_token],
+          echo=False,        # Whether to echo the prompt
+          grammar=grammar,
+          stopping_criteria=stop_if_cancelled(),
+        )
+        trace_timings(span, before, llama_timings(self.llm))
+      check_cancelled()
+      usage = output.get('usage', {})
+      span.set(prompt_tokens=usage.get('prompt_tokens'), generated_tokens=usage.get('completion_tokens'))
+    return output['choices'][0]['text']
   
-      # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-      llm_response = self.generate_response(prompt, stop_token='"')
-      # Assuming generate_response will return a string response containing the name of the best toolset
-      return llm_response
+  def stream_response(self, prompt, stop_token="<|im_end|>", prefix=None, max_tokens=200):
+    """
+    Like generate_response, but yields the text piece by piece as it is generated.
+    The model is locked until the generator is exhausted or closed.
+    """
+    tracer = get_tracer()
+    span = tracer.start_span("stream_response", driver=self.name)
+    generated_tokens = 0
+    try:
+      with self.lock:
+        check_cancelled()
+        with suppress_output():
+          if prefix and self.prefix_cache is not None and prompt.startswith(prefix):
+            span.set(prefix_cache_hit=self.prefix_cache.restore(prefix))
+          before = llama_timings(self.llm)
+          stream = self.llm(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=0,
+            stop=[stop_token],
+            echo=False,
+            stream=True,
+            stopping_criteria=stop_if_cancelled(),
+          )
+        for output in stream:
+          if generated_tokens == 0:
+            span.set(first_token_ms=round((time.perf_counter() - span.start) * 1000, 1))
+          generated_tokens += 1
+          yield output['choices'][0]['text']
+        trace_timings(span, before, llama_timings(self.llm))
+    finally:
+      if tracer.enabled:
+        span.set(prompt_tokens=self.count_tokens(prompt), generated_tokens=generated_tokens)
+      tracer.finish(span)
+
+  def batch(self, method_name, calls):
+    """
+    Not a batched decode: llama-cpp-python's Llama runs one sequence at a
+    time, so the calls are generated one after the other on this thread
+    rather than queueing on the model lock. What a batch saves is the
+    static prompt prefix (every toolset decision, the tool decisions for
+    one toolset), which is only evaluated once thanks to the prefix cache.
+    """
+    method = getattr(self, method_name)
+    return [method(*args) for args in calls]
+
+  def count_tokens(self, text):
+    return len(self.llm.tokenize(text.encode('utf-8'), add_bos=False))
+
+  def get_grammar(self, schema_json):
+    if schema_json not in self.grammars:
+      with suppress_output():
+        self.grammars[schema_json] = LlamaGrammar.from_json_schema(schema_json, verbose=False)
+    return self.grammars[schema_json]
+
+  def generate_json(self, prompt, schema_json, max_tokens=400):
+    grammar = self.get_grammar(schema_json)
+    return self.generate_response(prompt, stop_token="<|im_end|>", grammar=grammar, max_tokens=max_tokens)
+
+  def embed(self, texts):
+    if self.embedding_handle is None:
+      self.embedding_handle = get_model_manager().load(
+        load_llama,
+        self.embedding_model_file,
+        background=False,
+        embedding=True,
+        n_ctx=2048,
+        n_threads=self.n_threads,
+        n_gpu_layers=self.n_gpu_layers,
+      )
+    embedding_llm = self.embedding_handle.get()
+    with self.embedding_handle.lock, suppress_output():
+      output = embedding_llm.create_embedding(list(texts))
+    return [item['embedding'] for item in output['data']]
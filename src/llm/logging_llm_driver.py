@@ -0,0 +1,103 @@
+from .abstract_llm_driver import AbstractLLMDriver, chain, was_cancelled
+from .decision_log import DecisionLog
+
+def same(candidates):
+    return candidates
+
+# The decisions we log, with how to record the candidates offered to the model
+LOGGED = {
+    'decide_toolset': list,
+    'decide_tool': same,
+    'decide_arguments': same,
+    'decide_tool_and_arguments': same,
+}
+
+class LoggingLLMDriver(AbstractLLMDriver):
+    """
+    Wraps another LLM driver and logs the input and output of every
+    decide_toolset, decide_tool, decide_arguments and decide_tool_and_arguments
+    call to a DecisionLog. Put it outside a CachedLLMDriver to also log the
+    cached answers. Everything else is the wrapped driver's.
+    """
+
+    def __init__(self, driver, log=None, debug=False):
+        super().__init__(name=driver.name)
+        self.driver = driver
+        self.log = log if log is not None else DecisionLog()
+        self.debug = debug
+
+    def model_id(self):
+        model_id = getattr(self.driver, 'model_id', '')
+        # A wrapped CachedLLMDriver already names its driver and model
+        if callable(model_id):
+            return model_id()
+        return f"{self.driver.name}:{model_id}"
+
+    def logged(self, kind, candidates, query, context, response):
+        try:
+            self.log.append(kind, self.model_id(), query, context, candidates, response)
+        except Exception as e:
+            # Losing a row is better than losing the answer
+            print(f"Could not log the {kind} decision: {e}")
+        return response
+
+    def log_result(self, method_name, args, future):
+        # A cancelled speculative decision isn't the model's answer
+        if was_cancelled(future) or future.exception() is not None:
+            return
+        candidates, query, context = args
+        self.logged(method_name, LOGGED[method_name](candidates), query, context, future.result())
+
+    def generate_response(self, text, **kwargs):
+        return self.driver.generate_response(text, **kwargs)
+
+    def stream_response(self, text, **kwargs):
+        return self.driver.stream_response(text, **kwargs)
+
+    def count_tokens(self, text):
+        return self.driver.count_tokens(text)
+
+    def embed(self, texts):
+        return self.driver.embed(texts)
+
+    def health_check(self):
+        return self.driver.health_check()
+
+    def submit(self, method_name, *args, executor=None, **kwargs):
+        """
+        Submits to the wrapped driver, so cancelling the future reaches it.
+        Decisions are logged before the future has their result.
+        """
+        future = self.driver.submit(method_name, *args, executor=executor, **kwargs)
+        if method_name not in LOGGED:
+            return future
+        return chain(future, lambda future: self.log_result(method_name, args, future))
+
+    def batch(self, method_name, calls):
+        if method_name in LOGGED:
+            # One submit per call, so each decision is logged
+            return super().batch(method_name, calls)
+        return self.driver.batch(method_name, calls)
+
+    def decide_toolset(self, toolsets, query, context):
+        return self.logged('decide_toolset', list(toolsets), query, context,
+            self.driver.decide_toolset(toolsets, query, context))
+
+    def decide_tool(self, toolset, query, context):
+        return self.logged('decide_tool', toolset, query, context,
+            self.driver.decide_tool(toolset, query, context))
+
+    def decide_arguments(self, tool_code, query, context):
+        return self.logged('decide_arguments', tool_code, query, context,
+            self.driver.decide_arguments(tool_code, query, context))
+
+    def decide_tool_and_arguments(self, tools, query, context):
+        return self.logged('decide_tool_and_arguments', tools, query, context,
+            self.driver.decide_tool_and_arguments(tools, query, context))
+
+    def __getattr__(self, attribute):
+        # Anything else (personality, prompts, uncached_driver...) goes straight to the wrapped driver
+        driver = self.__dict__.get('driver')
+        if driver is None:
+            raise AttributeError(attribute)
+        return getattr(driver, attribute)
@@ -0,0 +1,99 @@
+import os
+import threading
+
+def default_threads():
+    """
+    Number of threads for llama.cpp. It runs best on physical cores, and
+    os.cpu_count() counts hyperthreads, so on larger machines we use half.
+    """
+    count = os.cpu_count() or 1
+    return count // 2 if count > 4 else count
+
+def context_size_for(prompt_token_budget, max_tokens=400, prompt_overhead=1024, step=512):
+    """
+    Smallest n_ctx (rounded up to `step`) that fits our largest prompt:
+    the fixed instructions and few-shot examples, the budgeted part
+    (tool signatures, context) and the generated tokens.
+    """
+    needed = prompt_overhead + prompt_token_budget + max_tokens
+    return ((needed + step - 1) // step) * step
+
+class ModelHandle:
+    """
+    A model that is loading, or loaded, in the background.
+    Drivers sharing the model also share its lock and prefix cache, since
+    llama.cpp state belongs to the model instance.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.llm = None
+        self.error = None
+        self.loaded = threading.Event()
+        # Re-entrant, the prefix cache is created under it by calls already holding it
+        self.lock = threading.RLock()
+        self.prefix_cache = None
+
+    @property
+    def ready(self):
+        return self.loaded.is_set() and self.error is None
+
+    def get(self, timeout=None):
+        """
+        Waits for the model to be loaded and returns it.
+        """
+        if not self.loaded.wait(timeout):
+            raise TimeoutError(f"Model {self.key[0]} is still loading")
+        if self.error is not None:
+            raise self.error
+        return self.llm
+
+class ModelManager:
+    """
+    Loads each model once per process and shares it between drivers.
+    llama.cpp mmaps the model file, so loading is mostly page faults, which
+    we take on a background thread instead of blocking startup.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handles = {}
+
+    def load(self, load_model, model_file, background=True, **params):
+        """
+        Returns the handle for the model, starting to load it with
+        `load_model(model_file, **params)` if it isn't loaded or loading yet.
+        """
+        key = (os.path.realpath(model_file), tuple(sorted(params.items())))
+        with self.lock:
+            handle = self.handles.get(key)
+            if handle is not None:
+                return handle
+            handle = self.handles[key] = ModelHandle(key)
+
+        def run():
+            try:
+                handle.llm = load_model(model_file, **params)
+            except Exception as e:
+                handle.error = e
+                # Forget it, so the next load tries again instead of getting the error
+                with self.lock:
+                    if self.handles.get(key) is handle:
+                        del self.handles[key]
+            finally:
+                handle.loaded.set()
+
+        if background:
+            threading.Thread(target=run, name=f"load-{os.path.basename(model_file)}", daemon=True).start()
+        else:
+            run()
+        return handle
+
+    def unload(self, handle):
+        with self.lock:
+            self.handles.pop(handle.key, None)
+
+_model_manager = ModelManager()
+
+def get_model_manager():
+    return _model_manager
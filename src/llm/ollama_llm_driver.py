@@ -1,169 +1,303 @@
-import requests
-from .abstract_llm_driver import AbstractLLMDriver
+import json
+import time
+import queue
+import asyncio
+import threading
+import contextvars
 
-class OllamaLLMDriver(AbstractLLMDriver):
-  def __init__(self, api_url='http://localhost:11434'):
+import aiohttp
+
+from .chatml_llm_driver import ChatMLLLMDriver
+from .text_stream import async_sentence_chunks
+from ..tool.tool_schema import tool_choice_schema_json
+from ..tracing import get_tracer
+
+def held_back(text, stop_token):
+  """
+  Length of the longest ending of `text` that is the start of `stop_token`.
+  """
+  if not stop_token:
+    return 0
+  for length in range(min(len(stop_token) - 1, len(text)), 0, -1):
+    if stop_token.startswith(text[-length:]):
+      return length
+  return 0
+
+class OllamaLLMDriver(ChatMLLLMDriver):
+  """
+  Driver for a model served by Ollama (https://github.com/ollama/ollama).
+
+  Requests go through one aiohttp session, so connections to the server are
+  kept alive and reused. Responses are streamed and we stop reading as soon as
+  the stop token shows up. `keep_alive` keeps the model resident in Ollama
+  between requests.
+
+  Every decision has an `async` entry point (agenerate_response,
+  adecide_toolset, ...). The plain methods run those on a private event loop
+  thread, so the driver can also be used from synchronous code.
+  """
+
+  def __init__(self, api_url='http://localhost:11434', model='openhermes', keep_alive='30m', max_connections=4, timeout=120):
     super().__init__(name="Ollama")
-    self.api_url = api_url
+    self.api_url = api_url.rstrip('/')
+    self.model = model
+    self.model_id = model
+    self.keep_alive = keep_alive
+    self.max_connections = max_connections
+    self.timeout = timeout
+    self.session = None
+    self.session_loop = None
+    self.loop = None
+    self.loop_lock = threading.Lock()
+
+  # ------------------------------------------------------------------
+  # Event loop and HTTP session
+  # ------------------------------------------------------------------
+
+  def get_loop(self):
+    """
+    Returns the driver's event loop, starting its thread on first use.
+    """
+    with self.loop_lock:
+      if self.loop is None:
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="ollama-driver", daemon=True).start()
+      return self.loop
+
+  def start(self, coroutine):
+    """
+    Starts a coroutine on the driver's event loop and returns a
+    concurrent.futures.Future for its result; cancelling it cancels the
+    coroutine. It runs in a copy of the caller's context, so tracing spans
+    nest under the caller's.
+    """
+    loop = self.get_loop()
+    context = contextvars.copy_context()
+
+    async def in_context():
+      # A task of its own, which runs in the context it is created in
+      return await context.run(loop.create_task, coroutine)
+    return asyncio.run_coroutine_threadsafe(in_context(), loop)
+
+  def run(self, coroutine):
+    """
+    Runs a coroutine on the driver's event loop and waits for the result.
+    """
+    return self.start(coroutine).result()
 
-  def generate_response(self, prompt, max_tokens=200, temperature=0, stop_token=""):
-    # Construct the API request payload
+  async def get_session(self):
+    # Sessions are bound to the loop they are created on, so sync and async callers
+    # each get one; in practice a process uses one or the other.
+    loop = asyncio.get_running_loop()
+    if self.session is None or self.session.closed or self.session_loop is not loop:
+      connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=300)
+      self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+      self.session_loop = loop
+    return self.session
+
+  async def aclose(self):
+    if self.session is not None and not self.session.closed:
+      await self.session.close()
+
+  def close(self):
+    if self.loop is not None:
+      self.run(self.aclose())
+      self.loop.call_soon_threadsafe(self.loop.stop)
+      self.loop = None
+
+  async def ahealth_check(self):
+    try:
+      session = await self.get_session()
+      async with session.get(f"{self.api_url}/api/tags", timeout=aiohttp.ClientTimeout(total=5)) as response:
+        return response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+      return False
+
+  def health_check(self):
+    return self.run(self.ahealth_check())
+
+  # ------------------------------------------------------------------
+  # Generation
+  # ------------------------------------------------------------------
+
+  def payload(self, prompt, stop_token, max_tokens, format=None):
     payload = {
+      "model": self.model,
       "prompt": prompt,
-      "max_tokens": max_tokens,
-      "temperature": temperature,
-      "stop": stop_token,
+      "raw": True,  # our prompts are already in the model's ChatML format
+      "stream": True,
+      "keep_alive": self.keep_alive,
+      "options": {
+        "temperature": 0,
+        "num_predict": max_tokens,
+        "stop": [stop_token] if stop_token else [],
+      },
     }
-    # Send a POST request to the Ollama API endpoint
-    response = requests.post(f"{self.api_url}/generate", json=payload)
-    
-    if response.status_code == 200:
-      # Parse the response from the API
-      response_data = response.json()
-      return response_data['choices'][0]['text']
-    else:
-      # Handle error or unsuccessful request
-      print(f"Error: Received status code {response.status_code} from Ollama API")
-      return None
+    if format is not None:
+      payload["format"] = format
+    return payload
 
-    # The other methods (decide_toolset, decide_tool, decide_arguments, parse_llm_response_to_dict, personality)
-    # would similarly need to call self.generate_response, perhaps with slight adjustments
-    # to their implementation to accommodate any specific requirements or differences in how
-    # the Ollama API handles prompts, arguments, etc.
-
-  def generate_response_in_format(self,prompt,system="You are a helpful assistant.",assistant_preface=""):
-    text = f"""
-<|im_start|>system
-{system}<|im_end|>
-<|im_start|>user
-{prompt}<|im_end|>
-<|im_start|>assistant
-{assistant_preface}"""
-    return self.generate_response(text)
-  
-  def generate_response(self, prompt, stop_token="<|im_end|>"):
-    output = self.llm(
-      prompt,
-      max_tokens=200,
-      temperature=0,
-      stop=[stop_token],
-      echo=False,        # Whether to echo the prompt
-    )
-    return output['choices'][0]['text']
-  
-  def decide_toolset(self, toolsets, query, context):
-      prompt = f"""<|im_start|>system
-A helpful toolset-choosing assistant chooses the correct toolset given the context and user query.<|im_end|>
-<|im_start|>user
-Toolsets: pantheon, financial, commpro
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: clear the caches<|im_end|>
-<|im_start|>assistant
-(pantheon)<|im_end|>
-<|im_start|>user
-Toolsets: pantheon, financial, commpro
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: convert 100USD to CAD please<|im_end|>
-<|im_start|>assistant
-(financial)<|im_end|>
-<|im_start|>user
-Toolsets: {toolsets}
-Context: {context}
-User query: {query}<|im_end|>
-<|im_start|>assistant
-("""
-  
-      # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-      llm_response = self.generate_response(prompt, stop_token=")")
-      # Assuming generate_response will return a string response containing the name of the best toolset
-      recommended_toolset = llm_response.strip()
-  
-      # If the recommended toolset is one of the provided toolsets, return it
-      if recommended_toolset in toolsets:
-          return recommended_toolset
-      return None
-  
-  def decide_tool(self, toolset_code, query, context):
-    #the toolset_code is a string that contains the code of all tool objects in the toolset
-    class_name = False
-    #todo: use self.generate_response(text_prompt) to ask the llm which tool in the given code is most appropriate given the user's query and the context content
-    prompt = f"""<|im_start|>system
-A helpful tool-choosing assistant chooses the correct tool (if any), given the context and user query.
-Tool classes:
-{toolset_code}<|im_end|>
-<|im_start|>user
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: clear the caches<|im_end|>
-<|im_start|>assistant
-(ClearCachesTool)<|im_end|>
-<|im_start|>user
-Context: i'm working on pantheon, on the abc-123 site. I'm on the dev2 environment.
-User query: convert 100USD to CAD please<|im_end|>
-<|im_start|>assistant
-(CurrencyConverterTool)<|im_end|>
-<|im_start|>user
-Context: {context}
-User query: {query}<|im_end|>
-<|im_start|>assistant
-("""
-  
-    # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-    llm_response = self.generate_response(prompt, stop_token=")")
-    # Assuming generate_response will return a string response containing the name of the best toolset
-    class_name = llm_response.strip().replace('(', '').replace(')', '')
-  
-    return class_name
-  
-  def decide_arguments(self, tool_code, query, context):
-    prompt = f"""<|im_start|>system
-A helpful argument-filling assistant supplies the given tool with relevant arguments values, gleaned from the context and user query. arguments_gleaned_from_query_and_context only contains arguments that are known.
-Tool code: {tool_code}<|im_end|>
-<|im_start|>user
-Context: {context}
-User query: {query}
-<|im_end|>
-<|im_start|>assistant
-arguments_gleaned_from_query_and_context = {{"""
-    llm_response = self.generate_response(prompt, stop_token="}")
-    argument_values = self.parse_llm_response_to_dict(llm_response)
-    return argument_values
-
-  def parse_llm_response_to_dict(self, llm_response):
-    # Trim leading and trailing whitespace
-    llm_response = llm_response.strip()
-
-    # If initial parsing fails, attempt corrective measures
-    corrected_response = llm_response
-
-    # Replace single quotes with double quotes if necessary
-    if "'" in corrected_response:
-        corrected_response = corrected_response.replace("'", '"')
-
-    # Remove lines containing ": None", and remove Python comments if it's indeed necessary
-    corrected_response_lines = [re.sub(r'#.*$', '', line).strip() for line in corrected_response.split('\n') if ": None" not in line]
-    corrected_response = '\n'.join(corrected_response_lines)
-
-    # Attempt to parse again after corrections
+  async def astream_response(self, prompt, stop_token="<|im_end|>", max_tokens=200, format=None):
+    """
+    Yields the response text as it is generated, up to (not including) the stop token.
+    """
+    tracer = get_tracer()
+    span = tracer.start_span("generate_response", driver=self.name, model=self.model)
     try:
-        response_dict = json.loads(f"{{ {corrected_response} }}")
-        return response_dict
+      session = await self.get_session()
+      async with session.post(f"{self.api_url}/api/generate", json=self.payload(prompt, stop_token, max_tokens, format)) as response:
+        if response.status != 200:
+          body = await response.text()
+          raise RuntimeError(f"Error: Received status code {response.status} from Ollama API: {body}")
+        text = ""
+        sent = 0  # how much of the text has been yielded
+        async for line in response.content:
+          if not line.strip():
+            continue
+          chunk = json.loads(line)
+          if "error" in chunk:
+            raise RuntimeError(f"Error from Ollama API: {chunk['error']}")
+          if not text and "first_token_ms" not in span.attributes:
+            span.set(first_token_ms=round((time.perf_counter() - span.start) * 1000, 1))
+          text += chunk.get("response", "")
+          if stop_token and stop_token in text:
+            # Stop reading as soon as the stop token shows up, closing the
+            # response also tells Ollama to stop generating
+            if text.index(stop_token) > sent:
+              yield text[sent:text.index(stop_token)]
+            return
+          if chunk.get("done"):
+            if len(text) > sent:
+              yield text[sent:]
+            # The last chunk has Ollama's own counts and timings (in nanoseconds)
+            span.set(
+              prompt_tokens=chunk.get("prompt_eval_count"),
+              generated_tokens=chunk.get("eval_count"),
+              prompt_eval_ms=round(chunk.get("prompt_eval_duration", 0) / 1e6, 1),
+              decode_ms=round(chunk.get("eval_duration", 0) / 1e6, 1),
+            )
+            return
+          # Hold back an ending that could be the start of a stop token split across chunks
+          end = len(text) - held_back(text, stop_token)
+          if end > sent:
+            yield text[sent:end]
+            sent = end
+        if len(text) > sent:
+          yield text[sent:]
+    except Exception as e:
+      span.error = f"{type(e).__name__}: {e}"
+      raise
+    finally:
+      tracer.finish(span)
+
+  async def agenerate_response(self, prompt, stop_token="<|im_end|>", max_tokens=200, format=None, prefix=None):
+    # Ollama reuses the KV cache for a shared prompt prefix itself, `prefix` is only
+    # accepted for compatibility with the other drivers
+    pieces = []
+    async for piece in self.astream_response(prompt, stop_token=stop_token, max_tokens=max_tokens, format=format):
+      pieces.append(piece)
+    return "".join(pieces)
+
+  def generate_response(self, prompt, stop_token="<|im_end|>", prefix=None, max_tokens=200, format=None):
+    return self.run(self.agenerate_response(prompt, stop_token=stop_token, max_tokens=max_tokens, format=format))
+
+  def stream_response(self, prompt, stop_token="<|im_end|>", prefix=None, max_tokens=200, format=None):
+    """
+    Yields the response piece by piece, streamed from the driver's event loop.
+    """
+    pieces = queue.Queue()
+    done = object()
+
+    async def pump():
+      try:
+        async for piece in self.astream_response(prompt, stop_token=stop_token, max_tokens=max_tokens, format=format):
+          pieces.put(piece)
+      except Exception as e:
+        pieces.put(e)
+      finally:
+        pieces.put(done)
+
+    future = self.start(pump())
+    try:
+      while True:
+        piece = pieces.get()
+        if piece is done:
+          return
+        if isinstance(piece, Exception):
+          raise piece
+        yield piece
+    finally:
+      # The consumer stopped early, stop the request too
+      future.cancel()
+
+  def generate_json(self, prompt, schema_json, max_tokens=400):
+    return self.run(self.agenerate_json(prompt, schema_json, max_tokens))
+
+  async def agenerate_json(self, prompt, schema_json, max_tokens=400):
+    # Ollama accepts a JSON schema as the format for structured output
+    return await self.agenerate_response(prompt, stop_token="<|im_end|>", max_tokens=max_tokens, format=json.loads(schema_json))
+
+  # ------------------------------------------------------------------
+  # Async decisions, sharing the prompts of ChatMLLLMDriver
+  # ------------------------------------------------------------------
+
+  async def adecide_toolset(self, toolsets, query, context):
+    prompt, _ = self.toolset_prompt(toolsets, query, context)
+    return self.parse_toolset(await self.agenerate_response(prompt, stop_token=")"), toolsets)
+
+  async def adecide_tool(self, toolset_code, query, context):
+    prompt, _ = self.tool_prompt(toolset_code, query, context)
+    return self.parse_tool(await self.agenerate_response(prompt, stop_token=")"))
+
+  async def adecide_arguments(self, tool_code, query, context):
+    # Ollama's json format constrains the whole answer to be a JSON object,
+    # so the answer isn't started with "{" for the model
+    prompt = self.arguments_prompt(tool_code, query, context, open_brace=False)
+    llm_response = await self.agenerate_response(prompt, stop_token="<|im_end|>", format="json")
+    try:
+      return json.loads(llm_response)
     except json.JSONDecodeError as e:
-        print(f"Error parsing JSON after corrections: {e}\{llm_response} -> {corrected_response}")
-        return None
-        
-  def personality(self, text, query, context):
-      prompt = f"""<|im_start|>system
-A personality translating machine gives personality to the output of a tool.
-Personality: Rewrite the tool output as a helpful programmer's assistant.
-<|im_start|>user
-Contextual information: {context}
-Original user query: {query}
-Tool output: {text}<|im_end|>
-<|im_start|>assistant
-Rewritten tool output with personality:
-"""
-  
-      # Ask the LLM to generate a response based on the prompt to get the toolset recommendation
-      llm_response = self.generate_response(prompt, stop_token='"')
-      # Assuming generate_response will return a string response containing the name of the best toolset
-      return llm_response
+      print(f"Error parsing JSON: {e}\n{llm_response}")
+      return None
+
+  async def adecide_tool_and_arguments(self, tools, query, context):
+    prompt = self.tool_and_arguments_prompt(tools, query, context)
+    return self.parse_tool_and_arguments(await self.agenerate_json(prompt, tool_choice_schema_json(tools)))
+
+  async def apersonality(self, text, query, context):
+    return await self.agenerate_response(self.personality_prompt(text, query, context), stop_token='"')
+
+  def apersonality_stream(self, text, query, context, by_sentence=True):
+    """
+    Async iterator over the rewritten text, by sentence or by token.
+    """
+    pieces = self.astream_response(self.personality_prompt(text, query, context), stop_token='"')
+    return async_sentence_chunks(pieces) if by_sentence else pieces
+
+  def decide_arguments(self, tool_code, query, context):
+    return self.run(self.adecide_arguments(tool_code, query, context))
+
+  def batch(self, method_name, calls):
+    """
+    Sends all the calls at once on the driver's event loop, up to
+    `max_connections` in flight. Ollama decodes them in parallel when the
+    server allows it (OLLAMA_NUM_PARALLEL).
+    """
+    async_method = getattr(self, f"a{method_name}", None)
+    if async_method is None:
+      return super().batch(method_name, calls)
+
+    async def run_all():
+      return await asyncio.gather(*(async_method(*args) for args in calls))
+    return self.run(run_all())
+
+  def submit(self, method_name, *args, executor=None, **kwargs):
+    """
+    Runs the async version of the method on the driver's event loop.
+    Cancelling the returned future cancels the request, which closes its
+    connection and stops Ollama generating for it.
+    """
+    async_method = getattr(self, f"a{method_name}", None)
+    if async_method is None:
+      return super().submit(method_name, *args, executor=executor, **kwargs)
+    return self.start(async_method(*args, **kwargs))
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+class PrefixCache:
+    """
+    Keeps llama.cpp state snapshots for static prompt prefixes.
+
+    Restoring a snapshot before generating means llama.cpp only has to evaluate
+    the part of the prompt after the prefix: Llama.generate() reuses the
+    longest common prefix between the loaded tokens and the new prompt.
+    Snapshots are evicted least recently used first once their total size goes
+    over `max_bytes`.
+    """
+
+    def __init__(self, llm, max_bytes=1024 * 1024 * 1024, debug=False):
+        self.llm = llm
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.states = OrderedDict()  # prefix hash -> LlamaState
+        self.total_bytes = 0
+
+    @staticmethod
+    def key(prefix):
+        return hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+
+    def tokenize(self, text):
+        try:
+            return self.llm.tokenize(text.encode('utf-8'), special=True)
+        except TypeError:
+            # Older llama-cpp-python versions have no `special` argument
+            return self.llm.tokenize(text.encode('utf-8'))
+
+    def warm(self, prefix):
+        """
+        Evaluates the prefix and stores its state, if it isn't cached yet.
+        Returns whether it was cached.
+        """
+        key = self.key(prefix)
+        with self.lock:
+            if key in self.states:
+                self.states.move_to_end(key)
+                return True
+        tokens = self.tokenize(prefix)
+        self.llm.reset()
+        self.llm.eval(tokens)
+        state = self.llm.save_state()
+        size = getattr(state, 'llama_state_size', 0)
+        if size > self.max_bytes:
+            # Never worth keeping, it would evict everything else
+            return False
+        with self.lock:
+            self.states[key] = state
+            self.total_bytes += size
+            self.evict()
+        if(self.debug):
+            print(f"prefix cache: stored {len(tokens)} tokens ({size} bytes), {len(self.states)} prefixes, {self.total_bytes} bytes")
+        return False
+
+    def restore(self, prefix):
+        """
+        Loads the state for the prefix into the model, evaluating it first if needed.
+        Returns whether the prefix was already cached.
+        """
+        hit = self.warm(prefix)
+        with self.lock:
+            state = self.states.get(self.key(prefix))
+            if state is not None:
+                self.states.move_to_end(self.key(prefix))
+        if state is not None:
+            self.llm.load_state(state)
+        return hit
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.states:
+            _, state = self.states.popitem(last=False)
+            self.total_bytes -= getattr(state, 'llama_state_size', 0)
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+            self.total_bytes = 0
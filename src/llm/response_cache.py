@@ -0,0 +1,106 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    Two tier cache for LLM responses.
+
+    Lookups go to an in-memory LRU first and then to an on-disk SQLite table.
+    Entries expire after `ttl` seconds (None keeps them forever) and each tier
+    is trimmed to its maximum number of entries, least recently used first.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, db_path='./cache/llm_responses.sqlite3', max_memory_entries=512, max_disk_entries=10000, ttl=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (expires_at, value)
+        self.db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                used_at REAL NOT NULL
+            )""")
+            self.db.commit()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hashes the given parts into a cache key.
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (hit, value).
+        """
+        now = time.time()
+        with self.lock:
+            if key in self.memory:
+                expires_at, value = self.memory[key]
+                if expires_at is None or expires_at > now:
+                    self.memory.move_to_end(key)
+                    return True, value
+                del self.memory[key]
+
+            if self.db is None:
+                return False, None
+            row = self.db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            value, expires_at = json.loads(row[0]), row[1]
+            if expires_at is not None and expires_at <= now:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return False, None
+            self.db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.remember(key, expires_at, value)
+            return True, value
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.remember(key, expires_at, value)
+            if self.db is None:
+                return
+            self.db.execute("INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now))
+            self.evict_disk(now)
+            self.db.commit()
+
+    def remember(self, key, expires_at, value):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def evict_disk(self, now):
+        self.db.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        count = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_disk_entries:
+            self.db.execute("""DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY used_at ASC LIMIT ?
+            )""", (count - self.max_disk_entries,))
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
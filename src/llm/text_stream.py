@@ -0,0 +1,55 @@
+import re
+
+# End of a sentence or clause: punctuation followed by whitespace, or a line break
+SENTENCE_END = re.compile(r'[.!?;:](?:["\')\]]*)\s+|\n+')
+
+class SentenceChunker:
+    """
+    Regroups streamed text pieces (tokens) into sentence sized chunks.
+    A chunk is ready as soon as a sentence ends, so speech or the UI can
+    start on it while the rest is still being generated. Very short
+    sentences are held back and joined with the next one.
+    """
+
+    def __init__(self, min_length=12):
+        self.min_length = min_length
+        self.buffer = ""
+
+    def feed(self, piece):
+        """
+        Adds a piece of text and returns the chunks that are complete.
+        """
+        self.buffer += piece
+        chunks = []
+        while True:
+            match = None
+            for candidate in SENTENCE_END.finditer(self.buffer):
+                if candidate.end() >= self.min_length:
+                    match = candidate
+                    break
+            if match is None:
+                return chunks
+            chunk, self.buffer = self.buffer[:match.end()], self.buffer[match.end():]
+            if chunk.strip():
+                chunks.append(chunk)
+
+    def flush(self):
+        """
+        Returns whatever is left once the stream has ended.
+        """
+        chunk, self.buffer = self.buffer, ""
+        return [chunk] if chunk.strip() else []
+
+def sentence_chunks(pieces, min_length=12):
+    chunker = SentenceChunker(min_length)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+async def async_sentence_chunks(pieces, min_length=12):
+    chunker = SentenceChunker(min_length)
+    async for piece in pieces:
+        for chunk in chunker.feed(piece):
+            yield chunk
+    for chunk in chunker.flush():
+        yield chunk
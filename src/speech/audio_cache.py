@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+AUDIO_CACHE_PATH = './cache/audio'
+
+def normalize_text(text):
+    """
+    Collapses whitespace and straightens quotes, so texts that sound the
+    same share their audio.
+    """
+    text = (text or '').replace('’', "'").replace('‘', "'").replace('“', '"').replace('”', '"')
+    return re.sub(r'\s+', ' ', text).strip()
+
+class AudioCache:
+    """
+    Rendered speech on disk, one file per (normalized text, voice, engine
+    name and version), named by the hash of those.
+
+    The cache is trimmed to `max_bytes`, least recently used first. Use is
+    recorded in the files' modification times, so the order survives restarts.
+    """
+
+    def __init__(self, path=AUDIO_CACHE_PATH, max_bytes=256 * 1024 * 1024, debug=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.size = 0
+        os.makedirs(path, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name, stat.st_size))
+        with self.lock:
+            self.entries = OrderedDict((name, size) for _, name, size in sorted(files))
+            self.size = sum(self.entries.values())
+
+    @staticmethod
+    def key(text, voice, engine):
+        parts = [normalize_text(text), voice or '', engine.name, engine.version]
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def file_name(self, key, extension):
+        return f"{key}.{extension}"
+
+    def get(self, key, extension):
+        """
+        Returns the path of the cached audio, or None.
+        """
+        name = self.file_name(key, extension)
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        path = os.path.join(self.path, name)
+        try:
+            os.utime(path)
+        except OSError:
+            # Removed behind our back
+            with self.lock:
+                self.size -= self.entries.pop(name, 0)
+            return None
+        return path
+
+    def temp_path(self, key, extension):
+        """
+        Where to render audio before put() moves it into the cache.
+        """
+        return os.path.join(self.path, f"{key}.{threading.get_ident()}.{extension}.tmp")
+
+    def put(self, key, extension, temp_path):
+        """
+        Moves rendered audio into the cache and returns its path.
+        """
+        name = self.file_name(key, extension)
+        path = os.path.join(self.path, name)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.size += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+            self.evict()
+        return path
+
+    def evict(self):
+        # Keep at least the entry that was just added
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            if(self.debug):
+                print(f"audio cache: evicted {name}")
+
+    def clear(self):
+        with self.lock:
+            for name in self.entries:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,197 @@
+import os
+import queue
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .audio_cache import AudioCache
+from ..llm.text_stream import SentenceChunker
+from ..tracing import get_tracer
+
+# Said often enough to render ahead of time, so they play straight away
+COMMON_PHRASES = [
+    "Um.",
+    "Sure.",
+    "One moment.",
+    "Okay, done.",
+    "I couldn't find a tool for that.",
+    "Something went wrong.",
+]
+
+def tool_phrases(registry):
+    """
+    The acknowledgements of the registered tools ("Sure, I'll clear the caches.").
+    """
+    return [record['acknowledgement'] for record in registry.get_tools() if record.get('acknowledgement')]
+
+class AudioPlayer:
+    """
+    Plays audio files with whichever command line player is installed.
+    Without one, playing does nothing.
+    """
+
+    COMMANDS = [
+        ['afplay'],
+        ['paplay'],
+        ['aplay', '-q'],
+        ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet'],
+    ]
+
+    def __init__(self, command=None):
+        self.command = command or next((command for command in self.COMMANDS if shutil.which(command[0])), None)
+        self.process = None
+
+    def play(self, path):
+        if self.command is None:
+            return
+        self.process = subprocess.Popen(self.command + [path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.process.wait()
+        self.process = None
+
+    def stop(self):
+        process = self.process
+        if process is not None:
+            process.terminate()
+
+class Speaker:
+    """
+    Speaks text through a TTS engine, caching the rendered audio.
+
+    Text is rendered on a small pool of threads and played in the order it
+    was said, one clip at a time, so a sentence can render while the one
+    before it plays. speak_stream() says each sentence of streamed text as
+    soon as it is complete. prerender() fills the cache ahead of time.
+    Failures are passed to `on_error(message)`, they are also in the "tts"
+    and "play" tracing spans.
+    """
+
+    def __init__(self, engine, cache=None, player=None, voice=None, workers=2, on_error=None, debug=False):
+        self.engine = engine
+        self.cache = cache if cache is not None else AudioCache()
+        self.player = player if player is not None else AudioPlayer()
+        self.voice = voice or engine.default_voice
+        self.on_error = on_error
+        self.debug = debug
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.rendering = {}  # key -> Future, so a text being rendered isn't rendered twice
+        self.renderer = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self.playlist = queue.Queue()
+        self.player_thread = threading.Thread(target=self.play_loop, name="speaker", daemon=True)
+        self.player_thread.start()
+
+    def render(self, text):
+        """
+        Returns the path of the audio for the text, rendering it if it isn't cached.
+        """
+        key = AudioCache.key(text, self.voice, self.engine)
+        with get_tracer().span("tts", engine=self.engine.name, characters=len(text)) as span:
+            path = self.cache.get(key, self.engine.extension)
+            span.set(hit=path is not None)
+            if path is not None:
+                return path
+            temp_path = self.cache.temp_path(key, self.engine.extension)
+            try:
+                self.engine.synthesize(text.strip(), self.voice, temp_path)
+            except Exception:
+                # Don't leave half written audio behind
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            if(self.debug):
+                print(f"speaker: rendered {text!r}")
+            return self.cache.put(key, self.engine.extension, temp_path)
+
+    def render_async(self, text):
+        """
+        Renders the text in the background and returns a Future of its path.
+        """
+        key = AudioCache.key(text, self.voice, self.engine)
+        with self.lock:
+            future = self.rendering.get(key)
+            if future is not None:
+                return future
+            future = self.renderer.submit(self.render, text)
+            self.rendering[key] = future
+        # Outside the lock, the callback runs straight away if the render is already done
+        future.add_done_callback(lambda future: self.forget(key, text, future))
+        return future
+
+    def forget(self, key, text, future):
+        with self.lock:
+            self.rendering.pop(key, None)
+        if not future.cancelled() and future.exception() is not None:
+            self.report(f"Could not render {text!r}: {future.exception()}")
+
+    def report(self, message):
+        if self.on_error is not None:
+            self.on_error(message)
+        elif(self.debug):
+            print(f"speaker: {message}")
+
+    def prerender(self, phrases):
+        """
+        Renders the phrases in the background. Returns their Futures.
+        """
+        return [self.render_async(phrase) for phrase in dict.fromkeys(phrases) if phrase.strip()]
+
+    def say(self, text):
+        """
+        Queues the text to be spoken after whatever was said before it.
+        """
+        if not self.enabled or not text.strip():
+            return None
+        future = self.render_async(text)
+        self.playlist.put(future)
+        return future
+
+    def speak_stream(self, pieces):
+        """
+        Passes streamed text through, saying each sentence as soon as it is complete.
+        """
+        chunker = SentenceChunker()
+        for piece in pieces:
+            for sentence in chunker.feed(piece):
+                self.say(sentence)
+            yield piece
+        for sentence in chunker.flush():
+            self.say(sentence)
+
+    def play_loop(self):
+        while True:
+            future = self.playlist.get()
+            try:
+                if future is None:
+                    return
+                try:
+                    path = future.result()
+                except Exception:
+                    # Reported when the render failed
+                    continue
+                if self.enabled:
+                    with get_tracer().span("play"):
+                        self.player.play(path)
+            except Exception as e:
+                self.report(f"Could not play: {e}")
+            finally:
+                self.playlist.task_done()
+
+    def wait(self):
+        """
+        Blocks until everything said so far has been spoken.
+        """
+        self.playlist.join()
+
+    def toggle(self):
+        """
+        Turns speaking on or off; turning it off stops the current clip.
+        """
+        self.enabled = not self.enabled
+        if not self.enabled:
+            self.player.stop()
+        return self.enabled
+
+    def close(self):
+        self.playlist.put(None)
+        self.renderer.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import os
+import abc
+import math
+import time
+import wave
+import struct
+import shutil
+import platform
+import subprocess
+
+class AbstractTTSEngine(abc.ABC):
+    """
+    A local text to speech engine. It writes the audio for a text to a file;
+    the name and version are part of the audio cache key, so bump the version
+    when the engine (or its model) changes how things sound.
+    """
+
+    def __init__(self, name, version, default_voice=None, extension='wav'):
+        self.name = name
+        self.version = version
+        self.default_voice = default_voice
+        self.extension = extension
+
+    @abc.abstractmethod
+    def synthesize(self, text, voice, path):
+        """
+        Writes the audio for the text, spoken with the voice, to path.
+        """
+        pass
+
+class StubTTSEngine(AbstractTTSEngine):
+    """
+    Writes a short tone per word instead of speech, taking `delay` seconds
+    per word to do it. For tests and benchmarks, and machines without a TTS.
+    """
+
+    def __init__(self, delay=0.0, sample_rate=16000):
+        super().__init__(name="stub", version="1", default_voice="tone")
+        self.delay = delay
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text, voice, path):
+        words = max(1, len(text.split()))
+        time.sleep(self.delay * words)
+        samples = int(self.sample_rate * 0.06)
+        frames = bytearray()
+        for _ in range(words):
+            for i in range(samples):
+                frames += struct.pack('<h', int(3000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)))
+            frames += b'\x00\x00' * (samples // 2)
+        with wave.open(path, 'wb') as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(2)
+            audio.setframerate(self.sample_rate)
+            audio.writeframes(bytes(frames))
+
+class SayTTSEngine(AbstractTTSEngine):
+    """
+    The macOS `say` command.
+    """
+
+    def __init__(self, default_voice=None):
+        super().__init__(name="say", version=platform.mac_ver()[0] or "1", default_voice=default_voice, extension='aiff')
+
+    def synthesize(self, text, voice, path):
+        command = ['say', '-o', path]
+        if voice:
+            command += ['-v', voice]
+        subprocess.run(command + ['--', text], check=True, capture_output=True)
+
+class PiperTTSEngine(AbstractTTSEngine):
+    """
+    Piper (https://github.com/rhasspy/piper), with `default_voice` the path
+    to an .onnx voice model.
+    """
+
+    def __init__(self, default_voice=None):
+        default_voice = default_voice or os.getenv("JONE_PIPER_VOICE")
+        if not default_voice:
+            raise ValueError("Piper needs a voice model: set JONE_PIPER_VOICE to the path of an .onnx voice")
+        super().__init__(name="piper", version=os.path.basename(default_voice), default_voice=default_voice)
+
+    def synthesize(self, text, voice, path):
+        subprocess.run(['piper', '--model', voice, '--output_file', path], input=text, text=True, check=True, capture_output=True)
+
+TTS_ENGINES = {
+    'stub': StubTTSEngine,
+    'say': SayTTSEngine,
+    'piper': PiperTTSEngine,
+}
+
+def get_tts_engine(name=None):
+    """
+    Returns an instance of the named engine, or of the first one installed
+    on this machine (say, then piper, then the stub).
+    """
+    if name:
+        if name not in TTS_ENGINES:
+            raise ValueError(f"Unknown TTS engine {name}, expected one of {', '.join(TTS_ENGINES)}")
+        return TTS_ENGINES[name]()
+    if shutil.which('say'):
+        return SayTTSEngine()
+    if shutil.which('piper') and os.getenv("JONE_PIPER_VOICE"):
+        return PiperTTSEngine()
+    return StubTTSEngine()
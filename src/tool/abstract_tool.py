@@ -1,13 +1,53 @@
 import abc
+import os
+import re
+import signal
+import importlib
+import threading
 import subprocess
 from typing import Dict, Any
 
+from .tool_result_cache import SIDE_EFFECTING
+from ..tracing import get_tracer
+
+def coerce_argument(value: Any, datatype: type) -> Any:
+    """
+    Converts an argument value (from the LLM or typed by the user) to the
+    datatype it was declared with in add_argument.
+    """
+    if value is None or isinstance(value, datatype):
+        return value
+    if datatype is bool and isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', 'y', '1', 'on')
+    return datatype(value)
+
 class AbstractTool(abc.ABC):
     """
     Abstract base class for a Tool.
     Each Tool encapsulates information required to execute a command line script and return the output.
     """
 
+    # Options that tool classes override, the same for every run of the tool.
+
+    # Tools that set this never have their LLM responses (arguments, personality) cached
+    ignore_caching: bool = False
+    # "package.module:function" to call in-process instead of running command_template.
+    # The function gets the argument values as keyword arguments and returns the output.
+    entry_point: str = None
+    # Said before the tool runs ("Sure, I'll clear the caches."), its audio is rendered ahead of time
+    acknowledgement: str = None
+    # The response to the user, formatted with the argument values and `output` (and the named
+    # groups of response_pattern) instead of having the LLM rewrite the output. It is only used
+    # when the output matches response_pattern, if the tool has one (so errors still go to the LLM).
+    response_template: str = None
+    response_pattern: str = None
+    # Whether the output only depends on the arguments: PURE, CACHEABLE (for result_ttl seconds)
+    # or SIDE_EFFECTING (see ToolResultCache). Only pure and cacheable tools have their output memoized.
+    idempotence: str = SIDE_EFFECTING
+    result_ttl: float = None
+    # How many runs of this tool may happen at the same time (see ToolExecutor)
+    max_concurrency: int = 1
+
     def __init__(self, name: str, description: str, toolset: str, command_template: str, can_be_triggered_by_voice_command: bool, display_command_output_to_user: bool):
         self.name = name
         self.description = description
@@ -15,6 +55,12 @@ class AbstractTool(abc.ABC):
         self.command_template = command_template
         self.can_be_triggered_by_voice_command = can_be_triggered_by_voice_command
         self.display_command_output_to_user = display_command_output_to_user
+        self.process = None
+        # Whether the last run's command was killed for taking longer than its timeout
+        self.timed_out = False
+        # Whether the last run worked: the entry point didn't raise, the command exited with 0.
+        # Only the output of runs that worked is memoized.
+        self.succeeded = False
 
         self.is_called_by_voice = False
         self.arguments = {}
@@ -43,17 +89,114 @@ class AbstractTool(abc.ABC):
         formatted_command = self.command_template.format(**{arg: self.argument_values[arg] for arg in self.arguments if self.argument_values[arg] is not None})
         return formatted_command
 
-    def run(self, is_called_by_voice: bool) -> str:
+    def coerced_argument_values(self) -> Dict[str, Any]:
+        """
+        The argument values that are set, converted to their declared datatypes.
+        """
+        return {arg: coerce_argument(self.argument_values[arg], self.arguments[arg]['datatype'])
+            for arg in self.arguments if self.argument_values.get(arg) is not None}
+
+    def load_entry_point(self):
+        module_name, function_name = self.entry_point.split(':')
+        return getattr(importlib.import_module(module_name), function_name)
+
+    def run_entry_point(self) -> str:
+        """
+        Calls the entry point in this process and returns its output.
+        """
+        with get_tracer().span("entry_point", tool=self.name, entry_point=self.entry_point) as span:
+            try:
+                output = self.load_entry_point()(**self.coerced_argument_values())
+            except Exception as e:
+                span.error = f"{type(e).__name__}: {e}"
+                return f"An error occurred: {e}"
+            self.succeeded = True
+            return "" if output is None else str(output)
+
+    def run(self, is_called_by_voice: bool, on_output=None, timeout: float = None) -> str:
         """
-        Executes the command using subprocess and returns the output.
+        Executes the tool and returns the output: in-process through the entry point
+        if the tool has one, otherwise the command using subprocess.
+        `on_output` is called with each line of output as it is produced, and
+        commands are killed after `timeout` seconds.
         """
+        self.succeeded = False
         if is_called_by_voice and not self.can_be_triggered_by_voice_command:
             return "This tool cannot be triggered by voice command."
-        try:
-            result = subprocess.run(self.format_command(), shell=True, check=True, text=True, capture_output=(not self.display_command_output_to_user))
-            return result.stdout
-        except subprocess.CalledProcessError as e:
+        if self.entry_point:
+            output = self.run_entry_point()
+            if on_output is not None and output:
+                on_output(output)
+            return output
+        return self.run_command(on_output, timeout)
+
+    def run_command(self, on_output=None, timeout: float = None) -> str:
+        capture_output = not self.display_command_output_to_user
+        command = self.format_command()
+        self.timed_out = False
+        with get_tracer().span("subprocess", tool=self.name) as span:
+            # A session of its own, so cancel() can kill the shell and everything it started
+            self.process = subprocess.Popen(command, shell=True, text=True, stdout=subprocess.PIPE if capture_output else None, start_new_session=True)
+            timer = threading.Timer(timeout, self.time_out) if timeout is not None else None
+            if timer is not None:
+                timer.start()
+            lines = []
+            try:
+                if capture_output:
+                    for line in self.process.stdout:
+                        lines.append(line)
+                        if on_output is not None:
+                            on_output(line)
+                returncode = self.process.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                self.process = None
+            span.set(returncode=returncode, output_lines=len(lines), timed_out=self.timed_out)
+        if self.timed_out:
+            return f"{self.name} timed out."
+        if returncode != 0:
+            e = subprocess.CalledProcessError(returncode, command, output="".join(lines))
             return f"An error occurred: {e}"
+        self.succeeded = True
+        return "".join(lines) if capture_output else None
+
+    def render_response(self, output: str) -> str:
+        """
+        Returns the response from response_template, or None if the tool has no
+        template or the output or arguments aren't what it expects.
+        """
+        if not self.response_template or output is None:
+            return None
+        output = output.strip()
+        try:
+            fields = dict(self.coerced_argument_values(), output=output)
+        except (ValueError, TypeError):
+            return None
+        if self.response_pattern:
+            match = re.fullmatch(self.response_pattern, output, re.DOTALL)
+            if match is None:
+                return None
+            fields.update(match.groupdict())
+        try:
+            return self.response_template.format(**fields)
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def cancel(self) -> None:
+        """
+        Kills the tool's command if it is running. In-process entry points can't be interrupted.
+        """
+        process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def time_out(self) -> None:
+        self.timed_out = True
+        self.cancel()
 
     def get_next_required_argument_prompt(self) -> tuple:
         """
@@ -0,0 +1,24 @@
+from ..abstract_tool import AbstractTool
+
+class UpdateContextTool(AbstractTool):
+    # Never replay a cached answer, the context changes every time
+    ignore_caching = True
+    entry_point = "src.context_store:update_context"
+    response_template = "{output}"
+    # An error goes to the LLM instead
+    response_pattern = r"Noted, the .+ is now .+\.|Forgot the .+\."
+
+    def __init__(self):
+        super().__init__(
+            name="UpdateContext",
+            description="Remembers what the user is working on: the current project, site, environment etc.",
+            toolset="Context",
+            command_template="",
+            can_be_triggered_by_voice_command=True,
+            display_command_output_to_user=False
+        )
+        self.define_arguments()
+
+    def define_arguments(self):
+        self.add_argument('name', str, required=True, prompt="What should I remember (project, site, env...)?")
+        self.add_argument('value', str, required=True, prompt="What is it now?")
@@ -0,0 +1,170 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+EMBEDDINGS_PATH = './src/tool/.tool_embeddings.npz'
+
+def tool_text(record):
+    """
+    The text we embed for a tool: its name, description and argument prompts.
+    """
+    lines = [record['class_name'], record['name'], record['description']]
+    lines += [properties['prompt'] for properties in record['arguments'].values()]
+    return '\n'.join(lines)
+
+class EmbeddingRouter:
+    """
+    Routes a query straight to a tool by embedding similarity.
+
+    Every registered tool is embedded once and the normalized vectors are kept
+    in one matrix, persisted next to the tool tree. A query is embedded and
+    compared against every tool with a single matrix product; the tools are
+    only embedded again when build() is called after they change (see
+    ToolWatcher). When the best
+    tool beats the runner-up by at least `margin` (and scores at least
+    `min_score`) we trust it, otherwise `route` returns None and the caller
+    falls back to asking the LLM.
+    """
+
+    def __init__(self, registry, llm_driver, path=EMBEDDINGS_PATH, margin=0.05, min_score=0.3, debug=False):
+        self.registry = registry
+        self.llm_driver = llm_driver
+        self.path = path
+        self.margin = margin
+        self.min_score = min_score
+        self.debug = debug
+        self.ids = []       # (toolset, class_name) per matrix row
+        self.hashes = []    # hash of the embedded text per matrix row
+        self.matrix = None  # float32, one L2 normalized row per tool
+        self.built = False
+        self.lock = threading.Lock()
+
+    def model_id(self):
+        model_id = getattr(self.llm_driver, 'model_id', '')
+        # Wrapped drivers (CachedLLMDriver...) name their driver and model themselves
+        if callable(model_id):
+            return model_id()
+        return f"{self.llm_driver.name}:{model_id}"
+
+    def normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return
+        data = np.load(self.path, allow_pickle=False)
+        if str(data['model_id']) != self.model_id():
+            return
+        self.ids = [tuple(tool_id.split('/', 1)) for tool_id in data['ids'].tolist()]
+        self.hashes = data['hashes'].tolist()
+        self.matrix = data['matrix']
+
+    def save(self):
+        if not self.path:
+            return
+        np.savez(self.path,
+            model_id=np.array(self.model_id()),
+            ids=np.array([f'{toolset}/{class_name}' for toolset, class_name in self.ids]),
+            hashes=np.array(self.hashes),
+            matrix=self.matrix)
+
+    def build(self):
+        """
+        Brings the embedding matrix up to date with the registry,
+        only embedding tools that are new or whose text changed.
+        """
+        with self.lock:
+            self.build_matrix()
+            self.built = True
+
+    def build_matrix(self):
+        if self.matrix is None:
+            self.load()
+        existing = {}
+        for row, (tool_id, text_hash) in enumerate(zip(self.ids, self.hashes)):
+            existing[tool_id] = (text_hash, row)
+
+        ids, hashes, rows, missing = [], [], [], []
+        for record in self.registry.get_tools():
+            tool_id = (record['toolset'], record['class_name'])
+            text = tool_text(record)
+            text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            ids.append(tool_id)
+            hashes.append(text_hash)
+            if tool_id in existing and existing[tool_id][0] == text_hash:
+                rows.append(self.matrix[existing[tool_id][1]])
+            else:
+                rows.append(None)
+                missing.append((len(rows) - 1, text))
+
+        if not missing and ids == self.ids:
+            return
+        if missing:
+            if(self.debug):
+                print(f"embedding router: embedding {len(missing)} tools")
+            vectors = self.normalize(self.llm_driver.embed([text for _, text in missing]))
+            for (index, _), vector in zip(missing, vectors):
+                rows[index] = vector
+        self.ids = ids
+        self.hashes = hashes
+        self.matrix = np.stack(rows).astype(np.float32) if rows else None
+        self.save()
+
+    def rank(self, queries):
+        """
+        Returns the tool ids and a (len(queries), number of tools) matrix of
+        cosine similarities. The tools are embedded on first use.
+        """
+        if not self.built:
+            self.build()
+        with self.lock:
+            ids, matrix = self.ids, self.matrix
+        if matrix is None:
+            return ids, np.zeros((len(queries), 0), dtype=np.float32)
+        return ids, self.normalize(self.llm_driver.embed(queries)) @ matrix.T
+
+    def scores(self, queries):
+        """
+        Returns a (len(queries), number of tools) matrix of cosine similarities.
+        """
+        return self.rank(queries)[1]
+
+    def top_k(self, query, k=3):
+        """
+        Returns the k most similar tools as ((toolset, class_name), score) pairs.
+        """
+        ids, scores = self.rank([query])
+        scores = scores[0]
+        order = np.argsort(-scores)[:k]
+        return [(ids[index], float(scores[index])) for index in order]
+
+    def route_batch(self, queries):
+        """
+        Returns a (toolset, class_name) pair per query, or None where the
+        best match isn't clearly ahead of the others.
+        """
+        if not queries:
+            return []
+        ids, scores = self.rank(queries)
+        routes = []
+        for row in scores:
+            if len(row) == 0:
+                routes.append(None)
+                continue
+            order = np.argsort(-row)
+            best = float(row[order[0]])
+            runner_up = float(row[order[1]]) if len(order) > 1 else -1.0
+            if(self.debug):
+                print(f"embedding router: {ids[order[0]]} {best:.3f}, margin {best - runner_up:.3f}")
+            if best >= self.min_score and best - runner_up >= self.margin:
+                routes.append(ids[order[0]])
+            else:
+                routes.append(None)
+        return routes
+
+    def route(self, query):
+        return self.route_batch([query])[0]
@@ -0,0 +1,25 @@
+from ..abstract_tool import AbstractTool
+from ..tool_result_cache import CACHEABLE
+
+class BatchCurrencyConverterTool(AbstractTool):
+    entry_point = "src.tool.financial.scripts.currency_conversion:describe_column_conversion"
+    response_template = "Here you go:\n{output}"
+    response_pattern = r"(?:-?[\d,.]+ [A-Z]{3} is -?[\d,.]+ [A-Z]{3}\n)+Total: .*"
+    idempotence = CACHEABLE
+    result_ttl = 3600
+
+    def __init__(self):
+        super().__init__(
+            name="BatchCurrencyConverter",
+            description="Converts a list or column of amounts from one currency to another, with a total.",
+            toolset="Financial",
+            command_template="python3 ./src/tool/financial/scripts/currency_conversion.py -a \"{amounts}\" -f {from_currency} -t {to_currency}",
+            can_be_triggered_by_voice_command=False,
+            display_command_output_to_user=False
+        )
+        self.define_arguments()
+
+    def define_arguments(self):
+        self.add_argument('amounts', str, required=True, prompt="Which amounts would you like to convert? (paste them, one per line or separated by spaces)")
+        self.add_argument('from_currency', str, required=True, prompt="Which currency are you converting from?")
+        self.add_argument('to_currency', str, required=True, prompt="Which currency are you converting to?")
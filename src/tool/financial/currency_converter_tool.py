@@ -1,6 +1,14 @@
 from ..abstract_tool import AbstractTool
+from ..tool_result_cache import CACHEABLE
 
 class CurrencyConverterTool(AbstractTool):
+    entry_point = "src.tool.financial.scripts.currency_conversion:describe_conversion"
+    response_template = "{output}."
+    response_pattern = r"-?[\d,.]+ [A-Z]{3} is -?[\d,.]+ [A-Z]{3}"
+    # The rates only change when the snapshot is refreshed
+    idempotence = CACHEABLE
+    result_ttl = 3600
+
     def __init__(self):
         super().__init__(
             name="CurrencyConverter",
@@ -1,21 +1,75 @@
+import re
 import argparse
 
-def convert_currency(amount, from_currency, to_currency):
-    # Placeholder function. In a real-world application, you would need to integrate
-    # with an API to get the current exchange rates.
-    # This function currently just returns the same amount for demonstration.
-    return amount * .75
+try:
+    from .exchange_rates import get_rate_store, normalize_currency
+except ImportError:
+    # Run as a script
+    from exchange_rates import get_rate_store, normalize_currency
+
+def convert_currency(amount, from_currency, to_currency, date=None):
+    """
+    Converts with the rates of the local snapshot (see exchange_rates.RateStore),
+    the latest ones or those of the given date.
+    """
+    return get_rate_store().convert(amount, from_currency, to_currency, date)
+
+def convert_currencies(amounts, from_currencies, to_currencies, date=None):
+    """
+    Converts many amounts in one call. The currencies can be one per amount
+    or a single currency for all of them.
+    """
+    return get_rate_store().convert_batch(amounts, from_currencies, to_currencies, date)
+
+def parse_amounts(text):
+    """
+    The amounts in a pasted column (or row) of figures, e.g. "1,200.50\n$300\n45".
+    Figures are separated by whitespace, commas are thousands separators:
+    "100,200" is one figure and "100, 200" two.
+    """
+    figures = [re.search(r'-?\d[\d,]*(?:\.\d+)?|-?\.\d+', word) for word in str(text).split()]
+    return [float(figure.group().rstrip(',').replace(',', '')) for figure in figures if figure]
+
+def describe_conversion(amount, from_currency, to_currency):
+    """
+    Converts the amount and describes the result. This is the entry point
+    CurrencyConverterTool calls in-process.
+    """
+    from_code, to_code = normalize_currency(from_currency), normalize_currency(to_currency)
+    converted_amount = convert_currency(amount, from_code, to_code)
+    return f"{amount:,.2f} {from_code} is {converted_amount:,.2f} {to_code}"
+
+def describe_column_conversion(amounts, from_currency, to_currency):
+    """
+    Converts a column of amounts and returns the converted column, one line
+    per amount. This is the entry point of BatchCurrencyConverterTool.
+    """
+    figures = parse_amounts(amounts)
+    if not figures:
+        raise ValueError("I couldn't find any amounts to convert.")
+    from_code, to_code = normalize_currency(from_currency), normalize_currency(to_currency)
+    converted = convert_currencies(figures, from_code, to_code)
+    lines = [f"{amount:,.2f} {from_code} is {converted_amount:,.2f} {to_code}" for amount, converted_amount in zip(figures, converted)]
+    lines.append(f"Total: {sum(figures):,.2f} {from_code} is {converted.sum():,.2f} {to_code}")
+    return "\n".join(lines)
 
 def main():
     parser = argparse.ArgumentParser(description='Currency Conversion Tool')
-    parser.add_argument('-a', '--amount', type=float, required=True, help='Amount to convert')
+    parser.add_argument('-a', '--amount', type=str, required=True, help='Amount to convert, or several separated by spaces or newlines (commas are thousands separators)')
     parser.add_argument('-f', '--from_currency', type=str, required=True, help='Currency to convert from')
     parser.add_argument('-t', '--to_currency', type=str, required=True, help='Currency to convert to')
 
     args = parser.parse_args()
 
-    converted_amount = convert_currency(args.amount, args.from_currency, args.to_currency)
-    print(f"{args.amount} {args.from_currency} is {converted_amount} {args.to_currency}")
+    figures = parse_amounts(args.amount)
+    try:
+        if len(figures) == 1:
+            print(describe_conversion(figures[0], args.from_currency, args.to_currency))
+        else:
+            print(describe_column_conversion(args.amount, args.from_currency, args.to_currency))
+    except ValueError as e:
+        print(e)
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
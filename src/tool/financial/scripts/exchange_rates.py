@@ -0,0 +1,259 @@
+import os
+import json
+import threading
+import urllib.request
+from datetime import date as Date
+
+import numpy as np
+
+# Determine the directory in which the script resides
+script_directory = os.path.dirname(os.path.realpath(__file__))
+SEED_PATH = os.path.join(script_directory, 'rates.json')
+
+# The compiled snapshot: a (currency, date) float64 array of units per base currency,
+# memory-mapped so loading it costs nothing, and a small JSON index next to it
+SNAPSHOT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'jone', 'exchange_rates.npy')
+
+CURRENCY_ALIASES = {
+    'dollar': 'USD', 'dollars': 'USD', 'us dollars': 'USD', '$': 'USD',
+    'euro': 'EUR', 'euros': 'EUR', '€': 'EUR',
+    'pound': 'GBP', 'pounds': 'GBP', 'sterling': 'GBP', '£': 'GBP',
+    'canadian dollar': 'CAD', 'canadian dollars': 'CAD',
+    'yen': 'JPY', 'japanese yen': 'JPY', '¥': 'JPY',
+    'australian dollar': 'AUD', 'australian dollars': 'AUD',
+    'franc': 'CHF', 'francs': 'CHF', 'swiss francs': 'CHF',
+    'yuan': 'CNY', 'renminbi': 'CNY',
+    'rupee': 'INR', 'rupees': 'INR',
+    'peso': 'MXN', 'pesos': 'MXN',
+}
+
+def normalize_currency(currency):
+    """
+    Currency code for a code or common name ("euros" -> "EUR").
+    """
+    name = str(currency).strip()
+    return CURRENCY_ALIASES.get(name.lower(), name.upper())
+
+def rebase(rates, from_base, to_base):
+    """
+    Rates per unit of `from_base` (a dict by currency code) as rates per unit of `to_base`.
+    """
+    rates = dict(rates, **{from_base: 1.0})
+    if from_base == to_base:
+        return rates
+    if to_base not in rates:
+        raise ValueError(f"The rates don't include our base currency {to_base}")
+    per_base = rates[to_base]
+    return {code: rate / per_base for code, rate in rates.items()}
+
+class JsonFileSource:
+    """
+    Rates from a JSON file shaped like {"base": "USD", "date": "2024-06-03", "rates": {"EUR": 0.92, ...}}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, 'r') as file:
+            return json.load(file)
+
+class HttpJsonSource:
+    """
+    Rates from an HTTP API answering in the same shape as JsonFileSource
+    (most free exchange rate APIs do, e.g. https://api.frankfurter.app/latest).
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+class RateStore:
+    """
+    Exchange rates for every currency and date we have, as one array.
+
+    Rates are stored as units of each currency per unit of the base currency,
+    so any cross rate is rate[to] / rate[from]. For a date we use the latest
+    snapshot on or before it. The snapshot is compiled from the rates.json
+    seed on first use, and grows a date column on every refresh(). A seed
+    edited later is merged in, so the dates refreshed since are kept.
+    """
+
+    def __init__(self, snapshot_path=SNAPSHOT_PATH, seed_path=SEED_PATH):
+        self.snapshot_path = snapshot_path
+        self.index_path = f"{os.path.splitext(snapshot_path)[0]}.json"
+        self.seed_path = seed_path
+        self.lock = threading.Lock()
+        self.base = None
+        self.currencies = {}  # code -> row
+        self.dates = None     # datetime64[D] per column, ascending
+        self.rates = None     # (currencies, dates) float64, memory-mapped
+        self.load()
+
+    def load(self):
+        if self.snapshot_is_stale():
+            self.compile_seed()
+        with open(self.index_path, 'r') as file:
+            index = json.load(file)
+        rates = np.load(self.snapshot_path, mmap_mode='r')
+        with self.lock:
+            self.base = index['base']
+            self.currencies = {code: row for row, code in enumerate(index['currencies'])}
+            self.dates = np.array(index['dates'], dtype='datetime64[D]')
+            self.rates = rates
+
+    def snapshot_is_stale(self):
+        if not os.path.isfile(self.snapshot_path) or not os.path.isfile(self.index_path):
+            return True
+        # A newer seed (e.g. edited by hand) wins over a snapshot compiled from an older one
+        return os.path.isfile(self.seed_path) and os.path.getmtime(self.seed_path) > os.path.getmtime(self.snapshot_path)
+
+    def compile_seed(self):
+        with open(self.seed_path, 'r') as file:
+            seed = json.load(file)
+        base = normalize_currency(seed['base'])
+        columns = {}
+        for column, day in enumerate(seed['dates']):
+            rates = {normalize_currency(code): float(rates[column]) for code, rates in seed['rates'].items() if rates[column] is not None}
+            columns[np.datetime64(day, 'D').item()] = rates
+        if os.path.isfile(self.snapshot_path) and os.path.isfile(self.index_path):
+            # Merge into the snapshot rather than start over, it has the refreshed dates
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+            snapshot_base = index['base']
+            codes = index['currencies']
+            dates = [np.datetime64(day, 'D').item() for day in index['dates']]
+            existing = np.load(self.snapshot_path)
+        else:
+            snapshot_base, codes, dates, existing = base, [], [], np.empty((0, 0))
+        columns = {day: rebase(rates, base, snapshot_base) for day, rates in columns.items()}
+        self.write(snapshot_base, *merge_columns(codes, dates, existing, columns))
+
+    def write(self, base, codes, dates, rates):
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        # Written aside and renamed, so a reader never maps a half written file
+        tmp_path = f"{self.snapshot_path}.tmp.npy"
+        np.save(tmp_path, rates)
+        with open(f"{self.index_path}.tmp", 'w') as file:
+            json.dump({'base': base, 'currencies': list(codes), 'dates': [str(day) for day in dates]}, file)
+        os.replace(tmp_path, self.snapshot_path)
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def refresh(self, source):
+        """
+        Adds (or replaces) the rates for the date the source reports.
+        New currencies get a row, with NaN for the dates we have no rate for.
+        Currencies the source leaves out keep their previous rate.
+        """
+        data = source.fetch()
+        day = np.datetime64(data.get('date') or Date.today().isoformat(), 'D')
+        fetched = {normalize_currency(code): float(rate) for code, rate in data['rates'].items()}
+        fetched = rebase(fetched, normalize_currency(data.get('base', self.base)), self.base)
+
+        with self.lock:
+            codes = sorted(self.currencies, key=self.currencies.get)
+            merged = merge_columns(codes, self.dates.tolist(), np.asarray(self.rates), {day.item(): fetched})
+            base = self.base
+        self.write(base, *merged)
+        self.load()
+        return str(day)
+
+    def column_for(self, day=None):
+        if day is None:
+            return len(self.dates) - 1
+        column = int(np.searchsorted(self.dates, np.datetime64(day, 'D'), side='right')) - 1
+        if column < 0:
+            raise ValueError(f"No exchange rates on or before {day}")
+        return column
+
+    def rows_for(self, currencies):
+        """
+        Row index per currency. Each distinct currency is only looked up once.
+        """
+        codes, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        rows = np.empty(len(codes), dtype=np.intp)
+        for position, code in enumerate(codes):
+            normalized = normalize_currency(code)
+            if normalized not in self.currencies:
+                raise ValueError(f"Unknown currency {code}")
+            rows[position] = self.currencies[normalized]
+        return rows[inverse.reshape(-1)]
+
+    def convert_batch(self, amounts, from_currencies, to_currencies, day=None):
+        """
+        Converts arrays of amounts in one go. The currencies can be arrays
+        (one per amount) or a single currency for all of them.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        from_currencies = np.broadcast_to(np.asarray(from_currencies, dtype=str), amounts.shape)
+        to_currencies = np.broadcast_to(np.asarray(to_currencies, dtype=str), amounts.shape)
+        with self.lock:
+            rates = self.rates[:, self.column_for(day)]
+            converted = amounts * rates[self.rows_for(to_currencies.ravel())].reshape(amounts.shape) / rates[self.rows_for(from_currencies.ravel())].reshape(amounts.shape)
+        if np.isnan(converted).any():
+            raise ValueError("Missing exchange rate for some of the currencies on that date")
+        return converted
+
+    def convert(self, amount, from_currency, to_currency, day=None):
+        return float(self.convert_batch([amount], [from_currency], [to_currency], day)[0])
+
+    def cross_rate(self, from_currency, to_currency, day=None):
+        return self.convert(1.0, from_currency, to_currency, day)
+
+def merge_columns(codes, dates, rates, columns):
+    """
+    Adds date columns ({date: {code: rate}}) to a (codes, dates) array of
+    rates, replacing the rates they have for dates it already has. Returns
+    the new (codes, dates, rates), sorted. Currencies a column leaves out
+    keep their rate for that date if there was one, or else the rate of the
+    date before.
+    """
+    new_codes = sorted(set(codes).union(*columns.values()))
+    new_dates = sorted(set(dates) | set(columns))
+    merged = np.full((len(new_codes), len(new_dates)), np.nan)
+    if len(codes) and len(dates):
+        rows = [new_codes.index(code) for code in codes]
+        existing_columns = [new_dates.index(day) for day in dates]
+        merged[np.ix_(rows, existing_columns)] = rates
+    for day in sorted(columns):
+        column = new_dates.index(day)
+        for code, rate in columns[day].items():
+            merged[new_codes.index(code), column] = rate
+        if column > 0:
+            missing = np.isnan(merged[:, column])
+            merged[missing, column] = merged[missing, column - 1]
+    return new_codes, new_dates, merged
+
+_rate_store = None
+_rate_store_lock = threading.Lock()
+
+def get_rate_store():
+    """
+    Returns the process-wide rate store, loading it on first use.
+    """
+    global _rate_store
+    with _rate_store_lock:
+        if _rate_store is None:
+            _rate_store = RateStore()
+        return _rate_store
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Manage the local exchange rate snapshot.")
+    parser.add_argument("--refresh", help="URL (or JSON file) to fetch the latest rates from, e.g. https://api.frankfurter.app/latest?from=USD")
+    parser.add_argument("--show", action="store_true", help="Print the latest rates")
+    args = parser.parse_args()
+
+    store = get_rate_store()
+    if args.refresh:
+        source = HttpJsonSource(args.refresh) if args.refresh.startswith(('http://', 'https://')) else JsonFileSource(args.refresh)
+        print(f"Fetched the rates for {store.refresh(source)}")
+    if args.show or not args.refresh:
+        column = store.column_for()
+        print(f"Rates per {store.base} on {store.dates[column]}:")
+        for code, row in sorted(store.currencies.items()):
+            print(f"  {code} {store.rates[row, column]:.4f}")
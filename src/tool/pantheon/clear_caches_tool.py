@@ -1,6 +1,13 @@
 from ..abstract_tool import AbstractTool
+from ..tool_result_cache import SIDE_EFFECTING
 
 class ClearCachesTool(AbstractTool):
+    acknowledgement = "Sure, I'll clear the caches."
+    response_template = "Done, the caches for {env} on {site} are cleared."
+    response_pattern = r".*Caches cleared for \S+"
+    # Clears the caches every time it is asked to
+    idempotence = SIDE_EFFECTING
+
     def __init__(self):
         super().__init__(
             name="ClearCaches",
@@ -13,5 +20,5 @@ class ClearCachesTool(AbstractTool):
         self.define_arguments()
 
     def define_arguments(self):
-        self.add_argument('site', float, required=True, prompt="What is the site slug?")
+        self.add_argument('site', str, required=True, prompt="What is the site slug?")
         self.add_argument('env', str, required=True, prompt="What is the multidev environment slug?")
@@ -1,6 +1,9 @@
 import subprocess
+import threading
 import json
+import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Determine the directory in which the script resides
@@ -10,25 +13,76 @@ env_path = os.path.join(script_directory, '.env')
 # Load environment variables from .env file located in the script's directory
 load_dotenv(dotenv_path=env_path)
 
-def get_terminus_field(site_slug, env_slug, field_name):
-    """Execute terminus command to get a specific field value."""
-    command = f"terminus connection:info {site_slug}.{env_slug} --field={field_name}"
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    
+# Connection info is cached locally, terminus is slow (PHP start up plus an API call)
+CONNECTION_INFO_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'jone', 'terminus_connection_info.json')
+CONNECTION_INFO_TTL = int(os.getenv('TERMINUS_CONNECTION_INFO_TTL', 3600))
+# Only these fields are cached, connection:info also has passwords and connection strings
+CACHED_FIELDS = ('sftp_username', 'sftp_host')
+_cache_lock = threading.Lock()
+
+def read_connection_info_cache():
+    try:
+        with open(CONNECTION_INFO_CACHE_PATH, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def write_connection_info_cache(site_env, info):
+    with _cache_lock:
+        cache = read_connection_info_cache()
+        cache[site_env] = {"fetched_at": time.time(), "info": {field: info.get(field) for field in CACHED_FIELDS}}
+        os.makedirs(os.path.dirname(CONNECTION_INFO_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{CONNECTION_INFO_CACHE_PATH}.tmp"
+        try:
+            # A leftover would keep its mode, and it must only be readable by us
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump(cache, file)
+        os.replace(tmp_path, CONNECTION_INFO_CACHE_PATH)
+
+def get_connection_info(site_slug, env_slug, use_cache=True):
+    """
+    Returns every connection:info field for the environment, from one terminus call.
+    The CACHED_FIELDS are cached for CONNECTION_INFO_TTL seconds, keyed by site.env,
+    and a cache hit only has those.
+    """
+    site_env = f"{site_slug}.{env_slug}"
+    if use_cache:
+        entry = read_connection_info_cache().get(site_env)
+        if entry and time.time() - entry["fetched_at"] < CONNECTION_INFO_TTL:
+            return entry["info"]
+
+    result = subprocess.run(["terminus", "connection:info", site_env, "--format=json"], capture_output=True, text=True)
     if result.returncode != 0:
-        print(f"Error executing terminus command for {field_name}")
+        print(f"Error executing terminus command for {site_env}")
         print(result)
         return None
 
-    # Extract the actual value, which is after the last newline
-    output_lines = result.stdout.strip().split('\n')
-    actual_value = output_lines[-1].strip()  # Get the last line which should be the value
-    return actual_value
+    # terminus may print notices before the JSON
+    output = result.stdout
+    try:
+        info = json.loads(output[output.index('{'):])
+    except ValueError:
+        print(f"Unexpected terminus output for {site_env}: {output}")
+        return None
+    write_connection_info_cache(site_env, info)
+    return info
 
-def get_sftp_credentials(site_slug, env_slug):
-    # Use the helper function to get username and host
-    username = get_terminus_field(site_slug, env_slug, 'sftp_username')
-    host = get_terminus_field(site_slug, env_slug, 'sftp_host')
+def get_terminus_field(site_slug, env_slug, field_name):
+    """Get a specific connection:info field value."""
+    info = get_connection_info(site_slug, env_slug, use_cache=field_name in CACHED_FIELDS)
+    if info is None:
+        return None
+    return info.get(field_name)
+
+def get_sftp_credentials(site_slug, env_slug, use_cache=True):
+    info = get_connection_info(site_slug, env_slug, use_cache=use_cache)
+    if info is None:
+        return None
+    username = info.get('sftp_username')
+    host = info.get('sftp_host')
 
     if username is None or host is None:
         return None
@@ -42,14 +96,8 @@ def get_sftp_credentials(site_slug, env_slug):
         "password": password
     }
 
-def create_vscode_sftp_json(site_slug, env_slug, sftp_credentials):
-    vscode_folder_path = '.vscode'
-    sftp_file_path = os.path.join(vscode_folder_path, 'sftp.json')
-
-    if not os.path.exists(vscode_folder_path):
-        os.makedirs(vscode_folder_path)
-    
-    sftp_config = {
+def sftp_config_for(site_slug, env_slug, sftp_credentials):
+    return {
         "name": f"{env_slug} on {site_slug}",
         "host": sftp_credentials["host"],
         "protocol": "sftp",
@@ -62,18 +110,65 @@ def create_vscode_sftp_json(site_slug, env_slug, sftp_credentials):
         "openSsh": False
     }
 
+def create_vscode_sftp_json(site_slug, env_slug, sftp_credentials):
+    return write_vscode_sftp_json(sftp_config_for(site_slug, env_slug, sftp_credentials))
+
+def write_vscode_sftp_json(sftp_config):
+    """
+    Writes sftp.json. `sftp_config` is one configuration, or a list of them
+    (the SFTP extension lets you pick between several).
+    """
+    vscode_folder_path = '.vscode'
+    sftp_file_path = os.path.join(vscode_folder_path, 'sftp.json')
+
+    if not os.path.exists(vscode_folder_path):
+        os.makedirs(vscode_folder_path)
+
     with open(sftp_file_path, 'w') as file:
         json.dump(sftp_config, file, indent=4)
 
-    print(f"sftp.json has been created/updated in {vscode_folder_path}")
+    return f"sftp.json has been created/updated in {vscode_folder_path}"
+
+def write_sftp_json(site, env):
+    """
+    Fetches the credentials and writes sftp.json. This is the entry point
+    SftpJsonTool calls in-process. Raises RuntimeError if terminus has no
+    credentials for the environment.
+    """
+    sftp_credentials = get_sftp_credentials(site, env)
+    if not sftp_credentials:
+        raise RuntimeError(f"Could not get the SFTP credentials for {site}.{env}")
+    return create_vscode_sftp_json(site, env, sftp_credentials)
+
+def write_sftp_json_batch(site, envs, use_cache=True):
+    """
+    Writes one sftp.json with a configuration per environment.
+    The terminus lookups for the environments run concurrently.
+    Raises RuntimeError if there are no credentials for any of them.
+    """
+    with ThreadPoolExecutor(max_workers=min(8, len(envs))) as executor:
+        credentials = list(executor.map(lambda env: get_sftp_credentials(site, env, use_cache=use_cache), envs))
+
+    missing = [env for env, env_credentials in zip(envs, credentials) if not env_credentials]
+    configs = [sftp_config_for(site, env, env_credentials) for env, env_credentials in zip(envs, credentials) if env_credentials]
+    if not configs:
+        raise RuntimeError(f"Could not get the SFTP credentials for {site} ({', '.join(envs)})")
+    message = write_vscode_sftp_json(configs if len(configs) > 1 else configs[0])
+    if missing:
+        message += f" (could not get the SFTP credentials for {', '.join(missing)})"
+    return message
+
 # Example usage, parsing command line arguments for site_slug and env_slug
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Generate VSCode sftp.json configuration from Terminus.")
     parser.add_argument("site_slug", help="Site slug for the Pantheon site")
-    parser.add_argument("env_slug", help="Environment slug for the site environment")
+    parser.add_argument("env_slug", nargs='+', help="Environment slug(s) for the site environment(s)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached connection info")
     args = parser.parse_args()
 
-    sftp_credentials = get_sftp_credentials(args.site_slug, args.env_slug)
-    if sftp_credentials:
-        create_vscode_sftp_json(args.site_slug, args.env_slug, sftp_credentials)
\ No newline at end of file
+    try:
+        print(write_sftp_json_batch(args.site_slug, args.env_slug, use_cache=not args.no_cache))
+    except RuntimeError as e:
+        print(e)
+        raise SystemExit(1)
\ No newline at end of file
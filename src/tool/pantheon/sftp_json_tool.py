@@ -1,6 +1,14 @@
 from ..abstract_tool import AbstractTool
+from ..tool_result_cache import SIDE_EFFECTING
 
 class SftpJsonTool(AbstractTool):
+    entry_point = "src.tool.pantheon.scripts.sftp_json:write_sftp_json"
+    response_template = "Done, sftp.json is set up for {env} on {site}."
+    response_pattern = r"sftp\.json has been created/updated.*"
+    # It writes a file, which may have been changed or removed since, so it always runs
+    # (terminus lookups are cached by the script itself)
+    idempotence = SIDE_EFFECTING
+
     def __init__(self):
         super().__init__(
             name="SftpJson",
@@ -13,5 +21,5 @@ class SftpJsonTool(AbstractTool):
         self.define_arguments()
 
     def define_arguments(self):
-        self.add_argument('site', float, required=True, prompt="What is the site slug?")
+        self.add_argument('site', str, required=True, prompt="What is the site slug?")
         self.add_argument('env', str, required=True, prompt="What is the multidev environment slug?")
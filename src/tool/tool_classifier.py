@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import zlib
+
+import numpy as np
+
+from .tool_signature import ToolSignatures
+
+CLASSIFIER_PATH = './src/tool/.tool_classifier.npz'
+
+# The label of queries that aren't for any tool, so the classifier can say so
+# instead of picking the least unlikely tool
+REJECT = ('', '')
+
+# Requests no tool handles, trained as REJECT along with the queries the LLM chose no tool for
+NEGATIVE_QUERIES = [
+    "what time is it",
+    "what's the weather like today",
+    "tell me a joke",
+    "how are you",
+    "hello",
+    "good morning",
+    "thanks",
+    "never mind",
+    "who won the game last night",
+    "set a timer for ten minutes",
+    "play some music",
+    "what's on my calendar",
+    "remind me to call mom",
+    "what is the capital of france",
+    "how do i center a div",
+    "open my email",
+]
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class HashingFeaturizer:
+    """
+    Turns queries into fixed size vectors without any model: words, word
+    pairs and character trigrams are hashed into `dim` buckets. Featurizing
+    a query takes microseconds, so routing doesn't wait on an embedding.
+    """
+
+    def __init__(self, dim=4096):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def terms(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        terms = list(words)
+        terms += [f"{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            terms += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return terms
+
+    def features(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in self.terms(text):
+                vectors[row, zlib.crc32(term.encode('utf-8')) % self.dim] += 1.0
+        return normalize(np.log1p(vectors))
+
+class EmbeddingFeaturizer:
+    """
+    Uses the LLM driver's embeddings as features. Better on paraphrases,
+    but every query then costs an embedding.
+    """
+
+    def __init__(self, llm_driver):
+        self.llm_driver = llm_driver
+        self.name = f"embedding:{llm_driver.name}:{getattr(llm_driver, 'model_id', '')}"
+
+    def features(self, texts):
+        return normalize(self.llm_driver.embed(texts))
+
+class ToolClassifier:
+    """
+    Small linear (softmax regression) classifier from a query to a tool,
+    distilled from the LLM's logged decisions. It replaces decide_toolset and
+    decide_tool when it is confident, and has the same route / top_k
+    interface as EmbeddingRouter, so ToolChooser can use it as its router.
+
+    Queries that aren't for any tool are trained as REJECT. A query is only
+    routed when its best tool isn't REJECT, has at least `min_confidence` and
+    beats the runner-up by `min_margin`; otherwise the LLM decides.
+    """
+
+    def __init__(self, registry, featurizer=None, path=CLASSIFIER_PATH, min_confidence=0.7, min_margin=0.3, debug=False):
+        self.registry = registry
+        self.featurizer = featurizer or HashingFeaturizer()
+        self.path = path
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.debug = debug
+        self.labels = []     # (toolset, class_name) per output
+        self.weights = None  # (features, labels)
+        self.bias = None     # (labels,)
+
+    @property
+    def trained(self):
+        return self.weights is not None
+
+    def load(self):
+        """
+        Loads the trained weights, if they were trained with the same featurizer.
+        """
+        if not self.path or not os.path.isfile(self.path):
+            return False
+        data = np.load(self.path, allow_pickle=False)
+        if str(data['featurizer']) != self.featurizer.name:
+            return False
+        self.labels = [tuple(label.split('/', 1)) for label in data['labels'].tolist()]
+        self.weights = data['weights']
+        self.bias = data['bias']
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        np.savez(self.path,
+            featurizer=np.array(self.featurizer.name),
+            labels=np.array([f'{toolset}/{class_name}' for toolset, class_name in self.labels]),
+            weights=self.weights,
+            bias=self.bias)
+
+    def train(self, examples, epochs=300, learning_rate=1.0, l2=1e-4):
+        """
+        Fits the classifier to (query, toolset, class_name) examples with
+        full batch gradient descent, and returns the training accuracy.
+        """
+        self.labels = sorted({(toolset, class_name) for _, toolset, class_name in examples})
+        label_index = {label: index for index, label in enumerate(self.labels)}
+        features = self.featurizer.features([query for query, _, _ in examples])
+        targets = np.zeros((len(examples), len(self.labels)), dtype=np.float32)
+        for row, (_, toolset, class_name) in enumerate(examples):
+            targets[row, label_index[(toolset, class_name)]] = 1.0
+
+        self.weights = np.zeros((features.shape[1], len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        for epoch in range(epochs):
+            probabilities = self.softmax(features @ self.weights + self.bias)
+            error = (probabilities - targets) / len(examples)
+            self.weights -= learning_rate * (features.T @ error + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+
+        accuracy = float((self.predict_proba_features(features).argmax(axis=1) == targets.argmax(axis=1)).mean())
+        if(self.debug):
+            print(f"tool classifier: {len(examples)} examples, {len(self.labels)} tools, training accuracy {accuracy:.0%}")
+        return accuracy
+
+    @staticmethod
+    def softmax(logits):
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exponentials = np.exp(logits)
+        return exponentials / exponentials.sum(axis=-1, keepdims=True)
+
+    def predict_proba_features(self, features):
+        return self.softmax(features @ self.weights + self.bias)
+
+    def predict_proba(self, queries):
+        if not self.trained:
+            self.load()
+        if not self.trained:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+        return self.predict_proba_features(self.featurizer.features(queries))
+
+    def top_k(self, query, k=3):
+        """
+        Returns the k most likely tools as ((toolset, class_name), probability) pairs.
+        """
+        probabilities = self.predict_proba([query])[0]
+        order = [index for index in np.argsort(-probabilities) if self.labels[index] != REJECT][:k]
+        return [(self.labels[index], float(probabilities[index])) for index in order]
+
+    def route_batch(self, queries):
+        """
+        Returns a (toolset, class_name) pair per query, or None where the
+        classifier isn't confident or the tool is no longer registered.
+        """
+        if not queries:
+            return []
+        routes = []
+        for row in self.predict_proba(queries):
+            if len(row) == 0:
+                routes.append(None)
+                continue
+            best, runner_up = np.argsort(-row)[:2] if len(row) > 1 else (int(row.argmax()), None)
+            margin = row[best] - (row[runner_up] if runner_up is not None else 0.0)
+            toolset, class_name = self.labels[best]
+            if(self.debug):
+                print(f"tool classifier: {class_name or 'no tool'} {row[best]:.2f} (margin {margin:.2f})")
+            if self.labels[best] == REJECT:
+                routes.append(None)
+            elif row[best] >= self.min_confidence and margin >= self.min_margin and self.registry.get_tool(class_name, toolset) is not None:
+                routes.append((toolset, class_name))
+            else:
+                routes.append(None)
+        return routes
+
+    def route(self, query):
+        return self.route_batch([query])[0]
+
+def training_examples(log, registry):
+    """
+    (query, toolset, class_name) examples from the logged decide_tool decisions
+    for tools that are still registered, and REJECT examples for the queries
+    the LLM never chose a tool (or toolset) for.
+    """
+    examples = []
+    rejected = []
+    for row in log.rows():
+        if row['kind'] == 'decide_tool' and row['response']:
+            record = registry.get_tool(row['response'])
+            if record is not None:
+                examples.append((row['query'], record['toolset'], record['class_name']))
+        elif row['kind'] in ('decide_toolset', 'decide_tool') and not row['response']:
+            rejected.append(row['query'])
+    # A speculative decide_tool on the wrong toolset chooses nothing, that doesn't make the query a reject
+    chosen = {query.lower() for query, _, _ in examples}
+    examples += [(query, *REJECT) for query in dict.fromkeys(rejected) if query.lower() not in chosen]
+    return examples
+
+def negative_examples():
+    return [(query, *REJECT) for query in NEGATIVE_QUERIES]
+
+def logged_decisions(log):
+    """
+    The (candidates, context) the LLM was given for each logged decide_tool decision,
+    by (lowercased query, class_name).
+    """
+    decisions = {}
+    for row in log.rows(kind='decide_tool'):
+        if row['response']:
+            decisions[(row['query'].lower(), row['response'])] = (row['candidates'], row['context'])
+    return decisions
+
+PARAPHRASE_PROMPT = """Rewrite the following request {count} different ways, the way different people would ask for it.
+Keep every name, number and value. Write one rewrite per line, with no numbering.
+Request: {query}"""
+
+def paraphrase(llm_driver, query, count=5):
+    """
+    Asks the LLM for `count` rewordings of the query.
+    """
+    response = llm_driver.generate_response_in_format(PARAPHRASE_PROMPT.format(count=count, query=query))
+    lines = [re.sub(r'^\s*(?:\d+[.)]|[-*])\s*', '', line).strip().strip('"') for line in response.split('\n')]
+    return [line for line in lines if line and line.lower() != query.lower()][:count]
+
+def augment(examples, llm_driver, log=None, registry=None, count=5, debug=False):
+    """
+    Adds paraphrases of every distinct example query. This is meant to run
+    offline, it makes one LLM call per query. If a DecisionLog is given the
+    paraphrases are also logged to it as decide_tool decisions, with the
+    candidates and context of the decision they paraphrase (or, for examples
+    that weren't logged, the signatures of the toolset from the registry).
+    """
+    augmented = list(examples)
+    seen = {query.lower() for query, _, _ in examples}
+    decisions = logged_decisions(log) if log is not None else {}
+    signatures = ToolSignatures()
+    for query, toolset, class_name in list(dict.fromkeys(examples)):
+        if (toolset, class_name) == REJECT:
+            continue
+        candidates, context = decisions.get((query.lower(), class_name), (None, ''))
+        if candidates is None:
+            candidates = signatures.render(registry.get_tools(toolset)) if registry is not None else ''
+        for rewording in paraphrase(llm_driver, query, count):
+            if rewording.lower() in seen:
+                continue
+            seen.add(rewording.lower())
+            augmented.append((rewording, toolset, class_name))
+            if log is not None:
+                log.append('decide_tool', f"paraphrase:{llm_driver.name}", rewording, context, candidates, class_name)
+        if(debug):
+            print(f"paraphrased: {query}")
+    return augmented
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from .tool_registry import get_default_registry
+    from ..llm.decision_log import DecisionLog, DECISION_LOG_PATH
+
+    parser = argparse.ArgumentParser(description="Train the tool classifier from the logged LLM decisions.")
+    parser.add_argument("--log", default=DECISION_LOG_PATH, help="DecisionLog directory")
+    parser.add_argument("--examples", help="Extra JSONL examples with query, toolset and tool (e.g. src/bench/corpus.jsonl)")
+    parser.add_argument("--augment", type=int, default=0, help="Paraphrases to generate per query, with the local model")
+    parser.add_argument("--model", default="./src/llm/models/capybarahermes-2.5-mistral-7b.Q4_K_M.gguf")
+    parser.add_argument("--embeddings", action="store_true", help="Use the model's embeddings instead of hashed n-grams")
+    parser.add_argument("--output", default=CLASSIFIER_PATH)
+    args = parser.parse_args()
+
+    registry = get_default_registry()
+    log = DecisionLog(args.log)
+    examples = training_examples(log, registry) + negative_examples()
+    if args.examples:
+        with open(args.examples, 'r') as file:
+            for line in file:
+                if line.strip():
+                    example = json.loads(line)
+                    examples.append((example['query'], example['toolset'], example['tool']))
+    if all((toolset, class_name) == REJECT for _, toolset, class_name in examples):
+        raise SystemExit("No examples yet: run with a LoggingLLMDriver first, or pass --examples")
+
+    llm_driver = None
+    if args.augment or args.embeddings:
+        from ..llm.local_llm_driver import LocalLLMDriver
+        llm_driver = LocalLLMDriver(args.model)
+    if args.augment:
+        examples = augment(examples, llm_driver, log=log, registry=registry, count=args.augment, debug=True)
+        log.flush()
+
+    classifier = ToolClassifier(registry, EmbeddingFeaturizer(llm_driver) if args.embeddings else HashingFeaturizer(), path=args.output, debug=True)
+    classifier.train(examples)
+    classifier.save()
+
+    classifier.debug = False
+    start = time.perf_counter()
+    for query, _, _ in examples:
+        classifier.route(query)
+    print(f"Routing takes {(time.perf_counter() - start) / len(examples) * 1000:.3f}ms per query")
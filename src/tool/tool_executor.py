@@ -0,0 +1,172 @@
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError, TimeoutError
+
+class ToolRun:
+    """
+    Handle on a tool run submitted to a ToolExecutor.
+    """
+
+    def __init__(self, tool, timeout=None):
+        self.tool = tool
+        self.timeout = timeout
+        # result() waits until `timeout` seconds after the run was submitted, not after it was called
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.future = Future()
+        self.cancelled = False
+        self.timed_out = False
+        self.lines = []
+
+    def cancel(self):
+        """
+        Cancels the run: it never starts if it is still queued, and a running
+        command is killed.
+        """
+        self.cancelled = True
+        if not self.future.cancel():
+            self.tool.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """
+        Waits for the run and returns the tool output. Runs that were
+        cancelled or timed out return a message saying so.
+        """
+        if timeout is None and self.deadline is not None:
+            timeout = max(0.0, self.deadline - time.monotonic())
+        try:
+            return self.future.result(timeout)
+        except CancelledError:
+            return f"{self.tool.name} was cancelled."
+        except TimeoutError:
+            self.timed_out = True
+            self.cancel()
+            return f"{self.tool.name} timed out."
+
+    async def wait(self):
+        """
+        Awaits the output from asyncio code.
+        """
+        return await asyncio.wrap_future(self.future)
+
+class ToolExecutor:
+    """
+    Runs tools in the background on a bounded pool of threads.
+
+    At most `tool.max_concurrency` runs of the same tool class happen at
+    once, the others queue up without holding a thread, so they can't starve
+    other tools. Commands are killed after their timeout, and runs still
+    queued when it is over time out without starting. Every run returns a
+    ToolRun handle that can be waited on (also from asyncio) or cancelled.
+    Output lines can be streamed back with `on_output`.
+    """
+
+    def __init__(self, max_workers=4, timeout=300, debug=False):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.timeout = timeout
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.running = {}  # tool class name -> number of runs started
+        self.pending = {}  # tool class name -> deque of (run, work) waiting for one to finish
+
+    def start(self, run, work):
+        try:
+            started = self.pool.submit(work)
+        except RuntimeError:
+            # Shut down
+            run.future.cancel()
+            return
+        # Dropped by shutdown before it started
+        started.add_done_callback(lambda started: run.future.cancel() if started.cancelled() else None)
+
+    def finished(self, name):
+        """
+        Starts the next queued run of the tool class that just finished one.
+        """
+        with self.lock:
+            queue = self.pending[name]
+            if not queue:
+                self.running[name] -= 1
+                return
+            run, work = queue.popleft()
+        self.start(run, work)
+
+    def submit(self, tool, is_called_by_voice=False, on_output=None, timeout=None):
+        """
+        Starts running the tool, or queues it if as many runs of the tool as it
+        allows are already running, and returns its ToolRun.
+        """
+        run = ToolRun(tool, timeout if timeout is not None else self.timeout)
+        name = tool.__class__.__name__
+
+        def on_line(line):
+            run.lines.append(line)
+            if on_output is not None:
+                on_output(line)
+
+        def stopped():
+            if run.timed_out:
+                return f"{tool.name} timed out."
+            if run.cancelled:
+                return f"{tool.name} was cancelled."
+            return None
+
+        def call():
+            # The time spent queued counts against the deadline
+            timeout = run.deadline - time.monotonic() if run.deadline is not None else None
+            if timeout is not None and timeout <= 0:
+                run.timed_out = True
+                return stopped()
+            if(self.debug):
+                print(f"running {tool.name}...")
+            output = tool.run(is_called_by_voice=is_called_by_voice, on_output=on_line, timeout=timeout)
+            if tool.timed_out:
+                run.timed_out = True
+            return stopped() or output
+
+        def work():
+            try:
+                if not run.future.set_running_or_notify_cancel():
+                    return
+                try:
+                    run.future.set_result(call())
+                except BaseException as e:
+                    run.future.set_exception(e)
+            finally:
+                self.finished(name)
+
+        # In a copy of the caller's context, so tracing spans nest under the caller's
+        context = contextvars.copy_context()
+        start = lambda: context.run(work)
+        with self.lock:
+            queue = self.pending.setdefault(name, deque())
+            if self.running.get(name, 0) >= tool.max_concurrency:
+                queue.append((run, start))
+                return run
+            self.running[name] = self.running.get(name, 0) + 1
+        self.start(run, start)
+        return run
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            queued = [run for queue in self.pending.values() for run, _ in queue]
+            for queue in self.pending.values():
+                queue.clear()
+        for run in queued:
+            run.future.cancel()
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+def get_default_executor():
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ToolExecutor()
+        return _default_executor
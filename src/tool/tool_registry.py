@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import importlib
+import importlib.util
+
+from .abstract_tool import AbstractTool
+
+TOOL_ROOT = './src/tool'
+INDEX_PATH = './src/tool/.tool_registry.json'
+INDEX_VERSION = 2
+
+class ToolRegistry:
+    """
+    Index of every tool in the tool tree.
+
+    Toolsets are the packages inside src/tool. For every tool module we record
+    the tool classes it defines, their name, description and argument schema
+    (from define_arguments) and the hash of the source. The index is persisted
+    to disk, keyed by file mtime and content hash, so a module is only
+    re-imported when it actually changed.
+    """
+
+    def __init__(self, root=TOOL_ROOT, index_path=INDEX_PATH, debug=False):
+        self.root = root
+        self.index_path = index_path
+        self.debug = debug
+        self.lock = threading.RLock()
+        # module file path -> {mtime, size, hash, toolset, module, classes: {class_name: record}}
+        self.files = {}
+        # module file path -> {mtime, size, error} for modules that failed to import
+        self.errors = {}
+        self.loaded = False
+
+    # ------------------------------------------------------------------
+    # Loading and refreshing
+    # ------------------------------------------------------------------
+
+    def load_index(self):
+        """
+        Loads the persisted index from disk, ignoring it if it is missing or stale.
+        """
+        if not self.index_path or not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.files = data.get('files', {})
+
+    def save_index(self):
+        if not self.index_path:
+            return
+        tmp_path = f'{self.index_path}.tmp'
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump({'version': INDEX_VERSION, 'files': self.files}, file, indent=1)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            if(self.debug):
+                print(f"could not save the tool registry index: {e}")
+
+    def scan(self):
+        """
+        Lists the tool module files currently on disk, grouped by toolset.
+        """
+        found = {}
+        for toolset in os.listdir(self.root):
+            toolset_path = os.path.join(self.root, toolset)
+            if not os.path.isdir(toolset_path) or toolset == "__pycache__" or toolset.startswith('.'):
+                continue
+            found[toolset] = []
+            for file in os.listdir(toolset_path):
+                # We only want `.py` files and we ignore `__init__.py`
+                if file.endswith('.py') and not file.startswith('__'):
+                    found[toolset].append(os.path.join(toolset_path, file))
+        return found
+
+    def ensure_loaded(self):
+        with self.lock:
+            if not self.loaded:
+                self.load_index()
+                self.refresh()
+                self.loaded = True
+
+    def refresh(self):
+        """
+        Brings the index up to date with the files on disk.
+        Only modules whose mtime and hash changed are re-imported.
+        Returns the list of file paths that changed (added, modified or removed).
+
+        The new index is built on the side and swapped in at the end, so
+        readers see either the old tools or the new ones. A module that fails
+        to import (e.g. a tool being written) keeps its previous version, and
+        is retried once the file changes again.
+        """
+        with self.lock:
+            changed = []
+            seen = set()
+            files = dict(self.files)
+            found = self.scan()
+            for toolset, paths in found.items():
+                for path in paths:
+                    seen.add(path)
+                    try:
+                        if self.refresh_file(toolset, path, files):
+                            changed.append(path)
+                    except ImportError as e:
+                        print(f"tool registry: keeping the previous version of {path}: {e}")
+            for path in list(files):
+                if path not in seen:
+                    del files[path]
+                    self.errors.pop(path, None)
+                    changed.append(path)
+            self.files = files
+            # A toolset directory with no tool modules is still a toolset
+            self.toolset_names = sorted(found.keys())
+            if changed:
+                self.save_index()
+            return changed
+
+    def refresh_file(self, toolset, path, files=None):
+        files = self.files if files is None else files
+        stat = os.stat(path)
+        entry = files.get(path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return False
+        error = self.errors.get(path)
+        if error and error['mtime'] == stat.st_mtime and error['size'] == stat.st_size:
+            # Failed to import and hasn't changed since
+            return False
+
+        with open(path, 'rb') as file:
+            source_hash = hashlib.sha256(file.read()).hexdigest()
+        if entry and entry['hash'] == source_hash:
+            # Touched but not modified, just remember the new mtime
+            files[path] = {**entry, 'mtime': stat.st_mtime, 'size': stat.st_size}
+            return False
+
+        if(self.debug):
+            print(f"tool registry: importing {path}")
+        module_name = f'src.tool.{toolset}.{os.path.basename(path)[:-3]}'
+        try:
+            module = self.import_module(module_name, path)
+            classes = self.describe_module(module, toolset, path, module_name, source_hash)
+        except Exception as e:
+            self.errors[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'error': str(e)}
+            raise ImportError(str(e))
+        # Replace any stale copy so importlib.import_module sees the new code
+        sys.modules[module_name] = module
+        self.errors.pop(path, None)
+        files[path] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': source_hash,
+            'toolset': toolset,
+            'module': module_name,
+            'classes': classes,
+        }
+        return True
+
+    def import_module(self, module_name, path):
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)  # Load the module into memory
+        except Exception as e:
+            # Handle possible import errors e.g. syntax errors, ImportError, etc.
+            raise ImportError(f'An error occurred when trying to import {module_name}: {e}')
+        return module
+
+    def describe_module(self, module, toolset, path, module_name, source_hash):
+        classes = {}
+        # Here we assume that the base class is named 'AbstractTool', and all tool classes inherit from it
+        for attribute_name in dir(module):
+            attribute = getattr(module, attribute_name)
+            if isinstance(attribute, type) and issubclass(attribute, AbstractTool) and attribute.__module__ == module.__name__:
+                tool = attribute()
+                classes[attribute_name] = {
+                    'class_name': attribute_name,
+                    'toolset': toolset,
+                    'module': module_name,
+                    'path': path,
+                    'hash': source_hash,
+                    'name': tool.name,
+                    'description': tool.description,
+                    'acknowledgement': tool.acknowledgement,
+                    'arguments': {
+                        name: {
+                            'datatype': properties['datatype'].__name__,
+                            'required': properties['required'],
+                            'prompt': properties['prompt'],
+                        }
+                        for name, properties in tool.arguments.items()
+                    },
+                }
+        return classes
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def find_toolsets(self):
+        self.ensure_loaded()
+        return list(self.toolset_names)
+
+    def get_tools(self, toolset=None):
+        """
+        Returns the records of every tool, optionally limited to one toolset.
+        """
+        self.ensure_loaded()
+        with self.lock:
+            return [record
+                for entry in self.files.values() if toolset is None or entry['toolset'] == toolset
+                for record in entry['classes'].values()]
+
+    def get_class_names_for_toolset(self, toolset):
+        self.ensure_loaded()
+        if toolset not in self.toolset_names:
+            raise FileNotFoundError(f'The toolset path {os.path.join(self.root, toolset)} does not exist.')
+        return [record['class_name'] for record in self.get_tools(toolset)]
+
+    def get_tool(self, tool_class_name, toolset=None):
+        """
+        Returns the record for a tool class, or None if it is not registered.
+        """
+        for record in self.get_tools(toolset):
+            if record['class_name'] == tool_class_name:
+                return record
+        return None
+
+    def get_tool_code(self, tool_class_name, toolset=None):
+        record = self.get_tool(tool_class_name, toolset)
+        if record is None:
+            raise FileNotFoundError(f"No tool class {tool_class_name} in toolset {toolset}")
+        with open(record['path'], 'r') as file:
+            return file.read()
+
+    def create_tool(self, tool_class_name, toolset=None):
+        """
+        Instantiates a registered tool class, or returns None if it is not registered.
+        """
+        record = self.get_tool(tool_class_name, toolset)
+        if record is None:
+            return None
+        tool_module = sys.modules.get(record['module']) or importlib.import_module(record['module'])
+        return getattr(tool_module, tool_class_name)()
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_default_registry():
+    """
+    Returns the process-wide registry for ./src/tool, creating it on first use.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ToolRegistry()
+        return _default_registry
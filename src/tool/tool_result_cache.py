@@ -0,0 +1,86 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# How a tool's output depends on its arguments (AbstractTool.idempotence)
+PURE = 'pure'                      # only on the arguments: cached until evicted
+CACHEABLE = 'cacheable'            # on the arguments and slowly changing data: cached for result_ttl seconds
+SIDE_EFFECTING = 'side_effecting'  # does something each time it runs: never cached
+
+class ToolResultCache:
+    """
+    In-memory LRU of tool outputs, keyed by the tool class and its formatted
+    argument values. Only pure and cacheable tools are memoized, and only
+    the output of runs that worked (AbstractTool.succeeded).
+    """
+
+    def __init__(self, max_entries=256, debug=False):
+        self.max_entries = max_entries
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, output)
+
+    @staticmethod
+    def is_cacheable(tool):
+        return getattr(tool, 'idempotence', SIDE_EFFECTING) in (PURE, CACHEABLE)
+
+    @staticmethod
+    def make_key(tool):
+        """
+        Returns the key for the tool's current argument values, or None when
+        one can't be converted to its datatype: that run reports the error
+        and isn't memoized.
+        """
+        try:
+            values = tool.coerced_argument_values()
+        except (ValueError, TypeError):
+            return None
+        arguments = {name: str(value) for name, value in values.items()}
+        parts = [tool.__class__.__module__, tool.__class__.__name__, arguments]
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (hit, output).
+        """
+        now = time.time()
+        with self.lock:
+            if key not in self.entries:
+                return False, None
+            expires_at, output = self.entries[key]
+            if expires_at is not None and expires_at <= now:
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, output
+
+    def set(self, tool, key, output):
+        if not self.is_cacheable(tool) or output is None or not tool.succeeded:
+            return
+        ttl = tool.result_ttl if tool.idempotence == CACHEABLE else None
+        with self.lock:
+            self.entries[key] = (time.time() + ttl if ttl is not None else None, output)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if(self.debug):
+            print(f"tool result cache: stored the output of {tool.name}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_default_result_cache = None
+_default_result_cache_lock = threading.Lock()
+
+def get_default_result_cache():
+    """
+    Returns the process-wide tool result cache, creating it on first use.
+    """
+    global _default_result_cache
+    with _default_result_cache_lock:
+        if _default_result_cache is None:
+            _default_result_cache = ToolResultCache()
+        return _default_result_cache
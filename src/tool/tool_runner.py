@@ -1,9 +1,62 @@
+from .tool_result_cache import get_default_result_cache
+from ..tracing import get_tracer
+
 class ToolRunner:
-    def __init__(self, tool, is_called_by_voice=False):
+    def __init__(self, tool, is_called_by_voice=False, executor=None, on_output=None, get_user_input=None, result_cache=None, use_cache=True):
+        """
+        Collects the required arguments, then runs the tool.
+        Without an executor the tool runs straight away and blocks until it is done;
+        with one (see ToolExecutor) it runs in the background and `handle` is its ToolRun.
+        `get_user_input(prompt)` asks the user for a missing argument, input() by default.
+
+        Pure and cacheable tools (see AbstractTool.idempotence) that ran before with
+        the same arguments get their memoized output instead, unless `use_cache` is False.
+        """
         self.tool = tool
+        if get_user_input is not None:
+            self.get_user_input = get_user_input
+        self.handle = None
+        self.cached = False
         # Start the process as soon as the object is created
         self.collect_required_arguments()
-        self.output = self.run_tool(is_called_by_voice=is_called_by_voice)
+
+        self.result_cache = result_cache or get_default_result_cache()
+        # A tool refused for voice says so, that's not its output
+        use_cache = use_cache and self.result_cache.is_cacheable(tool) and (tool.can_be_triggered_by_voice_command or not is_called_by_voice)
+        cache_key = self.result_cache.make_key(tool) if use_cache else None
+        if cache_key is not None:
+            with get_tracer().span("tool_result_cache", tool=tool.__class__.__name__) as span:
+                self.cached, output = self.result_cache.get(cache_key)
+                span.set(hit=self.cached)
+            if self.cached:
+                self.finished_output = output
+                if on_output is not None and output:
+                    on_output(output)
+                return
+
+        if executor is None:
+            self.finished_output = self.run_tool(is_called_by_voice=is_called_by_voice, on_output=on_output)
+            if cache_key is not None:
+                self.result_cache.set(tool, cache_key, self.finished_output)
+        else:
+            self.handle = executor.submit(tool, is_called_by_voice=is_called_by_voice, on_output=on_output)
+            if cache_key is not None:
+                self.handle.future.add_done_callback(lambda future: self.remember(cache_key, future))
+
+    def remember(self, cache_key, future):
+        # Runs that were cancelled, timed out or failed aren't memoized
+        if future.cancelled() or future.exception() is not None or self.handle.cancelled or self.handle.timed_out:
+            return
+        self.result_cache.set(self.tool, cache_key, future.result())
+
+    @property
+    def output(self):
+        """
+        The tool's output, waiting for it if the tool runs in the background.
+        """
+        if self.handle is not None:
+            return self.handle.result()
+        return self.finished_output
 
     def collect_required_arguments(self):
         while True:
@@ -16,9 +69,9 @@ class ToolRunner:
             # Store the provided answer
             self.tool.argument_values[next_required_argument] = answer
 
-    def run_tool(self, is_called_by_voice):
+    def run_tool(self, is_called_by_voice, on_output=None):
         # Execute the tool with the arguments collected
-        return self.tool.run(is_called_by_voice=is_called_by_voice)
+        return self.tool.run(is_called_by_voice=is_called_by_voice, on_output=on_output)
 
     def get_user_input(self, prompt):
         # Placeholder method for user input, replace as needed
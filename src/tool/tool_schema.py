@@ -0,0 +1,61 @@
+import json
+
+# add_argument datatypes -> JSON schema types
+JSON_SCHEMA_TYPES = {
+    'str': 'string',
+    'int': 'integer',
+    'float': 'number',
+    'bool': 'boolean',
+}
+
+def argument_schema(arguments):
+    """
+    JSON schema for a tool's argument values.
+    Every argument must be present, but may be null when it isn't known yet;
+    the ToolRunner asks the user for required arguments that are still missing.
+    """
+    properties = {}
+    for name, argument in arguments.items():
+        json_type = JSON_SCHEMA_TYPES.get(argument['datatype'], 'string')
+        properties[name] = {'anyOf': [{'type': json_type}, {'type': 'null'}]}
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(arguments.keys()),
+        'additionalProperties': False,
+    }
+
+def tool_choice_schema(tools):
+    """
+    JSON schema for a single `{toolset, tool, arguments}` decision over the given
+    tool registry records. Each tool is one alternative, so the model can only
+    produce a valid tool name together with that tool's typed arguments.
+    """
+    alternatives = []
+    for record in tools:
+        alternatives.append({
+            'type': 'object',
+            'properties': {
+                'tool': {'const': record['class_name']},
+                'toolset': {'const': record['toolset']},
+                'arguments': argument_schema(record['arguments']),
+            },
+            'required': ['tool', 'toolset', 'arguments'],
+            'additionalProperties': False,
+        })
+    # The model can also decide that no tool fits the query
+    alternatives.append({
+        'type': 'object',
+        'properties': {
+            'tool': {'type': 'null'},
+            'toolset': {'type': 'null'},
+            'arguments': {'type': 'object', 'properties': {}, 'additionalProperties': False},
+        },
+        'required': ['tool', 'toolset', 'arguments'],
+        'additionalProperties': False,
+    })
+    return {'oneOf': alternatives}
+
+def tool_choice_schema_json(tools):
+    # Property order is kept: the grammar makes the model name the tool before its arguments
+    return json.dumps(tool_choice_schema(tools))
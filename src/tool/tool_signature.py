@@ -0,0 +1,59 @@
+import threading
+
+def estimate_tokens(text):
+    """
+    Rough token count for when no tokenizer is at hand: ~4 characters per token.
+    """
+    return len(text) // 4 + 1
+
+class ToolSignatures:
+    """
+    Compact descriptions of tools for the decide_tool and decide_arguments prompts.
+
+    Instead of the tool's Python source, a signature is one line with the class
+    name and description, followed by one line per argument with its type,
+    whether it's required and the prompt we'd ask the user. Signatures are built
+    from tool registry records and cached by class name and source hash, along
+    with their token counts.
+    """
+
+    def __init__(self, count_tokens=estimate_tokens):
+        self.count_tokens = count_tokens
+        self.lock = threading.Lock()
+        self.cache = {}  # (class_name, source hash, short) -> (text, tokens)
+
+    def signature(self, record, short=False):
+        """
+        Returns (text, token count) for a tool. The short form leaves out the arguments.
+        """
+        key = (record['class_name'], record['hash'], short)
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        lines = [f"{record['class_name']}: {record['description']}"]
+        if not short:
+            for name, argument in record['arguments'].items():
+                required = "required" if argument['required'] else "optional"
+                lines.append(f"  {name} ({argument['datatype']}, {required}): {argument['prompt']}")
+        text = '\n'.join(lines) + '\n'
+        value = (text, self.count_tokens(text))
+        with self.lock:
+            self.cache[key] = value
+        return value
+
+    def render(self, records, budget=None):
+        """
+        Renders the signatures of several tools within a token budget.
+        Full signatures are used if they all fit, otherwise the short form,
+        otherwise just the class names (even over budget: the LLM has to
+        see every tool it can choose).
+        """
+        for short in (False, True):
+            signatures = [self.signature(record, short) for record in records]
+            if budget is None or sum(tokens for _, tokens in signatures) <= budget:
+                return ''.join(text for text, _ in signatures)
+        return ''.join(f"{record['class_name']}\n" for record in records)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
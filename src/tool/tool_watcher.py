@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import importlib
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+class ToolWatcher:
+    """
+    Watches the tool tree and hot-reloads tools while the assistant runs.
+
+    On a change the registry re-imports only the tool modules that changed
+    and swaps its index in one go (see ToolRegistry.refresh). Helper modules
+    that tools load (e.g. the entry points in scripts/) are reloaded if they
+    were imported. Subscribers are then called with the changed paths, to
+    invalidate what was derived from the old tools: tool signatures, KV
+    prefixes of prompts that listed them, the EmbeddingRouter's tool vectors
+    and so on.
+
+    Uses watchdog if it is installed, otherwise polls every `interval` seconds.
+    """
+
+    def __init__(self, registry, interval=1.0, debounce=0.25, debug=False):
+        self.registry = registry
+        self.interval = interval
+        self.debounce = debounce
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.helper_mtimes = {}  # helper module path -> mtime
+        self.observer = None
+        self.timer = None
+        self.stopped = threading.Event()
+
+    def subscribe(self, callback):
+        """
+        Calls `callback(changed_paths)` after every reload.
+        """
+        self.subscribers.append(callback)
+        return callback
+
+    def helper_modules(self):
+        """
+        Yields (path, module name) for the .py files under the toolset
+        packages' subdirectories, which aren't tool modules themselves.
+        """
+        root = self.registry.root
+        for directory, _, files in os.walk(root):
+            depth = os.path.relpath(directory, root).count(os.sep)
+            if directory == root or depth < 1 or '__pycache__' in directory:
+                continue
+            for file in files:
+                if file.endswith('.py'):
+                    path = os.path.join(directory, file)
+                    relative = os.path.relpath(path, root)[:-3]
+                    module_name = 'src.tool.' + relative.replace(os.sep, '.')
+                    if module_name.endswith('.__init__'):
+                        module_name = module_name[:-len('.__init__')]
+                    yield path, module_name
+
+    def reload_helpers(self):
+        changed = []
+        for path, module_name in self.helper_modules():
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            previous = self.helper_mtimes.get(path)
+            self.helper_mtimes[path] = mtime
+            if previous is None or previous == mtime:
+                continue
+            changed.append(path)
+            module = sys.modules.get(module_name)
+            if module is None:
+                continue
+            if(self.debug):
+                print(f"tool watcher: reloading {module_name}")
+            try:
+                importlib.reload(module)
+            except Exception as e:
+                print(f"tool watcher: keeping the previous version of {module_name}: {e}")
+        return changed
+
+    def check(self):
+        """
+        Reloads whatever changed and notifies the subscribers.
+        Returns the changed paths.
+        """
+        with self.lock:
+            changed = self.registry.refresh() + self.reload_helpers()
+        if changed:
+            if(self.debug):
+                print(f"tool watcher: {len(changed)} files changed")
+            for callback in self.subscribers:
+                try:
+                    callback(changed)
+                except Exception as e:
+                    print(f"tool watcher: subscriber failed: {e}")
+        return changed
+
+    def schedule_check(self):
+        # Editors write files in several steps, wait for them to settle
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce, self.check)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def poll(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"tool watcher: {e}")
+
+    def start(self):
+        self.registry.ensure_loaded()
+        # Remember the helpers' current versions, only later changes are reloaded
+        self.reload_helpers()
+        if Observer is not None:
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    paths = [getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')]
+                    if any(str(path).endswith('.py') for path in paths):
+                        watcher.schedule_check()
+
+            self.observer = Observer()
+            self.observer.schedule(Handler(), self.registry.root, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+        else:
+            threading.Thread(target=self.poll, name="tool-watcher", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
@@ -1,146 +1,313 @@
-import os
-import importlib
-import importlib.util
-import re
+import threading
+from collections import Counter
 
 from .tool.abstract_tool import AbstractTool
 from .tool.tool_runner import ToolRunner
+from .tool.tool_registry import get_default_registry
+from .tool.tool_executor import get_default_executor
+from .tool.tool_signature import ToolSignatures
+from .tracing import get_tracer
 from .tool.financial.currency_converter_tool import CurrencyConverterTool
 from .tool.pantheon.clear_caches_tool import ClearCachesTool
 
+class ToolsetCounts:
+    """
+    How often each toolset was chosen, to guess the likely ones. Share one
+    between the ToolChoosers of a session; it can be updated from several
+    threads at once.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, toolset):
+        with self.lock:
+            self.counts[toolset] += 1
+
+    def most_chosen_first(self, toolsets):
+        with self.lock:
+            counts = dict(self.counts)
+        return sorted(toolsets, key=lambda toolset: -counts.get(toolset, 0))
+
 class ToolChooser:
-    def __init__(self, query, context, llm_driver, is_called_by_voice, debug=False):
+
+    def __init__(self, query, context, llm_driver, is_called_by_voice, debug=False, registry=None, router=None, single_pass=False, signatures=None, prompt_token_budget=1024, speculative=0, executor=None, get_user_input=None, toolset_counts=None):
         self.query = query
+        # A context string, or a ContextStore that renders the context each prompt needs
         self.context = context
         self.llm_driver = llm_driver
         self.is_called_by_voice = is_called_by_voice
         self.debug = debug
+        # The registry is shared between queries so tool modules are only imported once
+        self.registry = registry or get_default_registry()
+        # Optional pre-router (e.g. EmbeddingRouter) that can pick the tool without the LLM
+        self.router = router
+        # Decide the tool and its arguments in one generation, if the driver supports it
+        self.single_pass = single_pass
+        # Tools are described to the LLM by compact signatures rather than their source.
+        # They are cached by the driver between queries (and cleared when tools are reloaded).
+        self.signatures = signatures or getattr(llm_driver, 'signatures', None) or ToolSignatures(count_tokens=llm_driver.count_tokens)
+        self.prompt_token_budget = prompt_token_budget
+        # Number of likely toolsets to run decide_tool for while decide_toolset is still running.
+        # Only worth it with a backend that serves several requests at once (Ollama, llama.cpp server).
+        self.speculative = speculative
+        # How often each toolset was chosen, to order the speculative decisions
+        self.toolset_counts = toolset_counts if toolset_counts is not None else ToolsetCounts()
+        # ToolExecutor to run tools in the background with (see execute_tool_in_background)
+        self.executor = executor
+        # How the ToolRunner asks the user for missing arguments, input() if None
+        self.get_user_input = get_user_input
+
+    def context_for(self, kind):
+        """
+        The context to put in a prompt of the given kind (toolset, tool, arguments...).
+        """
+        if hasattr(self.context, 'render'):
+            return self.context.render(kind)
+        return self.context
 
     def find_toolsets(self):
-        return [name for name in os.listdir('./src/tool') 
-            if os.path.isdir(os.path.join('./src/tool', name)) and name != "__pycache__"]
+        return self.registry.find_toolsets()
     
     def get_tool_code_by_class_name(self, toolset, tool_class_name):
         """
         Retrieves the Python code for a specific tool based on the tool's class name.
-        Assumes that the file naming follows the convention that the file name is
-        the snake_case version of the class name and ends with '_tool.py'.
+        The tool registry knows which file each tool class lives in.
         """
 
         if(self.debug):
             print(f"get_tool_code_by_class_name:toolset {toolset},tool_class_name {tool_class_name}")
         
-        tool_name = '_'.join([word.lower() for word in re.findall('[A-Z][^A-Z]*', tool_class_name)])
-        tool_filename = f'{tool_name}.py'
-        toolset_path = os.path.join('src/tool', toolset)
-        filepath = os.path.join(toolset_path, tool_filename)
-        
-        if not os.path.isfile(filepath):
-            raise FileNotFoundError(f"No such file: {filepath}")
-        
-        with open(filepath, 'r') as file:
-            tool_code = file.read()
-        return tool_code
+        return self.registry.get_tool_code(tool_class_name, toolset)
+
+    def get_toolset_signatures(self, toolset):
+        """
+        Returns the compact signatures of every tool in the toolset,
+        fitted into the prompt token budget.
+        """
+        # Raises FileNotFoundError for unknown toolsets
+        self.get_class_names_for_toolset(toolset)
+        return self.signatures.render(self.registry.get_tools(toolset), self.prompt_token_budget)
+
+    def get_tool_signature(self, tool_class_name):
+        record = self.registry.get_tool(tool_class_name)
+        if record is None:
+            raise FileNotFoundError(f"No tool class {tool_class_name}")
+        return self.signatures.render([record], self.prompt_token_budget)
 
     def get_class_names_for_toolset(self, toolset):
         if(self.debug):
             print(f"get_class_names_for_toolset:toolset {toolset}")
-        # Assuming toolset refers to a directory within the 'src/tool' package
-        toolset_path = f'./src/tool/{toolset}'
-        if not os.path.isdir(toolset_path):
-            raise FileNotFoundError(f'The toolset path {toolset_path} does not exist.')
-    
-        class_names = []
-        for file in os.listdir(toolset_path):
-            # We only want `.py` files and we ignore `__init__.py`
-            if file.endswith('.py') and not file.startswith('__'):
-                module_name = file[:-3]
-                # Construct the full module path
-                full_module_path = f'src.tool.{toolset}.{module_name}'
-                spec = importlib.util.spec_from_file_location(full_module_path, os.path.join(toolset_path, file))
-                module = importlib.util.module_from_spec(spec)
-    
-                try:
-                    spec.loader.exec_module(module)  # Load the module into memory
-                except Exception as e:
-                    # Handle possible import errors e.g. syntax errors, ImportError, etc.
-                    raise ImportError(f'An error occurred when trying to import {module_name}: {e}')
-                
-                # Add classes defined in the module that are subclasses of a given Base class (if applicable)
-                # Here we assume that the base class is named 'AbstractTool', and all tool classes inherit from it
-                for attribute_name in dir(module):
-                    attribute = getattr(module, attribute_name)
-                    if isinstance(attribute, type) and issubclass(attribute, AbstractTool) and attribute.__module__ == module.__name__:
-                        class_names.append(attribute_name)
-                        
-        return class_names
+        return self.registry.get_class_names_for_toolset(toolset)
     
+    def driver_for(self, tool):
+        """
+        Returns the LLM driver to use for a tool, bypassing any response cache
+        if the tool opted out of caching.
+        """
+        if tool is not None and tool.ignore_caching:
+            return getattr(self.llm_driver, 'uncached_driver', self.llm_driver)
+        return self.llm_driver
+
+    def route_tool(self):
+        """
+        Asks the pre-router for a tool. Returns None when there is no router,
+        or when the router isn't confident and the LLM should decide.
+        """
+        if self.router is None:
+            return None
+        try:
+            route = self.router.route(self.query)
+        except NotImplementedError:
+            # The driver can't embed, always fall back to the LLM
+            return None
+        if route is None:
+            return None
+        toolset, tool_class_name = route
+        if(self.debug):
+            print(f"routed to: {toolset} {tool_class_name}")
+        return self.registry.create_tool(tool_class_name, toolset)
+
+    def likely_toolsets(self, toolsets):
+        """
+        Orders the toolsets from most to least likely for the query:
+        by the pre-router's scores if there is one, otherwise by how often
+        each toolset has been chosen.
+        """
+        ranked = []
+        if self.router is not None and hasattr(self.router, 'top_k'):
+            try:
+                for (toolset, _), _ in self.router.top_k(self.query, k=len(self.registry.get_tools())):
+                    if toolset not in ranked:
+                        ranked.append(toolset)
+            except NotImplementedError:
+                pass
+        if not ranked:
+            return self.toolset_counts.most_chosen_first(toolsets)
+        return [toolset for toolset in ranked if toolset in toolsets] + [toolset for toolset in toolsets if toolset not in ranked]
+
+    def choose_tool_speculatively(self, toolsets):
+        """
+        Runs decide_toolset and, at the same time, decide_tool for the most
+        likely toolsets. Returns (toolset, tool class name); the decide_tool
+        requests for the toolsets that weren't chosen are cancelled.
+        """
+        candidates = self.likely_toolsets(toolsets)[:self.speculative]
+        if(self.debug):
+            print(f"deciding toolset, speculating on {candidates}...")
+        toolset_future = self.llm_driver.submit('decide_toolset', toolsets, self.query, self.context_for('toolset'))
+        tool_futures = {
+            candidate: self.llm_driver.submit('decide_tool', self.get_toolset_signatures(candidate), self.query, self.context_for('tool'))
+            for candidate in candidates
+        }
+        toolset = None
+        try:
+            toolset = toolset_future.result()
+        finally:
+            for candidate, future in tool_futures.items():
+                if candidate != toolset:
+                    future.cancel()
+        if(self.debug):
+            print(f"chose: {toolset}")
+        if not toolset:
+            return None, None
+        if toolset in tool_futures:
+            return toolset, tool_futures[toolset].result()
+        if(self.debug):
+            print(f"speculation missed, deciding tool...")
+        return toolset, self.llm_driver.decide_tool(self.get_toolset_signatures(toolset), self.query, self.context_for('tool'))
+
     def choose_tool(self):
-        
+        with get_tracer().span("choose_tool", query=self.query) as span:
+            tool = self.decide_and_create_tool()
+            span.set(tool=tool.__class__.__name__ if tool is not None else None)
+            return tool
+
+    def decide_and_create_tool(self):
+        tracer = get_tracer()
+
+        with tracer.span("route_tool"):
+            routed_tool = self.route_tool()
+        if routed_tool is not None:
+            return routed_tool
+
+        if self.speculative:
+            with tracer.span("decide_toolset_and_tool", speculative=self.speculative):
+                toolset, tool_class_name = self.choose_tool_speculatively(self.find_toolsets())
+            if not toolset or not tool_class_name:
+                return None
+            self.toolset_counts.add(toolset)
+            with tracer.span("create_tool", tool=tool_class_name):
+                return self.registry.create_tool(tool_class_name, toolset)
+
         # Toolsets should be listing the packages inside './tool'
-        toolsets = self.find_toolsets()
+        with tracer.span("find_toolsets"):
+            toolsets = self.find_toolsets()
         if(self.debug):
             print(f"deciding toolset...")
-        toolset = self.llm_driver.decide_toolset(toolsets, self.query, self.context)
+        with tracer.span("decide_toolset", toolsets=len(toolsets)) as span:
+            toolset = self.llm_driver.decide_toolset(toolsets, self.query, self.context_for('toolset'))
+            span.set(toolset=toolset)
         if(self.debug):
             print(f"chose: {toolset}")
         if not toolset:
             return None
+        self.toolset_counts.add(toolset)
         
-        # toolset is the name of the package.
-        toolset_package = f'src.tool.{toolset}'
-    
-        # Assuming we can list class names per toolset from some method `get_class_names_for_toolset`
-        tool_class_names = self.get_class_names_for_toolset(toolset)
-        
-        # Concatenating the code for each tool in the toolset
-        toolset_code = ""
-        for tool_class_name in tool_class_names:
-            toolset_code += self.get_tool_code_by_class_name(toolset, tool_class_name)
+        # Describing each tool in the toolset within the prompt token budget
+        with tracer.span("toolset_signatures", toolset=toolset):
+            toolset_code = self.get_toolset_signatures(toolset)
         
         if(self.debug):
             print(f"deciding tool...")
-        tool_class_name = self.llm_driver.decide_tool(toolset_code, self.query, self.context)
+        with tracer.span("decide_tool", toolset=toolset) as span:
+            tool_class_name = self.llm_driver.decide_tool(toolset_code, self.query, self.context_for('tool'))
+            span.set(tool=tool_class_name)
         if not tool_class_name:
             return None
         if(self.debug):
             print(f"chose: {tool_class_name}")
     
-        # Convention to transform class name to module name: CurrencyConverterTool -> currency_converter_tool
-        tool_module_name = '_'.join([word.lower() for word in re.findall('[A-Z][^A-Z]*', tool_class_name)])
-        
-        # Properly import the class from the tool package using module name and class name
-        tool_module = importlib.import_module(f'.{tool_module_name}', toolset_package)
-        tool_class = getattr(tool_module, tool_class_name)()
+        # The registry imports the module the class was found in and instantiates it
+        with tracer.span("create_tool", tool=tool_class_name):
+            tool_class = self.registry.create_tool(tool_class_name, toolset)
         
         return tool_class
 
     def configure_tool(self, tool):
         # Get the class name of the tool
         tool_class_name = tool.__class__.__name__
-        # Retrieve the code for the tool by its class name
-        tool_code = self.get_tool_code_by_class_name(tool.toolset, tool_class_name)
-        
-        # Set the arguments of the tool using the LLM and the provided query and context
-        if(self.debug):
-            print(f"deciding arguments...")
-        tool.argument_values = self.llm_driver.decide_arguments(tool_code, self.query, self.context)
+        with get_tracer().span("configure_tool", tool=tool_class_name):
+            # Describe the tool by its signature rather than its code
+            tool_code = self.get_tool_signature(tool_class_name)
+            
+            # Set the arguments of the tool using the LLM and the provided query and context
+            if(self.debug):
+                print(f"deciding arguments...")
+            with get_tracer().span("decide_arguments", tool=tool_class_name) as span:
+                argument_values = self.driver_for(tool).decide_arguments(tool_code, self.query, self.context_for('arguments'))
+                span.set(arguments=len(argument_values or {}))
+            # Arguments the LLM couldn't fill in stay None, the ToolRunner asks for them
+            if argument_values:
+                tool.argument_values.update({name: value for name, value in argument_values.items() if name in tool.arguments})
         if(self.debug):
             print(f"args:")
             print(tool.argument_values);
     
-    def execute_tool(self, tool):
+    def execute_tool(self, tool, use_cache=True):
         if(self.debug):
             print(f"running the tool...")
-        #here the toolrunner will ask questions about any remaining required arguments
-        runner = ToolRunner(tool, self.is_called_by_voice)
+        with get_tracer().span("execute_tool", tool=tool.__class__.__name__):
+            #here the toolrunner will ask questions about any remaining required arguments
+            runner = ToolRunner(tool, self.is_called_by_voice, get_user_input=self.get_user_input, use_cache=use_cache)
         if(self.debug):
             print(f"finished running the tool.")
         return runner.output
 
-    def choose_and_run(self):
-        tool = self.choose_tool()
-        if(not tool):
+    def execute_tool_in_background(self, tool, on_output=None, use_cache=True):
+        """
+        Asks for any missing required arguments, then starts the tool on the
+        executor and returns straight away. The ToolRunner's `handle` can be
+        waited on or cancelled, and `on_output` receives output lines as they come.
+        With `use_cache` False, pure and cacheable tools run even if their output is memoized.
+        """
+        if(self.debug):
+            print(f"starting the tool...")
+        return ToolRunner(tool, self.is_called_by_voice, executor=self.executor or get_default_executor(), on_output=on_output, get_user_input=self.get_user_input, use_cache=use_cache)
+
+    def choose_and_configure_tool(self):
+        """
+        Chooses and configures a tool with a single LLM decision.
+        Raises NotImplementedError if the driver can't decide in one pass.
+        """
+        if(self.debug):
+            print(f"deciding tool and arguments...")
+        with get_tracer().span("decide_tool_and_arguments") as span:
+            decision = self.llm_driver.decide_tool_and_arguments(self.registry.get_tools(), self.query, self.context_for('tool_and_arguments'))
+            span.set(tool=decision['tool'] if decision else None)
+        if(self.debug):
+            print(f"chose: {decision}")
+        if not decision:
             return None
-        self.configure_tool(tool)
+        tool = self.registry.create_tool(decision['tool'], decision['toolset'])
+        if tool is None:
+            return None
+        tool.argument_values.update(decision['arguments'])
+        return tool
+
+    def choose_and_run(self):
+        tool = None
+        if self.single_pass:
+            try:
+                tool = self.choose_and_configure_tool()
+                if(not tool):
+                    return None
+            except NotImplementedError:
+                tool = None
+        if tool is None:
+            tool = self.choose_tool()
+            if(not tool):
+                return None
+            self.configure_tool(tool)
         return self.execute_tool(tool)
\ No newline at end of file
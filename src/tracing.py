@@ -0,0 +1,191 @@
+"""
+Structured tracing for the hot paths.
+
+Code wraps the work it wants timed in a span:
+
+    with get_tracer().span("decide_toolset", toolsets=len(toolsets)) as span:
+        ...
+        span.set(prompt_tokens=123)
+
+Spans nest (within a thread, and into LLMDriver.submit calls) and are handed
+to the tracer's sinks when they end: a JSONL file, an in-memory ring buffer
+(shown in the curses UI) or an OpenTelemetry exporter. Without any sink,
+span() does nothing but time the block, so the instrumentation can stay in.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration_ms': self.duration * 1000 if self.duration is not None else None,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+class Tracer:
+    def __init__(self):
+        self.sinks = []
+        self.lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self.lock:
+            self.sinks = self.sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        with self.lock:
+            self.sinks = [other for other in self.sinks if other is not sink]
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, **attributes):
+        """
+        Starts a span that is not made the current one, for generators and
+        async code where the span outlives the block that started it.
+        End it with finish().
+        """
+        return Span(name, _current_span.get(), attributes)
+
+    def finish(self, span):
+        span.end()
+        for sink in self.sinks:
+            try:
+                sink.emit(span)
+            except Exception as e:
+                # A broken sink must not break the code being traced
+                print(f"Tracing sink {sink.__class__.__name__} failed: {e}")
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    def annotate(self, **attributes):
+        """
+        Adds attributes to the current span, if there is one.
+        """
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+class JsonlSink:
+    """
+    Appends every span as a line of JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a')
+
+    def emit(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class RingBufferSink:
+    """
+    Keeps the last `size` spans in memory. `on_span` is called with each
+    span as it ends, e.g. to tell the UI to redraw.
+    """
+
+    def __init__(self, size=200, on_span=None):
+        self.buffer = deque(maxlen=size)
+        self.on_span = on_span
+
+    def emit(self, span):
+        self.buffer.append(span)
+        if self.on_span is not None:
+            self.on_span(span)
+
+    def spans(self):
+        return list(self.buffer)
+
+class OpenTelemetrySink:
+    """
+    Re-emits the spans through OpenTelemetry, so any OTLP exporter or
+    collector can receive them. Needs the opentelemetry-api package, with
+    the SDK configured by the application.
+    """
+
+    def __init__(self, tracer_name="jone"):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError("OpenTelemetrySink needs the opentelemetry-api package: pip install opentelemetry-api opentelemetry-sdk")
+        self.tracer = trace.get_tracer(tracer_name)
+
+    def emit(self, span):
+        start_ns = int(span.start_time * 1e9)
+        attributes = {key: value if isinstance(value, (str, bool, int, float)) else str(value) for key, value in span.attributes.items()}
+        attributes.update({'jone.trace_id': span.trace_id, 'jone.span_id': span.span_id})
+        if span.parent_id:
+            attributes['jone.parent_id'] = span.parent_id
+        otel_span = self.tracer.start_span(span.name, start_time=start_ns, attributes=attributes)
+        if span.error:
+            otel_span.set_attribute('error', span.error)
+        otel_span.end(end_time=start_ns + int(span.duration * 1e9))
+
+def format_span(span):
+    """
+    One line summary of a span, for logs and the UI.
+    """
+    attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items() if value is not None)
+    return f"{span.name} {span.duration * 1000:.0f}ms {attributes}".rstrip()
+
+_tracer = Tracer()
+
+def get_tracer():
+    return _tracer
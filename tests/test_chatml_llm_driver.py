@@ -0,0 +1,23 @@
+import pytest
+
+from src.llm.fake_llm_driver import FakeLLMDriver
+
+@pytest.fixture
+def driver():
+    return FakeLLMDriver()
+
+def test_fit_cuts_text_to_its_share(driver):
+    driver.prompt_token_budget = 40
+    text = "word " * 100
+    fitted = driver.fit(text)
+    assert fitted.endswith("...")
+    assert driver.count_tokens(fitted[:-3]) <= 20
+    assert driver.fit("short") == "short"
+
+@pytest.mark.parametrize("budget, share", [(0, 0.5), (-10, 0.5), (1, 0.5)])
+def test_fit_without_a_budget_left(driver, budget, share):
+    driver.prompt_token_budget = budget
+    assert driver.fit("word " * 100, share=share) == ""
+
+def test_fit_without_a_budget(driver):
+    assert driver.fit("word " * 100) == "word " * 100
@@ -0,0 +1,47 @@
+from src.tool.embedding_router import EmbeddingRouter
+from src.tool.tool_registry import get_default_registry
+from src.tool_chooser import ToolChooser
+
+KEYWORDS = ["caches", "sftp", "amounts", "currency", "remember"]
+
+class KeywordEmbeddings:
+    """
+    Embeds a text as the counts of a few keywords, and records what it embedded.
+    """
+    name = "keywords"
+    model_id = "v1"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.append(list(texts))
+        return [[text.lower().count(word) + 0.01 for word in KEYWORDS] for text in texts]
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+def test_tools_are_only_embedded_when_built(tmp_path):
+    driver = KeywordEmbeddings()
+    router = EmbeddingRouter(get_default_registry(), driver, path=str(tmp_path / "embeddings.npz"))
+    assert router.route("clear the caches on dev") == ("pantheon", "ClearCachesTool")
+    assert router.route("get the sftp credentials") == ("pantheon", "SftpJsonTool")
+    assert len(driver.embedded) == 3
+    assert driver.embedded[1:] == [["clear the caches on dev"], ["get the sftp credentials"]]
+    # Nothing changed, nothing to embed
+    router.build()
+    assert len(driver.embedded) == 3
+
+def test_embeddings_persist_for_the_same_model(tmp_path):
+    path = str(tmp_path / "embeddings.npz")
+    EmbeddingRouter(get_default_registry(), KeywordEmbeddings(), path=path).build()
+    driver = KeywordEmbeddings()
+    EmbeddingRouter(get_default_registry(), driver, path=path).build()
+    assert driver.embedded == []
+
+def test_tool_chooser_skips_the_llm_when_routed(tmp_path):
+    driver = KeywordEmbeddings()
+    router = EmbeddingRouter(get_default_registry(), driver, path=str(tmp_path / "embeddings.npz"))
+    chooser = ToolChooser("clear the caches on dev", "", driver, is_called_by_voice=False, router=router)
+    tool = chooser.route_tool()
+    assert tool.__class__.__name__ == "ClearCachesTool"
@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+from src.tool.financial.scripts.currency_conversion import parse_amounts
+from src.tool.financial.scripts.exchange_rates import RateStore
+
+SEED = {
+    "base": "USD",
+    "dates": ["2024-01-02", "2024-06-03"],
+    "rates": {
+        "USD": [1.0, 1.0],
+        "EUR": [0.9, 0.92],
+        "GBP": [0.8, 0.78],
+        "JPY": [140.0, 157.0],
+    },
+}
+
+class DictSource:
+    def __init__(self, data):
+        self.data = data
+
+    def fetch(self):
+        return self.data
+
+def write_seed(path, seed):
+    with open(path, 'w') as file:
+        json.dump(seed, file)
+
+@pytest.fixture
+def seed_path(tmp_path):
+    path = str(tmp_path / "rates.json")
+    write_seed(path, SEED)
+    return path
+
+@pytest.fixture
+def store(tmp_path, seed_path):
+    return RateStore(snapshot_path=str(tmp_path / "snapshot" / "rates.npy"), seed_path=seed_path)
+
+def test_cross_rates(store):
+    assert store.cross_rate("EUR", "GBP") == pytest.approx(0.78 / 0.92)
+    assert store.convert(100, "euros", "yen") == pytest.approx(100 * 157.0 / 0.92)
+    converted = store.convert_batch([1, 2, 3], ["EUR", "GBP", "USD"], "JPY")
+    assert converted.tolist() == pytest.approx([157.0 / 0.92, 2 * 157.0 / 0.78, 3 * 157.0])
+
+def test_date_resolution(store):
+    assert store.cross_rate("USD", "EUR") == pytest.approx(0.92)
+    assert store.cross_rate("USD", "EUR", "2024-01-02") == pytest.approx(0.9)
+    # The latest rates on or before the date
+    assert store.cross_rate("USD", "EUR", "2024-03-15") == pytest.approx(0.9)
+    assert store.cross_rate("USD", "EUR", "2025-01-01") == pytest.approx(0.92)
+    with pytest.raises(ValueError):
+        store.cross_rate("USD", "EUR", "2023-12-31")
+
+def test_unknown_currency(store):
+    with pytest.raises(ValueError):
+        store.convert(1, "USD", "XYZ")
+
+def test_refresh_rebases_on_our_base(store):
+    day = store.refresh(DictSource({"base": "EUR", "date": "2024-07-01", "rates": {"USD": 1.25, "GBP": 0.85, "SEK": 11.5}}))
+    assert day == "2024-07-01"
+    assert store.base == "USD"
+    assert store.cross_rate("USD", "EUR") == pytest.approx(1 / 1.25)
+    assert store.cross_rate("USD", "GBP") == pytest.approx(0.85 / 1.25)
+    assert store.cross_rate("EUR", "SEK") == pytest.approx(11.5)
+    # Left out by the source: the previous rate
+    assert store.cross_rate("USD", "JPY") == pytest.approx(157.0)
+    # New currencies have no rate for the dates before
+    with pytest.raises(ValueError):
+        store.cross_rate("USD", "SEK", "2024-06-03")
+
+def test_refresh_without_our_base(store):
+    with pytest.raises(ValueError):
+        store.refresh(DictSource({"base": "EUR", "date": "2024-07-01", "rates": {"GBP": 0.85}}))
+
+def test_edited_seed_keeps_the_refreshed_dates(tmp_path, seed_path, store):
+    store.refresh(DictSource({"base": "USD", "date": "2024-07-01", "rates": {"EUR": 0.93}}))
+    write_seed(seed_path, dict(SEED, rates=dict(SEED["rates"], EUR=[0.9, 0.95])))
+    later = os.path.getmtime(store.snapshot_path) + 10
+    os.utime(seed_path, (later, later))
+
+    reloaded = RateStore(snapshot_path=store.snapshot_path, seed_path=seed_path)
+    assert [str(day) for day in reloaded.dates] == ["2024-01-02", "2024-06-03", "2024-07-01"]
+    assert reloaded.cross_rate("USD", "EUR", "2024-06-03") == pytest.approx(0.95)
+    assert reloaded.cross_rate("USD", "EUR") == pytest.approx(0.93)
+
+def test_parse_amounts():
+    assert parse_amounts("1,200.50\n$300\n45") == [1200.5, 300.0, 45.0]
+    assert parse_amounts("100,200") == [100200.0]
+    assert parse_amounts("100, 200 -5 .5") == [100.0, 200.0, -5.0, 0.5]
+    assert parse_amounts("no figures here") == []
@@ -0,0 +1,138 @@
+import time
+import threading
+
+import pytest
+
+from src.bench.fake_ollama_server import FakeOllamaServer
+from src.llm.abstract_llm_driver import AbstractLLMDriver, call_cancelled
+from src.llm.llm_driver_pool import LLMDriverPool
+from src.llm.ollama_llm_driver import OllamaLLMDriver
+
+class NamedDriver:
+    """
+    Answers every prompt with its own name, so we can tell which server answered.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def completion_for(self, prompt):
+        return self.name
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def simulate_latency(self, prompt, completion):
+        pass
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def servers(*configs):
+        for name, options in configs:
+            started.append(FakeOllamaServer(NamedDriver(name), **options).start())
+        return started[-len(configs):]
+
+    yield servers
+    for server in started:
+        server.stop()
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make_pool(drivers, **options):
+        pool = LLMDriverPool(drivers, health_interval=0, **options)
+        pools.append(pool)
+        return pool
+
+    yield make_pool
+    for pool in pools:
+        pool.close()
+
+def ollama(server):
+    return OllamaLLMDriver(api_url=server.url, model="fake")
+
+def test_routes_to_the_fastest_backend(servers, make_pool):
+    slow, fast = servers(("slow", {"latency": 0.3}), ("fast", {"latency": 0.02}))
+    pool = make_pool([ollama(slow), ollama(fast)], max_hedges=0)
+    answers = [pool.generate_response("prompt") for _ in range(6)]
+    # Each gets a first call to be timed, then the fast one takes over
+    assert answers.count("fast") >= 5
+    assert slow.requests == 1
+
+def test_latency_is_tracked_per_method(servers, make_pool):
+    only, = servers(("only", {"latency": 0.02}))
+    pool = make_pool([ollama(only)], max_hedges=0)
+    pool.generate_response("prompt")
+    backend = pool.backends[0]
+    assert set(backend.latencies) == {"generate_response"}
+    # Another method isn't assumed to take as long
+    assert pool.deadline("personality") == max(pool.min_hedge, pool.hedge_factor * pool.default_latency)
+
+def test_hedges_a_slow_call_and_cancels_the_loser(servers, make_pool):
+    stalled, fast = servers(("stalled", {"latency": 3.0}), ("fast", {"latency": 0.02}))
+    pool = make_pool([ollama(stalled), ollama(fast)], hedge_after=0.2)
+    start = time.perf_counter()
+    assert pool.generate_response("prompt") == "fast"
+    assert time.perf_counter() - start < 1.0
+    # The stalled request was cancelled, not left running
+    deadline = time.monotonic() + 1.0
+    while pool.backends[0].in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.backends[0].in_flight == 0
+    assert pool.backends[0].failures == 0
+    assert "generate_response" not in pool.backends[0].latencies
+
+def test_fails_over_and_backs_off(servers, make_pool):
+    broken, working = servers(("broken", {"fail_rate": 1.0}), ("working", {}))
+    pool = make_pool([ollama(broken), ollama(working)], max_hedges=0)
+    assert pool.generate_response("prompt") == "working"
+    assert pool.backends[0].failures == 1
+    # Out of rotation for a while
+    assert pool.generate_response("prompt") == "working"
+    assert broken.requests == 1
+
+def test_raises_when_every_backend_fails(servers, make_pool):
+    first, second = servers(("first", {"fail_rate": 1.0}), ("second", {"fail_rate": 1.0}))
+    pool = make_pool([ollama(first), ollama(second)], max_hedges=0)
+    with pytest.raises(RuntimeError):
+        pool.generate_response("prompt")
+
+class SlowDriver(AbstractLLMDriver):
+    """
+    Generates for `seconds`, unless its call is cancelled, like LocalLLMDriver.
+    """
+
+    def __init__(self, name, seconds):
+        super().__init__(name=name)
+        self.seconds = seconds
+        self.stopped_early = threading.Event()
+
+    def generate_response(self, text, **kwargs):
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            if call_cancelled():
+                self.stopped_early.set()
+                return ""
+            time.sleep(0.01)
+        return self.name
+
+    def decide_toolset(self, toolsets, query, context):
+        pass
+
+    def decide_tool(self, toolset, query, context):
+        pass
+
+    def decide_arguments(self, tool_code, query, context):
+        pass
+
+def test_cancelled_loser_stops_generating(make_pool):
+    slow, fast = SlowDriver("slow", 5.0), SlowDriver("fast", 0.05)
+    pool = make_pool([slow, fast], hedge_after=0.1)
+    assert pool.generate_response("prompt") == "fast"
+    assert slow.stopped_early.wait(1.0)
+    # What it returned after being cancelled isn't timed
+    time.sleep(0.05)
+    assert "generate_response" not in pool.backends[0].latencies
@@ -0,0 +1,119 @@
+import pytest
+
+from src.llm.abstract_llm_driver import AbstractLLMDriver
+from src.llm.cached_llm_driver import CachedLLMDriver
+from src.llm.decision_log import DecisionLog
+from src.llm.fake_llm_driver import FakeLLMDriver
+from src.llm.logging_llm_driver import LoggingLLMDriver
+from src.llm.response_cache import ResponseCache
+from src.tool.tool_registry import get_default_registry
+
+QUERY = "clear the caches on dev"
+DECISION = {"toolset": "pantheon", "tool": "ClearCachesTool", "arguments": {"site": "mysite", "env": "dev"}}
+
+def wrapper_stack(tmp_path, driver):
+    """
+    The drivers the way main.py stacks them.
+    """
+    cache = ResponseCache(db_path=str(tmp_path / "responses.sqlite3"))
+    return LoggingLLMDriver(CachedLLMDriver(driver, cache=cache), log=DecisionLog(str(tmp_path / "decisions")))
+
+def test_single_pass_decisions_go_through_the_stack(tmp_path):
+    driver = wrapper_stack(tmp_path, FakeLLMDriver({QUERY: DECISION}, prompt_latency=0, token_latency=0))
+    tools = get_default_registry().get_tools()
+    decision = driver.decide_tool_and_arguments(tools, QUERY, "")
+    assert decision == DECISION
+    rows = list(driver.log.rows(kind='decide_tool_and_arguments'))
+    assert [(row['model'], row['query'], row['response']) for row in rows] == [("fake:", QUERY, DECISION)]
+
+def test_submitted_decisions_are_logged(tmp_path):
+    driver = wrapper_stack(tmp_path, FakeLLMDriver({QUERY: DECISION}, prompt_latency=0, token_latency=0))
+    signatures = "ClearCachesTool(site, env)"
+    assert driver.submit('decide_tool', signatures, QUERY, "").result() == "ClearCachesTool"
+    rows = list(driver.log.rows(kind='decide_tool'))
+    assert [(row['candidates'], row['response']) for row in rows] == [(signatures, "ClearCachesTool")]
+
+class RecordingDriver(AbstractLLMDriver):
+    """
+    Supports the whole driver interface and records which methods were called.
+    """
+
+    def __init__(self, healthy=True):
+        super().__init__(name="recording")
+        self.healthy = healthy
+        self.calls = []
+
+    def generate_response(self, text, **kwargs):
+        self.calls.append('generate_response')
+        return text.upper()
+
+    def stream_response(self, text, **kwargs):
+        self.calls.append('stream_response')
+        yield from text.split()
+
+    def decide_toolset(self, toolsets, query, context):
+        self.calls.append('decide_toolset')
+        return toolsets[0]
+
+    def decide_tool(self, toolset, query, context):
+        self.calls.append('decide_tool')
+        return "ClearCachesTool"
+
+    def decide_arguments(self, tool_code, query, context):
+        self.calls.append('decide_arguments')
+        return {}
+
+    def decide_tool_and_arguments(self, tools, query, context):
+        self.calls.append('decide_tool_and_arguments')
+        return DECISION
+
+    def count_tokens(self, text):
+        return 42
+
+    def embed(self, texts):
+        return [[float(len(text))] for text in texts]
+
+    def health_check(self):
+        return self.healthy
+
+    def submit(self, method_name, *args, **kwargs):
+        self.calls.append('submit')
+        return super().submit(method_name, *args, **kwargs)
+
+    def batch(self, method_name, calls):
+        self.calls.append('batch')
+        return [getattr(self, method_name)(*args) for args in calls]
+
+@pytest.fixture
+def cached(tmp_path):
+    return CachedLLMDriver(RecordingDriver(healthy=False), cache=ResponseCache(db_path=str(tmp_path / "responses.sqlite3")))
+
+def test_cache_forwards_embed(cached):
+    assert cached.embed(["ab", "abc"]) == [[2.0], [3.0]]
+
+def test_cache_forwards_health_check(cached):
+    assert cached.health_check() is False
+
+def test_cache_forwards_stream_response(cached):
+    assert list(cached.stream_response("one two")) == ["one", "two"]
+    assert cached.driver.calls == ['stream_response']
+
+def test_cache_forwards_count_tokens(cached):
+    assert cached.count_tokens("anything") == 42
+
+def test_cache_forwards_batch(cached):
+    assert cached.batch('generate_response', [("a",), ("b",)]) == ["A", "B"]
+    assert cached.driver.calls == ['batch', 'generate_response', 'generate_response']
+
+def test_cache_answers_single_pass_decisions(cached):
+    tools = get_default_registry().get_tools()
+    assert cached.decide_tool_and_arguments(tools, QUERY, "") == DECISION
+    assert cached.decide_tool_and_arguments(tools, "Clear the  caches on dev.", "") == DECISION
+    assert cached.driver.calls == ['decide_tool_and_arguments']
+
+def test_cache_submits_misses_to_the_wrapped_driver(cached):
+    assert cached.submit('decide_tool', "signatures", QUERY, "").result() == "ClearCachesTool"
+    assert cached.driver.calls == ['submit', 'decide_tool']
+    # Now cached
+    assert cached.submit('decide_tool', "signatures", QUERY, "").result() == "ClearCachesTool"
+    assert cached.driver.calls == ['submit', 'decide_tool']
@@ -0,0 +1,109 @@
+import json
+import time
+
+import pytest
+
+from src.bench.fake_ollama_server import FakeOllamaServer
+from src.llm.ollama_llm_driver import OllamaLLMDriver, held_back
+from src.tracing import RingBufferSink, get_tracer
+
+class ScriptedDriver:
+    """
+    Answers every prompt with the same completion.
+    """
+
+    def __init__(self, completion, decision=None):
+        self.completion = completion
+        self.decision = decision or {}
+        self.prompts = []
+
+    def completion_for(self, prompt):
+        self.prompts.append(prompt)
+        return self.completion
+
+    def generate_json(self, prompt, schema_json):
+        self.prompts.append(prompt)
+        return json.dumps(self.decision)
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def simulate_latency(self, prompt, completion):
+        pass
+
+@pytest.fixture
+def serve():
+    servers, drivers = [], []
+
+    def serve(completion, chunk_size=None, decision=None, chunk_latency=0.0):
+        server = FakeOllamaServer(ScriptedDriver(completion, decision), chunk_size=chunk_size, chunk_latency=chunk_latency).start()
+        driver = OllamaLLMDriver(api_url=server.url, model="fake")
+        driver.server = server
+        servers.append(server)
+        drivers.append(driver)
+        return driver
+
+    yield serve
+    for driver in drivers:
+        driver.close()
+    for server in servers:
+        server.stop()
+
+def test_held_back():
+    assert held_back("Hello <|im", "<|im_end|>") == 4
+    assert held_back("Hello <", "<|im_end|>") == 1
+    assert held_back("Hello", "<|im_end|>") == 0
+    assert held_back("Hello", None) == 0
+
+def test_streams_in_pieces(serve):
+    driver = serve("The quick brown fox jumps over the lazy dog.", chunk_size=5)
+    pieces = list(driver.stream_response("prompt"))
+    assert len(pieces) > 1
+    assert "".join(pieces) == "The quick brown fox jumps over the lazy dog."
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, None])
+def test_stop_token_split_across_chunks(serve, chunk_size):
+    driver = serve("It is 5 < 6 here<|im_end|>and more", chunk_size=chunk_size)
+    pieces = list(driver.stream_response("prompt", stop_token="<|im_end|>"))
+    assert "".join(pieces) == "It is 5 < 6 here"
+    assert not any("<|" in piece for piece in pieces)
+
+def test_text_held_back_is_released_at_the_end(serve):
+    # Looks like the start of the stop token, but the answer ends there
+    driver = serve("Almost <|im", chunk_size=2)
+    assert driver.generate_response("prompt", stop_token="<|im_end|>") == "Almost <|im"
+
+def test_format_json(serve):
+    driver = serve('"amount": 100')
+    assert json.loads(driver.generate_response("prompt", format="json")) == {"amount": 100}
+
+def test_format_schema(serve):
+    decision = {"tool": "TimeTool", "toolset": None, "arguments": {}}
+    driver = serve("", decision=decision)
+    schema = json.dumps({"type": "object", "properties": {"tool": {"type": "string"}}})
+    assert json.loads(driver.generate_json("prompt", schema)) == decision
+
+def test_stops_reading_at_the_stop_token(serve):
+    # The rest would take 2.5 seconds to stream
+    driver = serve("Sure.<|im_end|>" + "x" * 200, chunk_size=4, chunk_latency=0.05)
+    start = time.perf_counter()
+    assert driver.generate_response("prompt", stop_token="<|im_end|>") == "Sure."
+    assert time.perf_counter() - start < 1.0
+    deadline = time.monotonic() + 2.0
+    while not driver.server.hung_up and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert driver.server.hung_up == 1
+
+def test_submitted_calls_nest_under_the_callers_span(serve):
+    driver = serve("Hello.")
+    tracer = get_tracer()
+    sink = tracer.add_sink(RingBufferSink())
+    try:
+        with tracer.span("caller") as caller:
+            assert driver.submit('generate_response', "prompt").result() == "Hello."
+            assert driver.generate_response("prompt") == "Hello."
+    finally:
+        tracer.remove_sink(sink)
+    spans = [span for span in sink.spans() if span.name == "generate_response"]
+    assert len(spans) == 2
+    assert all(span.parent_id == caller.span_id for span in spans)
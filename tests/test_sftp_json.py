@@ -0,0 +1,64 @@
+import json
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from src.tool.pantheon.scripts import sftp_json
+
+TERMINUS = """#!/bin/sh
+echo "$2" >> "{calls}"
+echo "[notice] Fetching connection info"
+echo '{{"sftp_username": "user.'$2'", "sftp_host": "appserver.'$2'.example.com", "mysql_password": "secret"}}'
+"""
+
+@pytest.fixture
+def terminus(tmp_path, monkeypatch):
+    """
+    A stub terminus on the PATH. Returns a function giving the site.env of each call so far.
+    """
+    calls = tmp_path / "calls"
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    script = bin_path / "terminus"
+    script.write_text(TERMINUS.format(calls=calls))
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(sftp_json, "CONNECTION_INFO_CACHE_PATH", str(tmp_path / "cache" / "connection_info.json"))
+    monkeypatch.chdir(tmp_path)
+    return lambda: calls.read_text().split() if calls.exists() else []
+
+def test_repeat_calls_use_the_cache(terminus):
+    first = sftp_json.get_sftp_credentials("site", "dev")
+    second = sftp_json.get_sftp_credentials("site", "dev")
+    assert first == second
+    assert first["username"] == "user.site.dev"
+    assert terminus() == ["site.dev"]
+
+    sftp_json.get_sftp_credentials("site", "dev", use_cache=False)
+    assert terminus() == ["site.dev", "site.dev"]
+
+def test_batch_only_looks_up_missing_environments(terminus):
+    sftp_json.write_sftp_json("site", "dev")
+    message = sftp_json.write_sftp_json_batch("site", ["dev", "test", "live"])
+    assert message.startswith("sftp.json has been created/updated")
+    assert sorted(terminus()) == ["site.dev", "site.live", "site.test"]
+
+    sftp_json.write_sftp_json_batch("site", ["dev", "test", "live"])
+    assert len(terminus()) == 3
+    with open(os.path.join(".vscode", "sftp.json")) as file:
+        assert [config["host"] for config in json.load(file)] == [f"appserver.site.{env}.example.com" for env in ("dev", "test", "live")]
+
+def test_cache_only_keeps_sftp_fields_and_is_private(terminus):
+    sftp_json.get_sftp_credentials("site", "dev")
+    path = sftp_json.CONNECTION_INFO_CACHE_PATH
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with open(path) as file:
+        cached = json.load(file)["site.dev"]["info"]
+    assert cached == {"sftp_username": "user.site.dev", "sftp_host": "appserver.site.dev.example.com"}
+
+    # Fields that aren't cached come from terminus
+    assert sftp_json.get_terminus_field("site", "dev", "mysql_password") == "secret"
+    assert terminus() == ["site.dev", "site.dev"]
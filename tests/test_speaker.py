@@ -0,0 +1,108 @@
+import os
+import threading
+
+import pytest
+
+from src.speech.audio_cache import AudioCache
+from src.speech.speaker import Speaker
+from src.speech.tts_engine import StubTTSEngine, PiperTTSEngine
+
+class CountingEngine(StubTTSEngine):
+    def __init__(self, delay=0.0):
+        super().__init__(delay=delay)
+        self.texts = []
+        self.lock = threading.Lock()
+
+    def synthesize(self, text, voice, path):
+        with self.lock:
+            self.texts.append(text)
+        super().synthesize(text, voice, path)
+
+class FailingEngine(StubTTSEngine):
+    def synthesize(self, text, voice, path):
+        with open(path, 'w') as file:
+            file.write("half")
+        raise RuntimeError("no voice")
+
+class SilentPlayer:
+    def __init__(self):
+        self.played = []
+
+    def play(self, path):
+        self.played.append(path)
+
+    def stop(self):
+        pass
+
+@pytest.fixture
+def make_speaker(tmp_path):
+    speakers = []
+
+    def make_speaker(engine, **kwargs):
+        speaker = Speaker(engine, cache=AudioCache(str(tmp_path / "audio")), player=SilentPlayer(), **kwargs)
+        speakers.append(speaker)
+        return speaker
+
+    yield make_speaker
+    for speaker in speakers:
+        speaker.close()
+
+def test_cache_hits(make_speaker):
+    engine = CountingEngine()
+    speaker = make_speaker(engine)
+    path = speaker.render("Hello there.")
+    assert os.path.isfile(path)
+    # Same text once normalized
+    assert speaker.render("Hello   there.") == path
+    assert engine.texts == ["Hello there."]
+
+def test_cache_survives_restarts(tmp_path):
+    engine = CountingEngine()
+    first = Speaker(engine, cache=AudioCache(str(tmp_path)), player=SilentPlayer())
+    path = first.render("Sure.")
+    first.close()
+    second = Speaker(engine, cache=AudioCache(str(tmp_path)), player=SilentPlayer())
+    assert second.render("Sure.") == path
+    second.close()
+    assert engine.texts == ["Sure."]
+
+def test_in_flight_renders_are_deduped(make_speaker):
+    engine = CountingEngine(delay=0.1)
+    speaker = make_speaker(engine)
+    futures = [speaker.render_async("One moment.") for _ in range(3)]
+    assert futures[0] is futures[1] is futures[2]
+    futures[0].result()
+    assert engine.texts == ["One moment."]
+
+def test_eviction_is_least_recently_used_first(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=250)
+    paths = {}
+    for key in ("a", "b", "c"):
+        temp_path = cache.temp_path(key, "wav")
+        with open(temp_path, 'wb') as file:
+            file.write(b"x" * 100)
+        paths[key] = cache.put(key, "wav", temp_path)
+    # "a" was evicted when "c" came in; using "b" makes "c" the next to go
+    assert cache.get("a", "wav") is None
+    assert cache.get("b", "wav") == paths["b"]
+    temp_path = cache.temp_path("d", "wav")
+    with open(temp_path, 'wb') as file:
+        file.write(b"x" * 100)
+    cache.put("d", "wav", temp_path)
+    assert cache.get("c", "wav") is None
+    assert cache.get("b", "wav") == paths["b"]
+    assert sorted(os.listdir(tmp_path)) == ["b.wav", "d.wav"]
+
+def test_failures_are_reported_and_cleaned_up(tmp_path, make_speaker):
+    errors = []
+    speaker = make_speaker(FailingEngine(), on_error=errors.append)
+    speaker.say("Something went wrong.")
+    speaker.wait()
+    assert len(errors) == 1 and "no voice" in errors[0]
+    assert speaker.player.played == []
+    assert os.listdir(tmp_path / "audio") == []
+
+def test_piper_needs_a_voice(monkeypatch):
+    monkeypatch.delenv("JONE_PIPER_VOICE", raising=False)
+    with pytest.raises(ValueError):
+        PiperTTSEngine()
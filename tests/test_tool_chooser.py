@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from src.llm.abstract_llm_driver import AbstractLLMDriver, call_cancelled
+from src.llm.cached_llm_driver import CachedLLMDriver
+from src.llm.decision_log import DecisionLog
+from src.llm.logging_llm_driver import LoggingLLMDriver
+from src.llm.response_cache import ResponseCache
+from src.tool_chooser import ToolChooser, ToolsetCounts
+
+class SpeculatingDriver(AbstractLLMDriver):
+    """
+    Picks the financial toolset after a moment. Deciding a tool from the
+    pantheon signatures takes seconds, unless its call is cancelled.
+    """
+
+    def __init__(self):
+        super().__init__(name="speculating")
+        self.stopped_early = threading.Event()
+
+    def generate_response(self, text, **kwargs):
+        return ""
+
+    def decide_toolset(self, toolsets, query, context):
+        time.sleep(0.1)
+        return "financial"
+
+    def decide_tool(self, toolset, query, context):
+        if "ClearCaches" not in toolset:
+            return "CurrencyConverterTool"
+        deadline = time.monotonic() + 5.0
+        while time.monotonic() < deadline:
+            if call_cancelled():
+                self.stopped_early.set()
+                return None
+            time.sleep(0.01)
+        return "ClearCachesTool"
+
+    def decide_arguments(self, tool_code, query, context):
+        return {}
+
+@pytest.fixture
+def driver(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.sqlite3"))
+    return LoggingLLMDriver(CachedLLMDriver(SpeculatingDriver(), cache=cache), log=DecisionLog(str(tmp_path / "decisions")))
+
+def test_losing_speculative_decisions_stop_through_the_wrappers(driver):
+    chooser = ToolChooser("convert 5 usd to eur", "", driver, is_called_by_voice=False, speculative=3)
+    start = time.perf_counter()
+    assert chooser.choose_tool_speculatively(["pantheon", "financial"]) == ("financial", "CurrencyConverterTool")
+    assert time.perf_counter() - start < 1.0
+    inner = driver.driver.driver
+    assert inner.stopped_early.wait(1.0)
+    # What the cancelled call returned is neither logged nor cached
+    time.sleep(0.05)
+    assert [row['response'] for row in driver.log.rows(kind='decide_tool')] == ["CurrencyConverterTool"]
+    assert len(driver.driver.cache.memory) == 2
+
+def test_toolset_counts_are_shared_explicitly(driver):
+    counts = ToolsetCounts()
+    first = ToolChooser("convert 5 usd to eur", "", driver, is_called_by_voice=False, toolset_counts=counts)
+    second = ToolChooser("convert 5 usd to eur", "", driver, is_called_by_voice=False, toolset_counts=counts)
+    assert first.toolset_counts is second.toolset_counts
+    assert ToolChooser("hello", "", driver, is_called_by_voice=False).toolset_counts is not counts
+
+def test_toolset_counts_from_many_threads():
+    counts = ToolsetCounts()
+    threads = [threading.Thread(target=lambda: [counts.add("financial") for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts.add("pantheon")
+    assert counts.counts["financial"] == 8000
+    assert counts.most_chosen_first(["context", "pantheon", "financial"]) == ["financial", "pantheon", "context"]
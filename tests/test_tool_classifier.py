@@ -0,0 +1,50 @@
+from src.llm.decision_log import DecisionLog
+from src.tool.tool_classifier import ToolClassifier, REJECT, negative_examples, training_examples, augment
+from src.tool.tool_registry import get_default_registry
+
+EXAMPLES = [
+    ("convert 100 usd to cad please", "financial", "CurrencyConverterTool"),
+    ("how much is 50 euros in dollars", "financial", "CurrencyConverterTool"),
+    ("convert 20 pounds to yen", "financial", "CurrencyConverterTool"),
+    ("clear the caches", "pantheon", "ClearCachesTool"),
+    ("clear the cache on the dev environment", "pantheon", "ClearCachesTool"),
+    ("flush the drupal caches on live", "pantheon", "ClearCachesTool"),
+]
+
+def test_off_topic_queries_are_rejected():
+    classifier = ToolClassifier(get_default_registry(), path=None)
+    classifier.train(EXAMPLES + negative_examples())
+    assert classifier.route("what time is it") is None
+    assert classifier.route("convert 100 usd to cad please") == ("financial", "CurrencyConverterTool")
+    assert all(label != REJECT for label, _ in classifier.top_k("what time is it", k=10))
+
+def test_margin_over_the_runner_up():
+    classifier = ToolClassifier(get_default_registry(), path=None, min_confidence=0.0, min_margin=1.0)
+    classifier.train(EXAMPLES)
+    assert classifier.route("convert 100 usd to cad please") is None
+
+def test_training_examples(tmp_path):
+    log = DecisionLog(str(tmp_path))
+    log.append('decide_tool', 'fake', "clear the caches", "on dev", "signatures", "ClearCachesTool")
+    # A speculative decision on the wrong toolset
+    log.append('decide_tool', 'fake', "clear the caches", "on dev", "other signatures", None)
+    log.append('decide_toolset', 'fake', "what time is it", "", ["pantheon", "financial"], None)
+    examples = training_examples(log, get_default_registry())
+    assert examples == [("clear the caches", "pantheon", "ClearCachesTool"), ("what time is it", *REJECT)]
+
+class ParaphrasingDriver:
+    name = "fake"
+
+    def generate_response_in_format(self, prompt):
+        return "1. please clear the caches\n2. empty the caches"
+
+def test_paraphrases_are_logged_with_their_candidates(tmp_path):
+    log = DecisionLog(str(tmp_path))
+    log.append('decide_tool', 'fake', "clear the caches", "on dev", "signatures", "ClearCachesTool")
+    examples = training_examples(log, get_default_registry())
+    augment(examples, ParaphrasingDriver(), log=log, count=2)
+    rows = [row for row in log.rows(kind='decide_tool') if row['model'] == "paraphrase:fake"]
+    assert [(row['query'], row['context'], row['candidates'], row['response']) for row in rows] == [
+        ("please clear the caches", "on dev", "signatures", "ClearCachesTool"),
+        ("empty the caches", "on dev", "signatures", "ClearCachesTool"),
+    ]
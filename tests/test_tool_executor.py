@@ -0,0 +1,56 @@
+import time
+
+from src.tool.abstract_tool import AbstractTool
+from src.tool.tool_executor import ToolExecutor
+
+class CommandTool(AbstractTool):
+    """
+    Runs a shell command, one run at a time.
+    """
+
+    def __init__(self, command):
+        super().__init__("Command", "Runs a command.", "test", command, True, False)
+
+    def define_arguments(self):
+        pass
+
+class OtherCommandTool(CommandTool):
+    pass
+
+def test_zero_timeout_kills_the_command():
+    start = time.perf_counter()
+    assert CommandTool("sleep 5").run(is_called_by_voice=False, timeout=0.0) == "Command timed out."
+    assert time.perf_counter() - start < 1.0
+
+def test_runs_queued_past_their_deadline_never_start(tmp_path):
+    executor = ToolExecutor(max_workers=1)
+    marker = tmp_path / "ran"
+    blocker = executor.submit(OtherCommandTool("sleep 0.3"))
+    late = executor.submit(CommandTool(f"touch {marker}"), timeout=0.1)
+    blocker.result()
+    assert late.future.result(1.0) == "Command timed out."
+    assert late.timed_out
+    assert not marker.exists()
+    executor.shutdown()
+
+def test_queued_runs_dont_hold_workers():
+    executor = ToolExecutor(max_workers=2)
+    serial = [executor.submit(CommandTool("sleep 0.3")) for _ in range(3)]
+    start = time.perf_counter()
+    # The queued runs of CommandTool leave the second worker to other tools
+    assert executor.submit(OtherCommandTool("echo hello")).result() == "hello\n"
+    assert time.perf_counter() - start < 0.25
+    assert [run.result() for run in serial] == ["", "", ""]
+    executor.shutdown()
+
+def test_cancelled_queued_run_never_starts(tmp_path):
+    executor = ToolExecutor(max_workers=2)
+    marker = tmp_path / "ran"
+    first = executor.submit(CommandTool("sleep 0.2"))
+    queued = executor.submit(CommandTool(f"touch {marker}"))
+    queued.cancel()
+    assert queued.result() == "Command was cancelled."
+    assert first.result() == ""
+    assert executor.submit(CommandTool("echo again")).result() == "again\n"
+    assert not marker.exists()
+    executor.shutdown()
@@ -0,0 +1,23 @@
+from src.tool.financial.currency_converter_tool import CurrencyConverterTool
+from src.tool.tool_result_cache import ToolResultCache
+from src.tool.tool_runner import ToolRunner
+
+def currency_converter(amount):
+    tool = CurrencyConverterTool()
+    tool.argument_values.update(amount=amount, from_currency="USD", to_currency="EUR")
+    return tool
+
+def test_arguments_that_cant_be_coerced_report_an_error():
+    tool = currency_converter("$100")
+    cache = ToolResultCache()
+    runner = ToolRunner(tool, result_cache=cache)
+    assert runner.output.startswith("An error occurred")
+    assert not runner.cached
+    assert cache.make_key(tool) is None
+    assert cache.entries == {}
+
+def test_templates_skip_arguments_that_cant_be_coerced():
+    tool = currency_converter("$100")
+    tool.response_template = "{amount} {from_currency} is {output}"
+    tool.response_pattern = None
+    assert tool.render_response("about 92 EUR") is None